@@ -0,0 +1,200 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import requests
+
+from Metrics import metrics
+from Scraper import DataFetcher, DatabaseManager, db_config, noise_reading_timestamp
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+# Thread-local HTTP sessions so each worker reuses its own connection pool
+_thread_local = threading.local()
+
+
+def get_session():
+    """Return the requests.Session owned by the current worker thread."""
+    if not hasattr(_thread_local, 'session'):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
+
+def fetch_noise_window(start, end):
+    """Fetch one window of noise readings and pair each with its timestamp."""
+    data = DataFetcher.request_noise_pollution(start, end, session=get_session())
+    return [(noise_reading_timestamp(record), record) for record in data or []]
+
+
+# Historical sources that can be backfilled. Each entry knows how to fetch one
+# [start, end) window and which DatabaseManager bulk method stores the result.
+# TomTom, WAQI and OpenWeather only expose current values, so they are not here.
+SOURCES = {
+    'noise': {
+        'fetch': fetch_noise_window,
+        'table': 'noisepollution',
+        'insert': DatabaseManager.insert_noise_pollution_records,
+        'window': 6 * 3600,
+        # The bulk insert skips readings this key already has; see TableCreationSQL.txt.
+        'unique_key': 'uniq_noise_datetime',
+    },
+}
+
+
+def has_unique_key(db_manager, table, key):
+    """Whether table has the unique key `key`, which INSERT IGNORE relies on."""
+    cursor = db_manager.connection.cursor()
+    cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s AND Non_unique = 0", (key,))
+    return cursor.fetchone() is not None
+
+
+def split_windows(start, end, window):
+    """Split [start, end) into consecutive windows of at most `window` seconds."""
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    return windows
+
+
+class Checkpoint:
+    """Records which windows of a backfill have been written, so runs can resume."""
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('source') == source:
+                self.done = {tuple(w) for w in state.get('done', [])}
+                logging.info(f"Resuming {source} backfill: {len(self.done)} windows already done")
+
+    def mark_done(self, window):
+        """Record a finished window and atomically rewrite the checkpoint file."""
+        self.done.add(tuple(window))
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': self.source, 'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+
+def fetch_with_retries(source, fetch, window, retries, backoff):
+    """Call fetch(start, end), retrying with exponential backoff on HTTP errors."""
+    for attempt in range(retries + 1):
+        try:
+            return fetch(*window)
+        except requests.exceptions.RequestException as e:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            metrics.inc('scraper_http_retries_total', {'source': source},
+                        help='HTTP requests retried after an error.')
+            logging.warning(f"Window {window} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def backfill(db_manager, source, start, end, window=None, workers=4, checkpoint_path=None,
+             retries=3, backoff=2.0):
+    """Backfill `source` between two Unix timestamps.
+
+    Windows are fetched concurrently by at most `workers` threads. Results are
+    written from the calling thread with the source's bulk insert, since a
+    pymysql connection must not be shared between threads. Returns the number
+    of windows that failed.
+    """
+    spec = SOURCES[source]
+    windows = split_windows(start, end, window or spec['window'])
+    checkpoint = Checkpoint(checkpoint_path, source)
+    pending = [w for w in windows if w not in checkpoint.done]
+    logging.info(f"Backfilling {source}: {len(pending)} of {len(windows)} windows to fetch "
+                 f"with {workers} workers")
+
+    failed = 0
+    rows = 0
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(fetch_with_retries, source, spec['fetch'], w, retries, backoff): w
+            for w in pending
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            w = futures[future]
+            try:
+                records = future.result()
+                spec['insert'](db_manager, records, live=False)
+                checkpoint.mark_done(w)
+                rows += len(records)
+            except Exception as e:
+                failed += 1
+                metrics.inc('backfill_windows_failed_total', {'table': spec['table']})
+                logging.error(f"Window {datetime.fromtimestamp(w[0])} - "
+                              f"{datetime.fromtimestamp(w[1])} failed: {e}")
+            if i % 50 == 0 or i == len(pending):
+                logging.info(f"{i}/{len(pending)} windows, {rows} rows, "
+                             f"{time.time() - started:.1f}s elapsed")
+    return failed
+
+
+def parse_time(value):
+    """Accept either a Unix timestamp or an ISO date such as 2024-01-31."""
+    try:
+        return int(value)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill historical readings into MySQL.')
+    parser.add_argument('--source', choices=sorted(SOURCES), default='noise')
+    parser.add_argument('--start', required=True, type=parse_time,
+                        help='Unix timestamp or ISO date to start from')
+    parser.add_argument('--end', type=parse_time, default=int(time.time()),
+                        help='Unix timestamp or ISO date to stop at (default: now)')
+    parser.add_argument('--window', type=int, default=None,
+                        help='Window size in seconds (default depends on the source)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Maximum number of concurrent API requests')
+    parser.add_argument('--checkpoint', default=None,
+                        help='Checkpoint file (default: backfill_<source>.json)')
+    args = parser.parse_args()
+
+    db_manager = DatabaseManager(db_config)
+    if not db_manager.connection:
+        raise SystemExit(1)
+
+    # Without the key, re-running a window would silently store every reading twice
+    spec = SOURCES[args.source]
+    if not has_unique_key(db_manager, spec['table'], spec['unique_key']):
+        logging.error(f"{spec['table']} has no unique key {spec['unique_key']}; run the "
+                      f"migration in TableCreationSQL.txt before backfilling.")
+        db_manager.connection.close()
+        raise SystemExit(1)
+
+    failed = backfill(
+        db_manager, args.source, args.start, args.end,
+        window=args.window,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint or f'backfill_{args.source}.json',
+    )
+
+    db_manager.connection.close()
+    logging.info("MySQL connection closed.")
+    # Kept apart from the scheduled scraper's file so neither overwrites the other
+    metrics.write(os.getenv('BACKFILL_METRICS_FILE', 'backfill_metrics.prom'))
+    if failed:
+        logging.error(f"{failed} windows failed; re-run the same command to retry them.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets, in seconds for latencies and bytes for payload sizes
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def format_labels(labels):
+    """Render a label dict as {k="v",...} in the Prometheus text format."""
+    if not labels:
+        return ''
+    pairs = ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return '{' + pairs + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as expected by Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Metrics:
+    """Collects counters, gauges and histograms for one scraper run.
+
+    The scraper is a short-lived process, so rather than serving /metrics it
+    writes everything in the Prometheus text exposition format to a file that
+    node_exporter's textfile collector (or anything else) can pick up.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.help = {}
+
+    def _key(self, name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, labels=None, value=1, help=None):
+        with self.lock:
+            key = self._key(name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+            if help:
+                self.help[name] = help
+
+    def set(self, name, value, labels=None, help=None):
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+            if help:
+                self.help[name] = help
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS, help=None):
+        with self.lock:
+            key = self._key(name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+            if help:
+                self.help[name] = help
+
+    @contextmanager
+    def timer(self, name, labels=None, help=None):
+        """Observe the wall-clock duration of the with-block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels, help=help)
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for kind, series in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in series}):
+                    if name in self.help:
+                        lines.append(f'# HELP {name} {self.help[name]}')
+                    lines.append(f'# TYPE {name} {kind}')
+                    for (n, labels), value in sorted(series.items()):
+                        if n == name:
+                            lines.append(f'{name}{format_labels(dict(labels))} {value}')
+
+            for name in sorted({name for name, _ in self.histograms}):
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for (n, labels), hist in sorted(self.histograms.items(), key=lambda kv: kv[0]):
+                    if n != name:
+                        continue
+                    labels = dict(labels)
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        bucket_labels = format_labels({**labels, 'le': bound})
+                        lines.append(f'{name}_bucket{bucket_labels} {count}')
+                    lines.append(f'{name}_bucket{format_labels({**labels, "le": "+Inf"})} '
+                                 f'{hist.total}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {hist.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {hist.total}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically write the rendered metrics to path."""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+        logging.info(f"Metrics written to {path}")
+
+
+# Shared instance used by Scraper.py and Backfill.py
+metrics = Metrics()
@@ -6,6 +6,8 @@ import os
 from dotenv import load_dotenv
 import time
 
+from Metrics import SIZE_BUCKETS, metrics
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -25,6 +27,8 @@ class Config:
     NOISE_API_URL = "https://data.smartdublin.ie/sonitus-api/api/data"
     NOISE_API_USERNAME = os.getenv('NOISE_API_USERNAME')
     NOISE_API_PASSWORD = os.getenv('NOISE_API_PASSWORD')
+    NOISE_MONITOR = os.getenv('NOISE_MONITOR', '10.1.1.7')
+    METRICS_FILE = os.getenv('METRICS_FILE', 'scraper_metrics.prom')
 
 # MySQL database connection settings
 db_config = {
@@ -50,6 +54,29 @@ coordinates_list = [
     (53.395994, -6.438525, 'The_Avenue')
 ]
 
+def timed_request(source, method, url, session=None, **kwargs):
+    """Send an HTTP request, recording latency, payload size and outcome for source."""
+    labels = {'source': source}
+    start = time.perf_counter()
+    try:
+        response = (session or requests).request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        metrics.inc('scraper_http_requests_total', {**labels, 'outcome': 'error'},
+                    help='HTTP requests made to each data source, by outcome.')
+        raise
+    finally:
+        metrics.observe('scraper_http_request_seconds', time.perf_counter() - start, labels,
+                        help='Latency of HTTP requests to each data source.')
+    metrics.inc('scraper_http_requests_total',
+                {**labels, 'outcome': 'success' if response.ok else 'error'})
+    metrics.observe('scraper_http_response_bytes', len(response.content), labels,
+                    buckets=SIZE_BUCKETS, help='Size of HTTP response payloads.')
+    return response
+
+def noise_reading_timestamp(record):
+    """Unix timestamp for a Sonitus reading, taken from its own datetime."""
+    return int(datetime.fromisoformat(str(record['datetime'])).timestamp())
+
 class DatabaseManager:
     """Class to manage database connections and operations."""
     
@@ -82,10 +109,12 @@ class DatabaseManager:
         sql_query = f"INSERT INTO tomtom (timestamp, {columns}) VALUES (%s, {placeholders})"
 
         try:
-            cursor = self.connection.cursor()
-            values = (timestamp, *traffic_data.values())
-            cursor.execute(sql_query, values)
-            self.connection.commit()
+            with metrics.timer('scraper_db_write_seconds', {'table': 'tomtom'}):
+                cursor = self.connection.cursor()
+                values = (timestamp, *traffic_data.values())
+                cursor.execute(sql_query, values)
+                self.connection.commit()
+            self.record_write('tomtom', 1, timestamp)
             logging.info(f"Traffic data inserted successfully at {datetime.fromtimestamp(timestamp)}")
         except pymysql.MySQLError as err:
             logging.error(f"Error inserting traffic data: {err}")
@@ -96,6 +125,7 @@ class DatabaseManager:
         if data:
             city = data.get('city', {}).get('name', 'Unknown Location')
             pm25 = data.get('iaqi', {}).get('pm25', {}).get('v', None)
+            reading_timestamp = data.get('time', {}).get('v', None)
 
             if pm25 is None:
                 logging.warning("PM2.5 data not available.")
@@ -123,18 +153,35 @@ class DatabaseManager:
             """
 
             try:
-                cursor = self.connection.cursor()
-                cursor.execute(sql_query, values)
-                self.connection.commit()
+                with metrics.timer('scraper_db_write_seconds', {'table': 'environment'}):
+                    cursor = self.connection.cursor()
+                    cursor.execute(sql_query, values)
+                    self.connection.commit()
+                self.record_write('environment', 1, reading_timestamp or timestamp)
                 logging.info(f"Data for {city} inserted successfully.")
             except pymysql.MySQLError as err:
                 logging.error(f"Error inserting air quality data: {err}")
                 self.connection.rollback()
 
     def insert_noise_pollution_data(self, timestamp, data):
-        """Insert noise pollution data into the MySQL database."""
-        for record in data:
-            values = (
+        """Insert the most recent noise pollution reading into the MySQL database."""
+        try:
+            self.insert_noise_pollution_records([(timestamp, record) for record in data[-1:]])
+        except pymysql.MySQLError:
+            pass  # Already logged; the next scheduled run will try again.
+
+    def insert_noise_pollution_records(self, records, live=True):
+        """Bulk insert noise pollution records in a single round trip.
+
+        records is a list of (timestamp, record) pairs. Rows whose datetime is
+        already stored are skipped, so re-running a window is harmless. Backfills
+        pass live=False, so that historic readings don't count towards freshness.
+        """
+        if not records:
+            return 0
+
+        values = [
+            (
                 timestamp,  # Insert Unix timestamp directly
                 record['datetime'],  # Keep this as it is from the API
                 record['laeq'],
@@ -146,19 +193,81 @@ class DatabaseManager:
                 record['lc10'],
                 record['lc90']
             )
+            for timestamp, record in records
+        ]
 
         sql_query = """
-        INSERT INTO noisepollution (timestamp, datetime, laeq, lafmax, la10, la90, lceq, lcfmax, lc10, lc90)
+        INSERT IGNORE INTO noisepollution (timestamp, datetime, laeq, lafmax, la10, la90, lceq, lcfmax, lc10, lc90)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
 
+        try:
+            with metrics.timer('scraper_db_write_seconds', {'table': 'noisepollution'}):
+                cursor = self.connection.cursor()
+                inserted = cursor.executemany(sql_query, values)
+                self.connection.commit()
+            self.record_write('noisepollution', inserted,
+                              max(noise_reading_timestamp(r) for _, r in records), live)
+            logging.info(f"Inserted {inserted} of {len(values)} noise pollution records "
+                         f"({records[0][1]['datetime']} to {records[-1][1]['datetime']}).")
+            return inserted
+        except pymysql.MySQLError as err:
+            logging.error(f"Error inserting noise pollution data: {err}")
+            self.connection.rollback()
+            raise
+
+    def record_write(self, table, rows, reading_timestamp, live=True):
+        """Count rows written to table and update its freshness.
+
+        Freshness lag is the time between the newest reading and its insertion. It is
+        exported as a metric and kept in the ingestion_freshness table for the Flask API.
+        Writes that aren't live, i.e. backfills of old readings, only add to the row count:
+        their lag says nothing about how fresh the pipeline is.
+        """
+        insert_timestamp = int(time.time())
+        lag = insert_timestamp - int(reading_timestamp)
+        labels = {'table': table}
+        metrics.inc('scraper_rows_written_total', labels, rows,
+                    help='Rows written to each table.')
+        if not live:
+            self.record_rows(table, rows, insert_timestamp)
+            return
+        metrics.set('scraper_freshness_lag_seconds', lag, labels,
+                    help='Seconds between the newest reading and its insertion.')
+        metrics.set('scraper_last_insert_timestamp_seconds', insert_timestamp, labels,
+                    help='Unix time of the last successful insert.')
+
+        sql_query = """
+        INSERT INTO ingestion_freshness (source, last_reading_ts, last_insert_ts, lag_seconds, rows_written)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            last_reading_ts = GREATEST(COALESCE(last_reading_ts, 0), VALUES(last_reading_ts)),
+            last_insert_ts = VALUES(last_insert_ts),
+            lag_seconds = VALUES(lag_seconds),
+            rows_written = rows_written + VALUES(rows_written)
+        """
         try:
             cursor = self.connection.cursor()
-            cursor.execute(sql_query, values)
+            cursor.execute(sql_query, (table, int(reading_timestamp), insert_timestamp, lag, rows))
             self.connection.commit()
-            logging.info(f"Noise pollution data for {record['datetime']} inserted successfully with Unix timestamp {timestamp}.")
         except pymysql.MySQLError as err:
-            logging.error(f"Error inserting noise pollution data: {err}")
+            # Freshness tracking must never stop the data itself from being stored
+            logging.warning(f"Error updating ingestion freshness for {table}: {err}")
+            self.connection.rollback()
+
+    def record_rows(self, table, rows, insert_timestamp):
+        """Add rows to the ingestion_freshness row count of table, leaving its freshness be."""
+        sql_query = """
+        INSERT INTO ingestion_freshness (source, last_insert_ts, rows_written)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE rows_written = rows_written + VALUES(rows_written)
+        """
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute(sql_query, (table, insert_timestamp, rows))
+            self.connection.commit()
+        except pymysql.MySQLError as err:
+            logging.warning(f"Error updating ingestion row count for {table}: {err}")
             self.connection.rollback()
 
 class DataFetcher:
@@ -172,7 +281,7 @@ class DataFetcher:
     def fetch_air_quality(self):
         """Fetch air quality data from the API."""
         try:
-            response = requests.get(Config.AQI_URL)
+            response = timed_request('air_quality', 'GET', Config.AQI_URL)
             response.raise_for_status()
             data = response.json()
             if data['status'] == 'ok':
@@ -185,7 +294,7 @@ class DataFetcher:
     def fetch_current_weather(self):
         """Fetch current hour's weather data."""
         try:
-            response = requests.get(Config.FORECAST_URL)
+            response = timed_request('weather', 'GET', Config.FORECAST_URL)
             response.raise_for_status()
             forecast_data = response.json()
             if 'hourly' in forecast_data:
@@ -198,20 +307,28 @@ class DataFetcher:
 
     def fetch_noise_pollution(self):
         """Fetch noise pollution data from the API."""
+        end = int(datetime.now().timestamp())
+        try:
+            self.noise_pollution_data = self.request_noise_pollution(end - 1500, end)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error fetching noise pollution data: {e}")
+
+    @staticmethod
+    def request_noise_pollution(start, end, session=None):
+        """Request noise pollution readings between two Unix timestamps.
+
+        Raises requests.exceptions.RequestException on failure so callers can retry.
+        """
         payload = {
             "username": Config.NOISE_API_USERNAME,
             "password": Config.NOISE_API_PASSWORD,
-            "monitor": "10.1.1.7",  # Example monitor
-            "start": int(datetime.now().timestamp()) - 1500,
-            "end": int(datetime.now().timestamp())
+            "monitor": Config.NOISE_MONITOR,
+            "start": int(start),
+            "end": int(end)
         }
-
-        try:
-            response = requests.post(Config.NOISE_API_URL, json=payload)
-            response.raise_for_status()
-            self.noise_pollution_data = response.json()
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching noise pollution data: {e}")
+        response = timed_request('noise', 'POST', Config.NOISE_API_URL, session=session, json=payload)
+        response.raise_for_status()
+        return response.json()
 
     @staticmethod
     def parse_weather_entry(entry):
@@ -234,7 +351,12 @@ class DataFetcher:
                 'unit': 'KMPH',
                 'key': Config.TOMTOM_API_KEY
             }
-            response = requests.get(Config.TOMTOM_URL, params=params)
+            try:
+                response = timed_request('tomtom', 'GET', Config.TOMTOM_URL, params=params)
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Error fetching data for point ({lat}, {lon}): {e}")
+                traffic_data[road_name] = None
+                continue
             if response.status_code == 200:
                 data = response.json()
                 flow_data = data.get('flowSegmentData', {})
@@ -275,5 +397,9 @@ def main():
         db_manager.connection.close()
         logging.info("MySQL connection closed.")
 
+    # Export this run's latency, volume and freshness metrics
+    if Config.METRICS_FILE:
+        metrics.write(Config.METRICS_FILE)
+
 if __name__ == "__main__":
     main()
@@ -863,6 +863,271 @@ def compare_traffic_pm25():
         logging.error(f"Error comparing traffic & pm2.5: {e}")
         return jsonify({"error": str(e)}), 500
 
+def get_ingestion_freshness():
+    """
+    Returns one row per ingested table with the newest reading, the last insert
+    and how stale each source is right now, as maintained by the scraper.
+    """
+    try:
+        query = """
+            SELECT source, last_reading_ts, last_insert_ts, lag_seconds, rows_written
+            FROM ingestion_freshness
+            ORDER BY source ASC;
+        """
+
+        with db.engine.connect() as connection:
+            rows = connection.execute(text(query)).fetchall()
+
+        now = int(time.time())
+        data = []
+        for row in rows:
+            data.append({
+                "source": row.source,
+                "last_reading_ts": row.last_reading_ts,
+                "last_insert_ts": row.last_insert_ts,
+                "lag_seconds": row.lag_seconds,
+                "rows_written": row.rows_written,
+                "staleness_seconds": now - row.last_reading_ts if row.last_reading_ts else None,
+            })
+
+        return jsonify(data), 200
+
+    except Exception as e:
+        logging.error(f"Error fetching ingestion freshness: {e}")
+        return jsonify({"error": "Failed to fetch ingestion freshness"}), 500
+
+# The tomtom columns, in the order the scraper asks about them
+MONITORED_ROADS = (
+    "ongar_distributor_road",
+    "littleplace_castleheaney_distributor_road_south",
+    "main_street",
+    "the_mall",
+    "station_road",
+    "ongar_distributor_road_east",
+    "ongar_barnhill_distributor_road",
+    "littleplace_castleheaney_distributor_road_north",
+    "the_avenue",
+)
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+def _get_simulation_run(conn, run_id):
+    """
+    The sim_runs row of run_id, or of the latest run if run_id is None,
+    with the span of timestamps its series covers.
+    """
+    query = """
+        SELECT r.id, r.scenario, r.started_at, r.ended_at, r.start_ts, r.window_secs,
+               r.interval_secs, r.sim_secs, r.intervals, r.dropped,
+               MIN(s.timestamp) AS first_ts, MAX(s.timestamp) AS last_ts
+        FROM sim_runs r
+        LEFT JOIN sim_edge_series s ON s.run_id = r.id
+        WHERE r.id = COALESCE(:run_id, (SELECT MAX(id) FROM sim_runs))
+        GROUP BY r.id;
+    """
+    return conn.execute(text(query), {"run_id": run_id}).fetchone()
+
+def _simulation_run_to_dict(run):
+    return {
+        "id": run.id,
+        "scenario": run.scenario,
+        "started_at": run.started_at,
+        "ended_at": run.ended_at,
+        "start_ts": run.start_ts,
+        "first_ts": run.first_ts,
+        "last_ts": run.last_ts,
+        "window_secs": run.window_secs,
+        "interval_secs": run.interval_secs,
+        "sim_secs": run.sim_secs,
+        "intervals": run.intervals,
+        "dropped": run.dropped,
+    }
+
+def _observed_roads_hourly(conn, start_ts, end_ts, roads):
+    """
+    {hour_ts: {road: km/h}} from the tomtom table, bucketed as in traffic_roads_hourly.
+    Zeros are left out: the scraper stores them when TomTom has no reading.
+    """
+    averages = ",\n".join(f"AVG(NULLIF({road}, 0)) AS {road}" for road in roads)
+    query = f"""
+        SELECT
+          FLOOR(timestamp / 3600) * 3600 AS hour_ts,
+          {averages}
+        FROM tomtom
+        WHERE timestamp BETWEEN :start_ts AND :end_ts
+        GROUP BY hour_ts
+        ORDER BY hour_ts ASC;
+    """
+    rows = conn.execute(text(query), {"start_ts": start_ts, "end_ts": end_ts}).fetchall()
+    return {row.hour_ts: {road: getattr(row, road) for road in roads} for row in rows}
+
+def _simulated_roads_hourly(conn, run_id, road=None):
+    """
+    {hour_ts: {road: row}} of a run's edge series on the edges under each tomtom
+    point (or just road's), bucketed as in traffic_roads_hourly. Speed is the mean
+    over the vehicles on those edges; vehicles and emissions are totals over the
+    edges, averaged over the hour's intervals. Noise is averaged by energy.
+    """
+    intervals_query = """
+        SELECT FLOOR(timestamp / 3600) * 3600 AS hour_ts, COUNT(DISTINCT sim_time) AS intervals
+        FROM sim_edge_series
+        WHERE run_id = :run_id
+        GROUP BY hour_ts;
+    """
+    intervals = {
+        row.hour_ts: row.intervals
+        for row in conn.execute(text(intervals_query), {"run_id": run_id}).fetchall()
+    }
+
+    query = """
+        SELECT
+          FLOOR(s.timestamp / 3600) * 3600 AS hour_ts,
+          r.road,
+          SUM(s.speed * s.vehicles) / NULLIF(SUM(s.vehicles), 0) * 3.6 AS speed_kmh,
+          SUM(s.vehicles) AS vehicles,
+          SUM(s.co2) AS co2,
+          SUM(s.pmx) AS pmx,
+          10 * LOG10(AVG(POW(10, s.noise / 10))) AS noise
+        FROM sim_edge_series s
+        JOIN sim_run_roads r ON r.run_id = s.run_id AND r.edge_id = s.edge_id
+        WHERE s.run_id = :run_id AND (:road IS NULL OR r.road = :road)
+        GROUP BY hour_ts, r.road
+        ORDER BY hour_ts ASC;
+    """
+    rows = conn.execute(text(query), {"run_id": run_id, "road": road}).fetchall()
+
+    hours = {}
+    for row in rows:
+        count = intervals.get(row.hour_ts) or 1
+        hours.setdefault(row.hour_ts, {})[row.road] = {
+            "speed_kmh": row.speed_kmh,
+            "vehicles": row.vehicles / count,
+            "co2": row.co2 / count,
+            "pmx": row.pmx / count,
+            "noise": row.noise,
+        }
+    return hours
+
+def get_simulation_runs():
+    """
+    Returns the 50 most recent simulated runs, newest first, as recorded by
+    sumo-web3d --record-db.
+    """
+    try:
+        query = """
+            SELECT r.id, r.scenario, r.started_at, r.ended_at, r.start_ts, r.window_secs,
+                   r.interval_secs, r.sim_secs, r.intervals, r.dropped,
+                   COUNT(DISTINCT m.road) AS roads
+            FROM sim_runs r
+            LEFT JOIN sim_run_roads m ON m.run_id = r.id
+            GROUP BY r.id
+            ORDER BY r.id DESC
+            LIMIT 50;
+        """
+
+        with db.engine.connect() as conn:
+            rows = conn.execute(text(query)).fetchall()
+
+        data = []
+        for row in rows:
+            data.append({
+                "id": row.id,
+                "scenario": row.scenario,
+                "started_at": row.started_at,
+                "ended_at": row.ended_at,
+                "start_ts": row.start_ts,
+                "window_secs": row.window_secs,
+                "interval_secs": row.interval_secs,
+                "sim_secs": row.sim_secs,
+                "intervals": row.intervals,
+                "dropped": row.dropped,
+                "roads": row.roads,
+            })
+
+        return jsonify(data), 200
+
+    except Exception as e:
+        logging.error(f"Error fetching simulation runs: {e}")
+        return jsonify({"error": "Failed to fetch simulation runs"}), 500
+
+def compare_simulated_roads_hourly(run_id=None):
+    """
+    Returns the observed and simulated speed (km/h) of each monitored road, one row
+    per hour of a simulated run (the latest if run_id is None), plus the simulated
+    number of vehicles. Roads the run has no edges for are simulated as null.
+    """
+    try:
+        with db.engine.connect() as conn:
+            run = _get_simulation_run(conn, run_id)
+            if run is None:
+                return jsonify({"error": "No such simulation run"}), 404
+            if run.first_ts is None:
+                return jsonify({"run": _simulation_run_to_dict(run), "hours": []}), 200
+
+            start_ts = (run.first_ts // 3600) * 3600
+            observed = _observed_roads_hourly(conn, start_ts, run.last_ts, MONITORED_ROADS)
+            simulated = _simulated_roads_hourly(conn, run.id)
+
+        data = []
+        for hour in sorted(set(observed) | set(simulated)):
+            roads = {}
+            for road in MONITORED_ROADS:
+                sim = simulated.get(hour, {}).get(road, {})
+                roads[road] = {
+                    "observed_kmh": _round(observed.get(hour, {}).get(road)),
+                    "simulated_kmh": _round(sim.get("speed_kmh")),
+                    "simulated_vehicles": _round(sim.get("vehicles")),
+                }
+            data.append({"hour_ts": hour, "roads": roads})
+
+        return jsonify({"run": _simulation_run_to_dict(run), "hours": data}), 200
+
+    except Exception as e:
+        logging.error(f"Error comparing simulated roads hourly: {e}")
+        return jsonify({"error": "Failed"}), 500
+
+def compare_simulated_one_road_hourly(road_name, run_id=None):
+    """
+    Returns one row per hour of a simulated run (the latest if run_id is None) with
+    the observed and simulated speed (km/h) of road_name, and its simulated vehicles,
+    CO2 and PMx (mg/s) and noise (dB(A)).
+    """
+    try:
+        # Only known columns go into the tomtom query
+        if road_name not in MONITORED_ROADS:
+            return jsonify({"error": f"Invalid road name: {road_name}"}), 400
+
+        with db.engine.connect() as conn:
+            run = _get_simulation_run(conn, run_id)
+            if run is None:
+                return jsonify({"error": "No such simulation run"}), 404
+            if run.first_ts is None:
+                return jsonify({"run": _simulation_run_to_dict(run), "hours": []}), 200
+
+            start_ts = (run.first_ts // 3600) * 3600
+            observed = _observed_roads_hourly(conn, start_ts, run.last_ts, (road_name,))
+            simulated = _simulated_roads_hourly(conn, run.id, road_name)
+
+        data = []
+        for hour in sorted(set(observed) | set(simulated)):
+            sim = simulated.get(hour, {}).get(road_name, {})
+            data.append({
+                "hour_ts": hour,
+                "observed_kmh": _round(observed.get(hour, {}).get(road_name)),
+                "simulated_kmh": _round(sim.get("speed_kmh")),
+                "simulated_vehicles": _round(sim.get("vehicles")),
+                "simulated_co2": _round(sim.get("co2")),
+                "simulated_pmx": _round(sim.get("pmx"), 3),
+                "simulated_noise": _round(sim.get("noise"), 1),
+            })
+
+        return jsonify({"run": _simulation_run_to_dict(run), "road": road_name, "hours": data}), 200
+
+    except Exception as e:
+        logging.error(f"Error comparing simulated road hourly: {e}")
+        return jsonify({"error": "Failed to fetch one road comparison"}), 500
+
 @socketio.on("add_bike")
 def handle_add_bike(message):
     try:
@@ -49,4 +49,60 @@ class NoisePollution(db.Model):
     lc90 = db.Column(db.Float, nullable=False)  
 
     def __repr__(self):
-        return f"<NoisePollution {self.timestamp}>"
\ No newline at end of file
+        return f"<NoisePollution {self.timestamp}>"
+
+class IngestionFreshness(db.Model):
+    __tablename__ = 'ingestion_freshness'
+
+    source = db.Column(db.String(64), primary_key=True)
+    last_reading_ts = db.Column(db.Integer)
+    last_insert_ts = db.Column(db.Integer, nullable=False)
+    lag_seconds = db.Column(db.Integer)
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<IngestionFreshness {self.source}, {self.last_insert_ts}>"
+
+class SimRun(db.Model):
+    __tablename__ = 'sim_runs'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    scenario = db.Column(db.String(255), nullable=False)
+    started_at = db.Column(db.Integer, nullable=False)
+    ended_at = db.Column(db.Integer)
+    start_ts = db.Column(db.Integer, nullable=False)
+    window_secs = db.Column(db.Float, nullable=False)
+    interval_secs = db.Column(db.Float, nullable=False)
+    sumo_args = db.Column(db.String(1024))
+    sim_secs = db.Column(db.Float)
+    intervals = db.Column(db.Integer, nullable=False, default=0)
+    dropped = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<SimRun {self.id}, {self.scenario}, {self.started_at}>"
+
+class SimEdgeSeries(db.Model):
+    __tablename__ = 'sim_edge_series'
+
+    run_id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.Integer, nullable=False)
+    sim_time = db.Column(db.Float, primary_key=True)
+    edge_id = db.Column(db.String(255), primary_key=True)
+    speed = db.Column(db.Float)
+    vehicles = db.Column(db.Float)
+    co2 = db.Column(db.Float)
+    pmx = db.Column(db.Float)
+    noise = db.Column(db.Float)
+
+    def __repr__(self):
+        return f"<SimEdgeSeries {self.run_id}, {self.edge_id}, {self.sim_time}>"
+
+class SimRunRoad(db.Model):
+    __tablename__ = 'sim_run_roads'
+
+    run_id = db.Column(db.Integer, primary_key=True)
+    road = db.Column(db.String(64), primary_key=True)
+    edge_id = db.Column(db.String(255), primary_key=True)
+
+    def __repr__(self):
+        return f"<SimRunRoad {self.run_id}, {self.road}, {self.edge_id}>"
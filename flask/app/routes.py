@@ -15,6 +15,10 @@ from app.handlers import traffic_roads_hourly
 from app.handlers import traffic_one_road_hourly
 from app.handlers import compare_traffic_noise
 from app.handlers import compare_traffic_pm25
+from app.handlers import get_ingestion_freshness
+from app.handlers import get_simulation_runs
+from app.handlers import compare_simulated_roads_hourly
+from app.handlers import compare_simulated_one_road_hourly
 from datetime import datetime
 
 # Create a Blueprint for the API routes
@@ -100,6 +104,26 @@ def compare_t_n():
 def compare_t_pm():
     return compare_traffic_pm25()
 
+# Per-source ingestion freshness, written by the scraper
+@routes.route("/api/ingestion/freshness", methods=["GET"])
+def ingestion_freshness():
+    return get_ingestion_freshness()
+
+# Simulated runs recorded by sumo-web3d --record-db, against the observed traffic
+@routes.route("/api/simulation/runs", methods=["GET"])
+def simulation_runs():
+    return get_simulation_runs()
+
+@routes.route("/api/simulation/runs/latest/roads/hourly", methods=["GET"])
+@routes.route("/api/simulation/runs/<int:run_id>/roads/hourly", methods=["GET"])
+def simulated_roads(run_id=None):
+    return compare_simulated_roads_hourly(run_id)
+
+@routes.route("/api/simulation/runs/latest/one_road/<road_name>", methods=["GET"])
+@routes.route("/api/simulation/runs/<int:run_id>/one_road/<road_name>", methods=["GET"])
+def simulated_single_road(road_name, run_id=None):
+    return compare_simulated_one_road_hourly(road_name, run_id)
+
 # Route to get the latest noise pollution data
 @routes.route('/api/noise/latest', methods=['GET'])
 def get_latest_noise():
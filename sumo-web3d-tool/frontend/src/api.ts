@@ -36,9 +36,16 @@ export interface SnapshotMessage extends Snapshot {
 
 export interface SimulationStateMessage extends SimulationState {
   type: 'state';
+  /** Only the owner of a shared simulation may pause, resume, cancel or change its delay. */
+  role?: SimulationRole;
 }
 
-export type WebsocketMessage = SnapshotMessage | SimulationStateMessage;
+export interface ErrorMessage {
+  type: 'error';
+  message: string;
+}
+
+export type WebsocketMessage = SnapshotMessage | SimulationStateMessage | ErrorMessage;
 
 export interface Delta<T> {
   creations: {[id: string]: T};
@@ -56,17 +63,77 @@ export interface Snapshot {
   simulate_secs: number;
   /** time to construct the snapshot of the update */
   snapshot_secs: number;
+  /** set when the snapshot holds the full state, e.g. for a viewer joining mid-run */
+  keyframe?: boolean;
+  /** sent every few simulated seconds, unless the server runs with --edge-kpi-window 0 */
+  edgeKpis?: EdgeKpis;
+  /**
+   * with --lod-vehicles: whether this client gets densities rather than vehicles, because its
+   * viewport holds too many of them
+   */
+  lod?: boolean;
+  density?: Density;
+}
+
+/**
+ * Traffic in the cells of a square grid which have any, for clients in LOD. Cell (column, row)
+ * spans cellSize meters from SUMO (column * cellSize, row * cellSize). The lists line up.
+ */
+export interface Density {
+  cellSize: number;
+  columns: number[];
+  rows: number[];
+  /** vehicles in the cell */
+  vehicles: number[];
+  /** m/s, averaged over the vehicles in the cell */
+  speed: number[];
+  /** 0-1, the share of the cell's road covered by vehicles */
+  occupancy: number[];
+}
+
+/**
+ * Per-edge means over the last windowSecs simulated seconds, for the edges which had
+ * traffic. Each list lines up with ids.
+ */
+export interface EdgeKpis {
+  windowSecs: number;
+  /** how many steps the means are over */
+  samples: number;
+  ids: string[];
+  /** mg/s */
+  co2: number[];
+  /** mg/s */
+  pmx: number[];
+  /** dB(A) */
+  noise: number[];
+  /** m/s, averaged over the vehicles on the edge */
+  speed: number[];
+  /** mean number of vehicles on the edge */
+  vehicles: number[];
 }
 
 /** Response type for /state endpoint */
 export interface SimulationState {
   scenario: string;
+  /** The server runs one simulation per session; viewers of a session share it. */
+  session?: string;
   simulationStatus: SimulationStatus;
   delayMs: number;
+  /** Set when the server is playing back a recording rather than running SUMO. */
+  replay?: ReplayInfo;
+}
+
+/** The time range of a recording and how fast this client is playing it. */
+export interface ReplayInfo {
+  startTime: number;
+  endTime: number;
+  speed: number;
 }
 
 export type SimulationStatus = 'off' | 'running' | 'paused';
 
+export type SimulationRole = 'owner' | 'viewer';
+
 /** Response type for /scenario endpoint */
 export interface ScenarioName {
   displayName: string;
@@ -0,0 +1,182 @@
+// Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+/**
+ * Decoder for the binary snapshot frames which the server sends to websockets opened with
+ * ?format=binary. See sumo_web3d/server/codec.py for the format.
+ */
+
+import {Delta, SnapshotMessage, VehicleInfo} from './api';
+
+const VERSION = 1;
+const FLAG_KEYFRAME = 1;
+
+type Column = 'i' | 'h' | 'H' | 'I';
+
+/** Mirrors FIELDS in codec.py: field name, column type and fixed-point scale (0 for strings). */
+const FIELDS: Array<[string, Column, number]> = [
+  ['x', 'i', 100],
+  ['y', 'i', 100],
+  ['z', 'i', 100],
+  ['speed', 'h', 1],
+  ['angle', 'h', 1],
+  ['length', 'i', 1000],
+  ['width', 'i', 1000],
+  ['signals', 'H', 1],
+  ['type', 'I', 0],
+  ['vClass', 'I', 0],
+  ['person', 'I', 0],
+];
+
+/** Column values which stand for NaN (or null, for strings). */
+const MISSING: {[column: string]: number} = {
+  i: -0x80000000,
+  h: -0x8000,
+  H: 0xffff,
+  I: 0xffffffff,
+};
+
+const utf8 = new (window as any).TextDecoder('utf-8');
+
+type FieldValue = number | string | null;
+
+/** Reads a frame front to back. Columns are typed array views, so this assumes a little-endian
+ * host, as all browsers are in practice. */
+class Reader {
+  private view: DataView;
+  private offset = 0;
+
+  constructor(private buffer: ArrayBuffer) {
+    this.view = new DataView(buffer);
+  }
+
+  u8(): number {
+    return this.view.getUint8(this.offset++);
+  }
+
+  u16(): number {
+    const value = this.view.getUint16(this.offset, true);
+    this.offset += 2;
+    return value;
+  }
+
+  u32(): number {
+    const value = this.view.getUint32(this.offset, true);
+    this.offset += 4;
+    return value;
+  }
+
+  string(length: number): string {
+    const value = utf8.decode(new Uint8Array(this.buffer, this.offset, length));
+    this.offset += length;
+    return value;
+  }
+
+  align() {
+    this.offset += (4 - this.offset % 4) % 4;
+  }
+
+  column(column: Column, count: number): ArrayLike<number> {
+    let values: ArrayLike<number>;
+    if (column === 'i') {
+      values = new Int32Array(this.buffer, this.offset, count);
+    } else if (column === 'h') {
+      values = new Int16Array(this.buffer, this.offset, count);
+    } else if (column === 'H') {
+      values = new Uint16Array(this.buffer, this.offset, count);
+    } else {
+      values = new Uint32Array(this.buffer, this.offset, count);
+    }
+    this.offset += count * (column === 'i' || column === 'I' ? 4 : 2);
+    this.align();
+    return values;
+  }
+}
+
+function decodeValue(value: number, column: Column, scale: number, strings: string[]): FieldValue {
+  if (value === MISSING[column]) {
+    return scale ? NaN : null;
+  }
+  if (!scale) {
+    return strings[value];
+  }
+  return scale === 1 ? value : value / scale;
+}
+
+function readRecords(reader: Reader, strings: string[]) {
+  const count = reader.u32();
+  const handles = reader.column('I', count);
+  const masks = reader.column('H', count);
+  const records: Array<{[field: string]: FieldValue}> = [];
+  for (let i = 0; i < count; i++) {
+    records.push({});
+  }
+  FIELDS.forEach(([name, column, scale], bit) => {
+    const rows: number[] = [];
+    for (let i = 0; i < count; i++) {
+      if (masks[i] & (1 << bit)) {
+        rows.push(i);
+      }
+    }
+    const values = reader.column(column, rows.length);
+    rows.forEach((row, j) => {
+      records[row][name] = decodeValue(values[j], column, scale, strings);
+    });
+  });
+  return {handles, records: records as any[]};
+}
+
+/** Turns binary frames back into the snapshot messages that JSON clients receive. */
+export class SnapshotDecoder {
+  /** Vehicle IDs by handle. Handles are valid from a vehicle's creation until its removal. */
+  private vehicleIds = new Map<number, string>();
+
+  /** Forget all vehicles, e.g. when the simulation restarts. */
+  reset() {
+    this.vehicleIds.clear();
+  }
+
+  decode(buffer: ArrayBuffer): SnapshotMessage {
+    const reader = new Reader(buffer);
+    const version = reader.u8();
+    const flags = reader.u8();
+    reader.u16();
+    if (version !== VERSION) {
+      throw new Error(`Unsupported snapshot version ${version}`);
+    }
+    const meta = JSON.parse(reader.string(reader.u32()));
+    reader.align();
+    const strings: string[] = [];
+    const numStrings = reader.u32();
+    for (let i = 0; i < numStrings; i++) {
+      strings.push(reader.string(reader.u16()));
+    }
+    reader.align();
+
+    if (flags & FLAG_KEYFRAME) {
+      this.reset();
+    }
+    const vehicles: Delta<VehicleInfo> = {creations: {}, updates: {}, removals: []};
+    const created = readRecords(reader, strings);
+    const idIndexes = reader.column('I', created.handles.length);
+    for (let i = 0; i < created.handles.length; i++) {
+      const vehicleId = strings[idIndexes[i]];
+      this.vehicleIds.set(created.handles[i], vehicleId);
+      vehicles.creations[vehicleId] = created.records[i];
+    }
+    const updated = readRecords(reader, strings);
+    for (let i = 0; i < updated.handles.length; i++) {
+      const vehicleId = this.vehicleIds.get(updated.handles[i]);
+      if (vehicleId !== undefined) {
+        vehicles.updates[vehicleId] = updated.records[i];
+      }
+    }
+    const removed = reader.column('I', reader.u32());
+    for (let i = 0; i < removed.length; i++) {
+      const vehicleId = this.vehicleIds.get(removed[i]);
+      if (vehicleId !== undefined) {
+        vehicles.removals.push(vehicleId);
+        this.vehicleIds.delete(removed[i]);
+      }
+    }
+    return {...meta, vehicles};
+  }
+}
@@ -15,6 +15,8 @@ export interface RootProps extends State {
   unfollowObjectPOV: () => any;
   toggleRouteObjectHighlighted: (object: string) => any;
   onChangeDelayMs: (delayMs: number) => any;
+  onSeek: (time: number) => any;
+  onChangeSpeed: (speed: number) => any;
   onFocusOnVehicleOfClass: (vehicleClass: string) => any;
   onFocusOnTrafficLight: () => any;
   handleSearch: (input: string) => any;
@@ -5,6 +5,9 @@ import KeyboardHelp from './keyboard-help';
 
 export const MAX_DELAY_MS = 1000;
 
+/** Playback speeds offered for replays. */
+const REPLAY_SPEEDS = [0.5, 1, 2, 4, 8];
+
 /** A simple interface for the vehicle counts we care about. */
 interface VehicleCounts {
   passenger: number;
@@ -18,10 +21,12 @@ interface VehicleCounts {
 /** We store:  
  *  1) `sliderLocation` for the speed slider,  
  *  2) `prevCounts` for comparing old vs. new,  
- *  3) `arrowDirections` indicating up/down for each vehicle class.
+ *  3) `arrowDirections` indicating up/down for each vehicle class,
+ *  4) `seekTime`, where the replay time slider is while it's being dragged.
  */
 interface SidebarState {
   sliderLocation: number;
+  seekTime: number | null;
   prevCounts: VehicleCounts;
   arrowDirections: {
     passenger: string; // 'up' | 'down' | null
@@ -148,6 +153,7 @@ class Sidebar extends React.Component<RootProps, SidebarState> {
 
     this.state = {
       sliderLocation: initialSlider,
+      seekTime: null,
 
       // Remember the "previous" counts so we can see if they go up or down next time.
       prevCounts: {
@@ -235,8 +241,21 @@ class Sidebar extends React.Component<RootProps, SidebarState> {
     this.setState({ sliderLocation: newVal });
   };
 
+  /** Called whenever the replay time slider moves. */
+  handleSeekChange = (e: React.ChangeEvent<HTMLInputElement>) => {
+    this.setState({ seekTime: parseFloat(e.target.value) });
+  };
+
+  /** Called when the user lets go of the replay time slider. */
+  handleSeekStop = () => {
+    if (this.state.seekTime !== null) {
+      this.props.onSeek(this.state.seekTime);
+      this.setState({ seekTime: null });
+    }
+  };
+
   render() {
-    const { simulationStatus, onStart, onCancel, isLoading, stats } = this.props;
+    const { simulationStatus, onStart, onCancel, isLoading, stats, replay } = this.props;
 
     // Fallback to zero if these fields are missing.
     let passengerCount = 0;
@@ -342,6 +361,41 @@ class Sidebar extends React.Component<RootProps, SidebarState> {
           <div className="mt-1 text-sm font-medium">Delay: {delayMs} ms</div>
         </div>
 
+        {/* Replay position and speed, when playing back a recording */}
+        {replay && simulationStatus !== 'off' && (
+          <div className="mb-4">
+            <h3 className="text-base font-semibold mb-2">Replay</h3>
+            <input
+              type="range"
+              min={replay.startTime}
+              max={replay.endTime}
+              step="1000"
+              value={this.state.seekTime !== null ? this.state.seekTime : stats.time}
+              onChange={this.handleSeekChange}
+              onMouseUp={this.handleSeekStop}
+              onTouchEnd={this.handleSeekStop}
+              className="w-full cursor-pointer"
+            />
+            <div className="mt-1 text-sm font-medium">
+              Time: {Math.round(stats.time / 1000)} / {Math.round(replay.endTime / 1000)} s
+            </div>
+            <div className="flex flex-wrap items-center gap-1 mt-1">
+              {REPLAY_SPEEDS.map(speed => (
+                <button
+                  key={speed}
+                  onClick={() => this.props.onChangeSpeed(speed)}
+                  className={
+                    'px-2 py-1 text-xs font-medium rounded border border-black ' +
+                    (speed === replay.speed ? 'bg-black text-white' : 'bg-white text-black')
+                  }
+                >
+                  {speed}x
+                </button>
+              ))}
+            </div>
+          </div>
+        )}
+
         {/* Vehicle Summary */}
         <div>
           <h3 className="text-base font-semibold mb-2">Vehicle Summary</h3>
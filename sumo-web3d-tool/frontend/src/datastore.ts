@@ -1,12 +1,43 @@
 // Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
 import * as _ from 'lodash';
 
-import {Delta, ScenarioName, SimulationStatus, VehicleInfo, WebsocketMessage} from './api';
+import {
+  Delta,
+  ReplayInfo,
+  ScenarioName,
+  SimulationStatus,
+  VehicleInfo,
+  WebsocketMessage,
+} from './api';
+import {SnapshotDecoder} from './codec';
 import {SUPPORTED_VEHICLE_CLASSES} from './constants';
 import {LatLng} from './coords';
 import {InitResources} from './initialization';
 import Sumo3D, {NameAndUserData, SumoState, SUMO_ENDPOINT} from './sumo3d';
 
+/** How often to check whether the server needs to know about a new viewport. */
+const VIEWPORT_POLL_MS = 250;
+/** How much of the ground around the view to request too, so that panning needn't wait. */
+const VIEWPORT_MARGIN = 0.25;
+
+type Bounds = [number, number, number, number];
+
+function padBounds([xmin, ymin, xmax, ymax]: Bounds): Bounds {
+  const dx = Math.max((xmax - xmin) * VIEWPORT_MARGIN, 50);
+  const dy = Math.max((ymax - ymin) * VIEWPORT_MARGIN, 50);
+  return [xmin - dx, ymin - dy, xmax + dx, ymax + dy];
+}
+
+function contains(outer: Bounds, inner: Bounds) {
+  return (
+    outer[0] <= inner[0] && outer[1] <= inner[1] && outer[2] >= inner[2] && outer[3] >= inner[3]
+  );
+}
+
+function area([xmin, ymin, xmax, ymax]: Bounds) {
+  return (xmax - xmin) * (ymax - ymin);
+}
+
 export interface State {
   availableScenarios: ScenarioName[];
   clickedPoint: LatLng | null;
@@ -18,6 +49,7 @@ export interface State {
   edgesHighlighted: boolean;
   delayMs: number;
   simulationStatus: SimulationStatus;
+  replay?: ReplayInfo;
   isLoading: boolean;
   isProjection: boolean;
   scenario: string;
@@ -60,10 +92,14 @@ export default function createStore(init: InitResources) {
 
   state.isProjection = init.isProjection;
 
+  // Snapshots arrive as binary frames if we negotiated them; see initialization.ts.
+  const decoder = new SnapshotDecoder();
+
   webSocket.onmessage = event => {
-    const msg: WebsocketMessage = JSON.parse(event.data);
+    const isBinary = event.data instanceof ArrayBuffer;
+    const msg: WebsocketMessage = isBinary ? decoder.decode(event.data) : JSON.parse(event.data);
     if (msg.type === 'snapshot') {
-      const payloadSize = event.data.length;
+      const payloadSize = isBinary ? event.data.byteLength : event.data.length;
       state.stats = {
         time: msg.time,
         payloadSize,
@@ -72,6 +108,10 @@ export default function createStore(init: InitResources) {
         snapshotSecs: msg.snapshot_secs,
       };
 
+      if (msg.keyframe) {
+        // The full state, e.g. after seeking in a replay: drop whatever isn't in it.
+        sumo3d.purgeVehicles();
+      }
       processDelta(msg.vehicles, {
         enter: (vehicleId, info) => sumo3d.createVehicleObject(vehicleId, info),
         update: (vehicleId, info) => sumo3d.updateVehicleObject(vehicleId, info),
@@ -83,20 +123,52 @@ export default function createStore(init: InitResources) {
         update: (lightId, delta) => sumo3d.updateLightObject(lightId, delta),
         exit: id => console.warn('Disappearing traffic lights!', id),
       });
+      // With too many vehicles in view, the server sends where traffic is instead.
+      if (!msg.lod) {
+        sumo3d.clearDensity();
+      } else if (msg.density) {
+        sumo3d.updateDensity(msg.density);
+      }
       if (state.clickedVehicleId) {
         state.clickedVehicleInfo = sumo3d.getVehicleInfo(state.clickedVehicleId);
       }
       sumo3d.updateStats(state.stats);
       stateChanged();
     } else if (msg.type === 'state') {
+      if (msg.simulationStatus === 'off' && state.simulationStatus !== 'off') {
+        // Another viewer may have cancelled the shared simulation.
+        sumo3d.purgeVehicles();
+        sumo3d.clearDensity();
+        decoder.reset();
+      }
       state.simulationStatus = msg.simulationStatus;
       state.delayMs = msg.delayMs;
+      state.replay = msg.replay;
       stateChanged();
+    } else if (msg.type === 'error') {
+      console.warn(msg.message);
     } else {
       console.error('unrecognized message: ', msg);
     }
   };
 
+  // Tell the server which part of the network we can see, so that it only sends the vehicles
+  // there (or their density, if there are too many). We ask for a margin around the view and only
+  // update it once the view leaves it, or once we've zoomed in enough that most of it is wasted.
+  let sentBounds: Bounds | null = null;
+  setInterval(() => {
+    if (webSocket.readyState !== WebSocket.OPEN) {
+      return;
+    }
+    const view = sumo3d.getViewportBounds();
+    const padded = padBounds(view);
+    if (sentBounds && contains(sentBounds, view) && area(sentBounds) < 4 * area(padded)) {
+      return;
+    }
+    sentBounds = padded;
+    webSocket.send(JSON.stringify({type: 'action', action: 'viewport', bounds: padded}));
+  }, VIEWPORT_POLL_MS);
+
   function processDelta<T>(
     delta: Delta<T>,
     callbacks: {
@@ -150,6 +222,15 @@ export default function createStore(init: InitResources) {
     webSocket.send(JSON.stringify({type: 'action', action: 'changeDelay', delayLengthMs: delayMs}));
   }
 
+  /** Jump to a time (in ms) of a replay. */
+  async function seek(time: number) {
+    webSocket.send(JSON.stringify({type: 'action', action: 'seek', time}));
+  }
+
+  async function changeSpeed(speed: number) {
+    webSocket.send(JSON.stringify({type: 'action', action: 'changeSpeed', speed}));
+  }
+
   async function changeScenario(scenario: string) {
     window.location.pathname = `/scenarios/${scenario}/`;
   }
@@ -223,7 +304,10 @@ export default function createStore(init: InitResources) {
       stateChanged();
       return;
     }
-    const url = `${SUMO_ENDPOINT}/vehicle_route?${vehicleId}`;
+    const {session} = init.simulationState;
+    const url = session
+      ? `${SUMO_ENDPOINT}/sessions/${session}/vehicle_route?${vehicleId}`
+      : `${SUMO_ENDPOINT}/vehicle_route?${vehicleId}`;
     const response = await fetch(url);
     if (response.status !== 200) {
       console.log('non-200', url);
@@ -340,6 +424,8 @@ export default function createStore(init: InitResources) {
       changeScenario,
       followObjectPOV,
       changeDelay,
+      seek,
+      changeSpeed,
       handleSearch,
       deselectSearch,
       unfollowObjectPOV,
@@ -0,0 +1,98 @@
+// Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+/**
+ * A heatmap of traffic density, which the server sends instead of vehicles when the view holds
+ * too many of them (see density.py and viewport.py).
+ *
+ * Each cell of the server's grid is one texel of a texture stretched over the network, so the
+ * heatmap is a single quad however large the network is. A cell's color is its mean speed, from
+ * red for standing traffic to green at FREE_FLOW_SPEED, and its opacity how occupied it is.
+ */
+import * as three from 'three';
+
+import {Density} from './api';
+import {Transform} from './coords';
+
+/** Mean speed (m/s) at and above which a cell is all green. */
+const FREE_FLOW_SPEED = 14;
+/** How far above the ground to draw the heatmap, to stay clear of the roads. */
+const HEIGHT = 3;
+/** Opacity of a cell with vehicles but no occupancy to speak of. */
+const MIN_OPACITY = 0.35;
+
+export default class DensityHeatmap {
+  readonly mesh: three.Mesh;
+  private material: three.MeshBasicMaterial;
+  private texture: three.DataTexture | null = null;
+  private data = new Uint8Array(0);
+  private cellSize = 0;
+  private firstColumn = 0;
+  private firstRow = 0;
+  private columns = 0;
+  private rows = 0;
+
+  constructor(private transform: Transform) {
+    this.material = new three.MeshBasicMaterial({transparent: true, depthWrite: false});
+    this.mesh = new three.Mesh(new three.PlaneBufferGeometry(1, 1), this.material);
+    this.mesh.name = 'Density';
+    this.mesh.rotation.x = -Math.PI / 2; // Lie flat, facing up.
+    this.mesh.visible = false;
+  }
+
+  update(density: Density) {
+    if (density.cellSize !== this.cellSize) {
+      this.resize(density.cellSize);
+    }
+    const {data} = this;
+    data.fill(0);
+    for (let i = 0; i < density.columns.length; i++) {
+      const column = density.columns[i] - this.firstColumn;
+      const row = density.rows[i] - this.firstRow;
+      if (column < 0 || row < 0 || column >= this.columns || row >= this.rows) {
+        continue;
+      }
+      const fast = Math.min(density.speed[i] / FREE_FLOW_SPEED, 1);
+      const occupancy = Math.min(density.occupancy[i], 1);
+      const offset = 4 * (row * this.columns + column);
+      data[offset] = 255 * Math.min(2 * (1 - fast), 1);
+      data[offset + 1] = 255 * Math.min(2 * fast, 1);
+      data[offset + 3] = 255 * (MIN_OPACITY + (1 - MIN_OPACITY) * occupancy);
+    }
+    (this.texture as three.DataTexture).needsUpdate = true;
+    this.mesh.visible = true;
+  }
+
+  clear() {
+    this.mesh.visible = false;
+  }
+
+  /** Make a texel for every cell of the network's bounding box, and cover the cells with it. */
+  private resize(cellSize: number) {
+    // SUMO y runs from transform.top to transform.bottom; see coords.ts.
+    const {left, right, top, bottom} = this.transform;
+    this.cellSize = cellSize;
+    this.firstColumn = Math.floor(left / cellSize);
+    this.firstRow = Math.floor(top / cellSize);
+    this.columns = Math.floor(right / cellSize) - this.firstColumn + 1;
+    this.rows = Math.floor(bottom / cellSize) - this.firstRow + 1;
+    this.data = new Uint8Array(4 * this.columns * this.rows);
+
+    if (this.texture) {
+      this.texture.dispose();
+    }
+    // Row 0 of the texture is at the bottom of the plane, i.e. the lowest SUMO y.
+    this.texture = new three.DataTexture(this.data, this.columns, this.rows, three.RGBAFormat);
+    this.texture.magFilter = three.NearestFilter;
+    this.texture.minFilter = three.NearestFilter;
+    this.material.map = this.texture;
+    this.material.needsUpdate = true;
+
+    const width = this.columns * cellSize;
+    const height = this.rows * cellSize;
+    const [x, z] = this.transform.xyToXz([
+      this.firstColumn * cellSize + width / 2,
+      this.firstRow * cellSize + height / 2,
+    ]);
+    this.mesh.scale.set(width, height, 1);
+    this.mesh.position.set(x, HEIGHT, z);
+  }
+}
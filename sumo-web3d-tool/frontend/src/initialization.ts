@@ -32,7 +32,30 @@ export interface InitResources {
 }
 
 const {hostname} = window.location;
-const WEB_SOCKETS_ENDPOINT = `ws://${hostname}:5678/`;
+
+/**
+ * Identifies this page's simulation session, and the snapshot format it wants, to the server.
+ * Viewers of the same scenario share a session unless the page URL picks a private one with
+ * ?session=<id>.
+ */
+function sessionQuery(): string {
+  const params = new URLSearchParams();
+  const match = window.location.pathname.match(/\/scenarios\/([^/]+)\//);
+  if (match) {
+    params.set('scenario', match[1]);
+  }
+  const pageParams = new URLSearchParams(window.location.search);
+  const session = pageParams.get('session');
+  if (session) {
+    params.set('session', session);
+  }
+  // Compact binary snapshots (see codec.ts), unless the page asks for JSON, e.g. for debugging.
+  params.set('format', pageParams.get('format') === 'json' ? 'json' : 'binary');
+  return params.toString();
+}
+
+const SESSION_QUERY = sessionQuery();
+const WEB_SOCKETS_ENDPOINT = `ws://${hostname}:5678/?${SESSION_QUERY}`;
 
 const textureLoader = new three.TextureLoader();
 const mtlLoader = new MTLLoader() as three.MTLLoader;
@@ -123,7 +146,7 @@ async function fetchJsonAllowFail<T>(url: string): Promise<T | null> {
 
 export default async function init(): Promise<InitResources> {
   const loadStartMs = window.performance.now();
-  const simulationState = await fetchJson<SimulationState>('/state');
+  const simulationState = await fetchJson<SimulationState>(`/state?${SESSION_QUERY}`);
   const network = await fetchJson<Network>('network');
   const isProjection =
     network.net.location.projParameter.length > 0 && network.net.location.projParameter !== '!';
@@ -137,6 +160,7 @@ export default async function init(): Promise<InitResources> {
   });
 
   const webSocket = new WebSocket(WEB_SOCKETS_ENDPOINT);
+  webSocket.binaryType = 'arraybuffer';
   const webSocketPromise = new Promise((resolve, reject) => {
     webSocket.onopen = () => resolve(webSocket);
     webSocket.onerror = reject;
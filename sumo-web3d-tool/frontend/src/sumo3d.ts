@@ -4,11 +4,12 @@ import * as _ from 'lodash';
 import Stats = require('stats.js');
 import * as three from 'three';
 
-import {LightInfo, SimulationState, VehicleInfo} from './api';
+import {Density, LightInfo, SimulationState, VehicleInfo} from './api';
 import FollowVehicleControls from './controls/follow-controls';
 import PanAndRotateControls from './controls/pan-and-rotate-controls';
 import {XZPlaneMatrix4} from './controls/utils';
 import {getTransforms, LatLng, Transform} from './coords';
+import DensityHeatmap from './density';
 import Postprocessing, {FOG_RATE} from './effects/postprocessing';
 import addSky from './effects/sky';
 import {InitResources} from './initialization';
@@ -83,6 +84,7 @@ export default class Sumo3D {
   public simulationState: SimulationState;
   private vClassObjects: {[vehicleClass: string]: three.Object3D[]};
   private trafficLights: TrafficLights;
+  private density: DensityHeatmap;
   public highlightedMeshes: HighlightedMesh[];
   private highlightedVehicles: HighlightedVehicle[];
   private gui: typeof dat.gui.GUI;
@@ -166,6 +168,8 @@ export default class Sumo3D {
     if (init.additional && init.additional.tlLogic) {
       this.trafficLights.addLogic(forceArray(init.additional.tlLogic));
     }
+    this.density = new DensityHeatmap(this.transform);
+    this.scene.add(this.density.mesh);
     this.groundPlane = this.scene.getObjectByName('Land');
 
     this.animate = this.animate.bind(this);
@@ -285,6 +289,15 @@ export default class Sumo3D {
     }
   }
 
+  /** Show traffic density in place of vehicles; see density.ts. */
+  updateDensity(density: Density) {
+    this.density.update(density);
+  }
+
+  clearDensity() {
+    this.density.clear();
+  }
+
   updateStats(stats: SumoState) {
     const simTimeMs = stats.simulateSecs * 1000;
     this.maxSimTimeMs = Math.max(simTimeMs, this.maxSimTimeMs);
@@ -497,6 +510,29 @@ export default class Sumo3D {
     domElement.addEventListener('mouseup', onMouseUp);
   }
 
+  /**
+   * The SUMO x/y bounding box of the ground the camera can see, or of the whole network if the
+   * view reaches the horizon. The server culls vehicles to it, or sends densities instead.
+   */
+  getViewportBounds(): [number, number, number, number] {
+    const {left, top, right, bottom} = this.transform;
+    const ground = new three.Plane(new three.Vector3(0, 1, 0), 0);
+    const raycaster = new three.Raycaster();
+    const xs: number[] = [];
+    const ys: number[] = [];
+    for (const [screenX, screenY] of [[-1, -1], [1, -1], [1, 1], [-1, 1]]) {
+      raycaster.setFromCamera(new three.Vector2(screenX, screenY), this.camera);
+      const point = raycaster.ray.intersectPlane(ground, new three.Vector3());
+      if (!point) {
+        return [left, top, right, bottom];
+      }
+      const [x, y] = this.transform.xzToSumoXy([point.x, point.z]);
+      xs.push(x);
+      ys.push(y);
+    }
+    return [Math.min(...xs), Math.min(...ys), Math.max(...xs), Math.max(...ys)];
+  }
+
   onClick(event: MouseEvent) {
     if (this.cancelNextClick) {
       // This was probably a drag, not a click.
@@ -29,8 +29,19 @@ setup(
         'aiohttp>=2.2',
         'chardet>=3.0',
         'lxml>=3.8',
+        'numpy>=1.13',
+        # Time zones, which the standard library only has from Python 3.9 (zoneinfo).
+        'python-dateutil>=2.7; python_version < "3.9"',
         'websockets>=3.4',
         'xmltodict>=0.11',
     ],
+    extras_require={
+        # Brotli-compressed scenario files, for browsers which accept them.
+        'brotli': ['brotli'],
+        # Placing the TomTom points on the network, for calibration.
+        'calibration': ['pyproj'],
+        # Writing simulated runs to the analytics database, with --record-db.
+        'database': ['PyMySQL'],
+    },
 )
 
@@ -0,0 +1,82 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Serves large, rarely changing responses such as a scenario's network.
+
+An Asset is serialized and compressed once, when it's first requested, and then
+served as is: gzip- or (if the brotli package is installed) brotli-compressed,
+depending on what the client accepts. Responses carry an ETag derived from the
+content, so browsers revalidate with If-None-Match and get an empty 304 when
+nothing changed. Requests for ?v=<version> (see Asset.version) may be cached
+forever, since a different version gets a different URL.
+"""
+import gzip
+import hashlib
+import json
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def accepted_encodings(request):
+    """The content codings in the request's Accept-Encoding header, minus refused ones."""
+    encodings = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        try:
+            q = float(params[2:]) if params.startswith('q=') else 1
+        except ValueError:
+            q = 0
+        if coding and q > 0:
+            encodings.add(coding.lower())
+    return encodings
+
+
+class Asset(object):
+    """One response body, with its compressed forms and ETag."""
+
+    def __init__(self, body, content_type='application/json'):
+        self.content_type = content_type
+        self.version = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = '"%s"' % self.version
+        self.encoded = {
+            'identity': body,
+            'gzip': gzip.compress(body, GZIP_LEVEL, mtime=0),
+        }
+        if brotli:
+            self.encoded['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(json.dumps(value).encode('utf-8'))
+
+    def not_modified(self, request):
+        etags = request.headers.get('If-None-Match', '')
+        return any(etag.strip() in ('*', self.etag, 'W/' + self.etag)
+                   for etag in etags.split(','))
+
+    def response(self, request):
+        headers = {
+            'ETag': self.etag,
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': (IMMUTABLE_CACHE_CONTROL if request.query.get('v') == self.version
+                              else REVALIDATE_CACHE_CONTROL),
+        }
+        if self.not_modified(request):
+            return web.Response(status=304, headers=headers)
+        accepted = accepted_encodings(request)
+        encoding = next((e for e in ('br', 'gzip') if e in accepted and e in self.encoded),
+                        'identity')
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return web.Response(body=self.encoded[encoding], content_type=self.content_type,
+                            headers=headers)
@@ -0,0 +1,42 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import gzip
+import json
+
+from aiohttp.test_utils import make_mocked_request
+from nose.tools import eq_, ok_
+
+from .assets import Asset, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+
+
+def test_compressed_response():
+    network = {'net': {'edge': [{'id': 'e%d' % i, 'lanes': 2} for i in range(100)]}}
+    asset = Asset.from_json(network)
+    response = asset.response(make_mocked_request(
+        'GET', '/scenarios/ongar/network', headers={'Accept-Encoding': 'gzip, deflate'}))
+    eq_(200, response.status)
+    eq_('gzip', response.headers['Content-Encoding'])
+    eq_(asset.etag, response.headers['ETag'])
+    eq_(REVALIDATE_CACHE_CONTROL, response.headers['Cache-Control'])
+    ok_(len(response.body) < len(asset.encoded['identity']))
+    eq_(network, json.loads(gzip.decompress(response.body).decode('utf-8')))
+
+    # Clients which don't accept gzip get the plain JSON.
+    response = asset.response(make_mocked_request(
+        'GET', '/scenarios/ongar/network', headers={'Accept-Encoding': 'gzip;q=0'}))
+    ok_('Content-Encoding' not in response.headers)
+    eq_(network, json.loads(response.body.decode('utf-8')))
+
+
+def test_not_modified_and_versioned_urls():
+    asset = Asset.from_json({'net': {}})
+    response = asset.response(make_mocked_request(
+        'GET', '/scenarios/ongar/network', headers={'If-None-Match': 'W/%s' % asset.etag}))
+    eq_(304, response.status)
+    eq_(asset.etag, response.headers['ETag'])
+
+    response = asset.response(make_mocked_request(
+        'GET', '/scenarios/ongar/network?v=%s' % asset.version))
+    eq_(IMMUTABLE_CACHE_CONTROL, response.headers['Cache-Control'])
+
+    # A different version of the content gets a different ETag.
+    ok_(Asset.from_json({'net': {'edge': []}}).etag != asset.etag)
@@ -0,0 +1,62 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""The ways the server can drive SUMO.
+
+traci runs SUMO as a separate process and talks to it over a socket, so every
+command costs a round trip. libsumo links SUMO into this process and exposes the
+same API as plain function calls. It is much cheaper per call, but it can only
+run one simulation per process, can't show sumo-gui, and holds the GIL while it
+steps, so the event loop only gets a turn between steps.
+
+Either way, start() returns an object with traci's domain API (vehicle, person,
+simulation, ...) for the simulation code to use.
+"""
+import threading
+
+import traci
+
+BACKEND_TRACI = 'traci'
+BACKEND_LIBSUMO = 'libsumo'
+BACKENDS = (BACKEND_TRACI, BACKEND_LIBSUMO)
+
+
+class TraciBackend(object):
+    name = BACKEND_TRACI
+    max_simulations = None  # One SUMO process each, as many as the machine allows.
+    supports_gui = True
+
+    def __init__(self):
+        # traci.start is not thread-safe, and session workers may start SUMO concurrently.
+        self._start_lock = threading.Lock()
+
+    def start(self, args, label):
+        with self._start_lock:
+            # Sessions only ever use their own connection, never traci's default one.
+            traci.start(args, label=label, doSwitch=False)
+        return traci.getConnection(label)
+
+
+class LibsumoBackend(object):
+    name = BACKEND_LIBSUMO
+    max_simulations = 1  # libsumo keeps its simulation in global state.
+    supports_gui = False
+
+    def __init__(self):
+        import libsumo
+        self.libsumo = libsumo
+
+    def start(self, args, label):
+        self.libsumo.start(args)
+        return self.libsumo
+
+
+def get_backend(name):
+    """Instantiate the backend called name. Raises ValueError if it isn't available."""
+    if name == BACKEND_TRACI:
+        return TraciBackend()
+    if name == BACKEND_LIBSUMO:
+        try:
+            return LibsumoBackend()
+        except ImportError:
+            raise ValueError('libsumo is not installed; it ships with SUMO 1.x or can be '
+                             'installed with pip install libsumo')
+    raise ValueError('Unknown backend: %s' % name)
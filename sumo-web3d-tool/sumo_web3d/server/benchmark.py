@@ -0,0 +1,447 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Measure the server's hot paths, so that changes to them are measured rather than guessed.
+
+There are four suites:
+
+* deltas: rounding and diffing a step of a synthetic fleet, with deltas.round_vehicles
+  and deltas.diff_dicts as well as with the VehicleStore the server uses.
+* encode: the size of a step's snapshot, and how long it takes to encode, as JSON and
+  in the binary format of codec.py; both for a delta and for a keyframe.
+* load: how long each bundled scenario takes to parse, and to load from the scenario
+  cache instead.
+* steps: how many steps per second the server's simulation loop manages on each
+  bundled scenario with each backend. This runs the same start_sumo_executable and
+  simulate_next_step that sessions use, without a websocket or any pacing.
+
+The synthetic fleets (1000, 10000 and 100000 vehicles unless --fleet says otherwise)
+are generated from --seed, and every time is the median of --repeat runs, so that
+runs on the same machine are comparable. --output saves the results as JSON, and
+--compare checks them against an earlier --output:
+
+    python -m sumo_web3d.server.benchmark --output before.json
+    (change something)
+    python -m sumo_web3d.server.benchmark --compare before.json --output after.json
+
+This prints each measurement's change and exits with status 1 if any got worse by
+more than --tolerance. Comparing two saved files needs no run at all:
+
+    python -m sumo_web3d.server.benchmark --compare before.json --results after.json
+"""
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .backends import BACKENDS, get_backend
+from .codec import HandleAllocator, encode_snapshot
+from .deltas import diff_dicts, round_vehicles
+from .headless import HeadlessSession
+from .scenario_cache import ScenarioCache
+from .server import (
+    DIR, SCENARIOS_PATH, parse_scenario_files, start_sumo_executable, simulate_next_step)
+from .vehicle_store import VehicleStore
+
+SUITES = ('deltas', 'encode', 'load', 'steps')
+DEFAULT_FLEETS = (1000, 10000, 100000)
+DEFAULT_REPEAT = 5
+DEFAULT_SEED = 42
+DEFAULT_TOLERANCE = 0.1
+RESULTS_VERSION = 1
+# Whether more of a metric is better (1) or worse (-1). Other metrics are only context.
+METRIC_DIRECTIONS = {'ms': -1, 'bytes': -1, 'stepsPerSec': 1}
+
+# Each step of a synthetic fleet, this share of vehicles leaves and as many new ones arrive.
+TURNOVER = 0.05
+# The share of vehicles standing still, e.g. at a red light, whose fields don't change.
+STOPPED = 0.2
+VEHICLE_TYPES = (('veh_passenger', 'passenger', 4.5, 1.8), ('bus_bus', 'bus', 12, 2.5),
+                 ('bike_bicycle', 'bicycle', 1.6, 0.65))
+
+parser = argparse.ArgumentParser(description='Benchmark the hot paths of the server.')
+parser.add_argument(
+    '--suite', action='append', dest='suites', choices=SUITES, default=[],
+    help='Only run this suite. May be repeated. The default is every suite.')
+parser.add_argument(
+    '--fleet', action='append', dest='fleets', type=int, default=[],
+    help='Synthetic fleet size for the deltas and encode suites. May be repeated. ' +
+         'The default is %s.' % ', '.join(str(size) for size in DEFAULT_FLEETS))
+parser.add_argument(
+    '--repeat', type=int, default=DEFAULT_REPEAT,
+    help='How many times to time each measurement; the median counts.')
+parser.add_argument(
+    '--seed', type=int, default=DEFAULT_SEED,
+    help='Random seed for the synthetic fleets.')
+parser.add_argument(
+    '--scenarios-file', dest='scenarios_file', default=SCENARIOS_PATH,
+    help='JSON list of scenarios, in the format of scenarios.json.')
+parser.add_argument(
+    '--scenario', action='append', dest='scenarios', default=[],
+    help='Only load or run the scenario with this name. May be repeated.')
+parser.add_argument(
+    '--backend', action='append', dest='backends', choices=BACKENDS, default=[],
+    help='Only run this backend. May be repeated. The default is every available backend.')
+parser.add_argument(
+    '--steps', type=int, default=300,
+    help='How many steps to run each scenario for (fewer if it ends first).')
+parser.add_argument(
+    '--sumo-args', dest='sumo_args', default='',
+    help='Additional arguments to pass to sumo.')
+parser.add_argument(
+    '--output', default=None,
+    help='Write the results to this JSON file.')
+parser.add_argument(
+    '--compare', metavar='BASELINE', default=None,
+    help='Compare the results with those in this earlier --output.')
+parser.add_argument(
+    '--results', default=None,
+    help='With --compare, compare the results in this earlier --output rather than ' +
+         'running anything.')
+parser.add_argument(
+    '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+    help='With --compare, the relative change (0.1 is 10%%) past which a measurement ' +
+         'counts as better or worse.')
+
+
+class BenchmarkScenario(object):
+    def __init__(self, name, config_file, warm_start=None):
+        self.name = name
+        self.config_file = config_file
+        self.warm_start = warm_start
+
+
+def load_scenarios(scenarios_file, names):
+    """BenchmarkScenarios for the entries of scenarios_file whose config file exists.
+
+    Unlike server.load_scenarios_file, this doesn't parse networks, which the
+    benchmark doesn't need.
+    """
+    with open(scenarios_file) as f:
+        entries = json.load(f)
+    scenarios = []
+    for entry in entries:
+        if names and entry['name'] not in names:
+            continue
+        config_file = os.path.join(
+            DIR, os.path.expanduser(os.path.expandvars(entry['config_file'])))
+        if not os.path.exists(config_file):
+            print('Skipping %s: %s does not exist' % (entry['name'], config_file))
+            continue
+        scenarios.append(BenchmarkScenario(entry['name'], config_file, entry.get('warm_start')))
+    return scenarios
+
+
+def result(suite, benchmark, params, **metrics):
+    return {'suite': suite, 'benchmark': benchmark, 'params': params, 'metrics': metrics}
+
+
+def result_key(row):
+    """What identifies a measurement across runs, e.g. 'deltas/diff_dicts vehicles=1000'."""
+    params = ' '.join('%s=%s' % (k, v) for k, v in sorted(row['params'].items()))
+    return ('%s/%s %s' % (row['suite'], row['benchmark'], params)).strip()
+
+
+def median_secs(fn, repeat, setup=None):
+    """The median time fn(*setup()) takes, leaving setup (e.g. making copies) out of it."""
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        gc.collect()
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def synthetic_vehicle(rng):
+    vtype, vclass, length, width = rng.choice(VEHICLE_TYPES)
+    return {
+        'x': rng.uniform(0, 5000),
+        'y': rng.uniform(0, 5000),
+        'z': 0.0,
+        'speed': rng.uniform(0, 20),
+        'angle': rng.uniform(0, 360),
+        'type': vtype,
+        'length': length,
+        'width': width,
+        'signals': rng.choice((0, 0, 0, 1, 2, 8)),
+        'vClass': vclass,
+    }
+
+
+def synthetic_step(size, seed=DEFAULT_SEED):
+    """Two consecutive steps of a fleet of size vehicles, as {vehicle ID: fields} dicts.
+
+    Between them, TURNOVER of the vehicles leave and as many arrive; of the rest, all
+    but the STOPPED ones move on.
+    """
+    rng = random.Random(seed)
+    before = {'veh%d' % i: synthetic_vehicle(rng) for i in range(size)}
+    turnover = int(size * TURNOVER)
+    after = {}
+    for veh_id, vehicle in list(before.items())[turnover:]:
+        if rng.random() < STOPPED:
+            after[veh_id] = dict(vehicle)
+        else:
+            angle = math.radians(vehicle['angle'])
+            speed = max(0.0, vehicle['speed'] + rng.uniform(-1.5, 1.5))
+            after[veh_id] = dict(vehicle, x=vehicle['x'] + speed * math.sin(angle),
+                                 y=vehicle['y'] + speed * math.cos(angle), speed=speed,
+                                 angle=(vehicle['angle'] + rng.uniform(-5, 5)) % 360)
+    for i in range(size, size + turnover):
+        after['veh%d' % i] = synthetic_vehicle(rng)
+    return before, after
+
+
+def copy_vehicles(vehicles):
+    return {veh_id: dict(vehicle) for veh_id, vehicle in vehicles.items()}
+
+
+def as_groups(vehicles):
+    """vehicles as VehicleStore.update groups, like server.vehicle_columns makes them."""
+    ids = list(vehicles)
+    fields = next(iter(vehicles.values())).keys() if vehicles else ()
+    return [(ids, {field: [vehicles[veh_id][field] for veh_id in ids] for field in fields})]
+
+
+def rounded(vehicles):
+    vehicles = copy_vehicles(vehicles)
+    round_vehicles(vehicles)
+    return vehicles
+
+
+def deltas_suite(fleets, repeat, seed):
+    results = []
+    for size in fleets:
+        before, after = synthetic_step(size, seed)
+        params = {'vehicles': size}
+        secs = median_secs(round_vehicles, repeat, lambda: (copy_vehicles(after),))
+        results.append(result('deltas', 'round_vehicles', params, ms=1000 * secs))
+        before_rounded, after_rounded = rounded(before), rounded(after)
+        secs = median_secs(diff_dicts, repeat, lambda: (before_rounded, after_rounded))
+        results.append(result('deltas', 'diff_dicts', params, ms=1000 * secs))
+
+        groups = as_groups(after)
+
+        def stored_before():
+            store = VehicleStore()
+            store.update(as_groups(before))
+            return store, groups
+
+        secs = median_secs(lambda store, groups: store.update(groups), repeat, stored_before)
+        results.append(result('deltas', 'vehicle_store', params, ms=1000 * secs))
+    return results
+
+
+def encode_suite(fleets, repeat, seed):
+    results = []
+    for size in fleets:
+        before, after = synthetic_step(size, seed)
+        store = VehicleStore()
+        allocator = HandleAllocator()
+        allocator.update(store.update(as_groups(before)))
+        delta = store.update(as_groups(after))
+        handles = allocator.update(delta)
+        keyframe = {'creations': store.state().to_dict(), 'updates': {}, 'removals': []}
+        for kind, vehicles, kind_handles in [
+                ('delta', delta, handles),
+                ('keyframe', keyframe, HandleAllocator().update(keyframe))]:
+            snapshot = {
+                'type': 'snapshot',
+                'time': 1000,
+                'vehicles': vehicles,
+                'lights': {'creations': {}, 'updates': {}, 'removals': []},
+                'vehicle_counts': store.state().vehicle_counts(),
+                'simulate_secs': 0.01,
+                'snapshot_secs': 0.01,
+            }
+            params = {'vehicles': size, 'kind': kind}
+            secs = median_secs(json.dumps, repeat, lambda: (snapshot,))
+            results.append(result('encode', 'json', params, ms=1000 * secs,
+                                  bytes=len(json.dumps(snapshot).encode('utf-8'))))
+            secs = median_secs(encode_snapshot, repeat, lambda: (snapshot, kind_handles))
+            results.append(result('encode', 'binary', params, ms=1000 * secs,
+                                  bytes=len(encode_snapshot(snapshot, kind_handles))))
+    return results
+
+
+def load_suite(scenarios, repeat):
+    results = []
+    for scenario in scenarios:
+        params = {'scenario': scenario.name}
+        key = os.path.abspath(scenario.config_file)
+
+        def parse():
+            return parse_scenario_files(scenario.config_file)
+
+        try:
+            secs = median_secs(parse, repeat)
+        except Exception as e:
+            print('Skipping loading %s: %s' % (scenario.name, e))
+            continue
+        results.append(result('load', 'parse', params, ms=1000 * secs))
+        with tempfile.TemporaryDirectory() as cache_dir:
+            ScenarioCache(cache_dir).get(key, parse)
+            # A fresh cache each time, so that the files are read rather than kept in memory.
+            secs = median_secs(lambda cache: cache.get(key, parse), repeat,
+                               lambda: (ScenarioCache(cache_dir),))
+        results.append(result('load', 'cached', params, ms=1000 * secs))
+    return results
+
+
+def run_scenario(backend, scenario, steps, sumo_args):
+    """Run scenario for up to steps steps. Returns (steps, seconds, max vehicles)."""
+    session = HeadlessSession(scenario)
+    start_sumo_executable(backend, False, sumo_args, session)
+    try:
+        num_steps = 0
+        max_vehicles = 0
+        start_secs = time.time()
+        while num_steps < steps and session.connection.simulation.getMinExpectedNumber() > 0:
+            simulate_next_step(session)
+            max_vehicles = max(max_vehicles, len(session.vehicles))
+            num_steps += 1
+        return num_steps, time.time() - start_secs, max_vehicles
+    finally:
+        session.connection.close()
+
+
+def steps_suite(scenarios, backends, steps, sumo_args):
+    results = []
+    for scenario in scenarios:
+        for backend in backends:
+            try:
+                num_steps, secs, max_vehicles = run_scenario(
+                    backend, scenario, steps, sumo_args)
+            except Exception as e:
+                print('Skipping %s with %s: %s' % (scenario.name, backend.name, e))
+                continue
+            results.append(result('steps', 'simulate', {
+                'scenario': scenario.name, 'backend': backend.name,
+            }, steps=num_steps, stepsPerSec=num_steps / secs if secs else 0,
+                maxVehicles=max_vehicles))
+    return results
+
+
+def describe_machine():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, results, tolerance=DEFAULT_TOLERANCE):
+    """How results changed from baseline, as (key, metric, before, after, change, verdict).
+
+    Only the metrics in METRIC_DIRECTIONS which both have are compared. change is
+    relative, and the verdict is 'better' or 'worse' if it is past tolerance, else ''.
+    """
+    before = {result_key(row): row['metrics'] for row in baseline}
+    rows = []
+    for row in results:
+        key = result_key(row)
+        for metric, value in sorted(row['metrics'].items()):
+            direction = METRIC_DIRECTIONS.get(metric)
+            old = before.get(key, {}).get(metric)
+            if direction is None or old is None:
+                continue
+            change = (value - old) / old if old else 0.0
+            verdict = ''
+            if direction * change > tolerance:
+                verdict = 'better'
+            elif direction * change < -tolerance:
+                verdict = 'worse'
+            rows.append((key, metric, old, value, change, verdict))
+    return rows
+
+
+def format_metric(value):
+    if isinstance(value, float):
+        return '%.3f' % value if value < 100 else '%.1f' % value
+    return str(value)
+
+
+def print_results(results):
+    for row in results:
+        print('%-56s %s' % (result_key(row), '  '.join(
+            '%s=%s' % (metric, format_metric(value))
+            for metric, value in sorted(row['metrics'].items()))))
+
+
+def print_comparison(rows):
+    print('\n%-56s %-11s %12s %12s %8s' % ('benchmark', 'metric', 'before', 'after', 'change'))
+    for key, metric, old, new, change, verdict in rows:
+        print('%-56s %-11s %12s %12s %+7.1f%% %s' % (
+            key, metric, format_metric(old), format_metric(new), 100 * change, verdict))
+
+
+def run_suites(args):
+    suites = args.suites or SUITES
+    fleets = args.fleets or DEFAULT_FLEETS
+    results = []
+    if 'deltas' in suites:
+        results += deltas_suite(fleets, args.repeat, args.seed)
+    if 'encode' in suites:
+        results += encode_suite(fleets, args.repeat, args.seed)
+    if 'load' in suites or 'steps' in suites:
+        scenarios = load_scenarios(args.scenarios_file, args.scenarios)
+    if 'load' in suites:
+        results += load_suite(scenarios, args.repeat)
+    if 'steps' in suites:
+        backends = []
+        for name in args.backends or BACKENDS:
+            try:
+                backends.append(get_backend(name))
+            except ValueError as e:
+                if args.backends:
+                    parser.error(str(e))
+                print('Skipping %s: %s' % (name, e))
+        results += steps_suite(scenarios, backends, args.steps, args.sumo_args)
+    return results
+
+
+def main(args):
+    if args.results and not args.compare:
+        parser.error('--results needs --compare')
+    if args.results:
+        with open(args.results) as f:
+            output = json.load(f)
+    else:
+        output = {
+            'version': RESULTS_VERSION,
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'machine': describe_machine(),
+            'settings': {'repeat': args.repeat, 'seed': args.seed, 'steps': args.steps,
+                         'sumoArgs': args.sumo_args},
+            'results': run_suites(args),
+        }
+        print()
+        print_results(output['results'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('machine') != output.get('machine'):
+            print('\nNote: the baseline comes from a different machine or software versions.')
+        rows = compare(baseline['results'], output['results'], args.tolerance)
+        print_comparison(rows)
+        if any(verdict == 'worse' for _, _, _, _, _, verdict in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
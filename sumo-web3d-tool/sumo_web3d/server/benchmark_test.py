@@ -0,0 +1,49 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import os
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, ok_
+
+if not os.environ.get('SUMO_HOME'):
+    # The benchmark runs the server's code, which needs SUMO_HOME to import.
+    raise SkipTest('SUMO_HOME is not set')
+
+from .benchmark import (  # noqa: E402
+    compare, deltas_suite, encode_suite, result, result_key, synthetic_step)
+
+
+def test_synthetic_step():
+    before, after = synthetic_step(200, seed=1)
+    eq_((before, after), synthetic_step(200, seed=1))
+    eq_(200, len(before))
+    eq_(200, len(after))
+    eq_(10, len(set(before) - set(after)))
+    moved = [veh_id for veh_id in before if veh_id in after and before[veh_id] != after[veh_id]]
+    ok_(100 < len(moved) < 190)
+
+
+def test_suites_cover_every_fleet():
+    results = deltas_suite([10, 20], 1, 0) + encode_suite([10], 1, 0)
+    eq_(['deltas/round_vehicles vehicles=10', 'deltas/diff_dicts vehicles=10',
+         'deltas/vehicle_store vehicles=10', 'deltas/round_vehicles vehicles=20',
+         'deltas/diff_dicts vehicles=20', 'deltas/vehicle_store vehicles=20',
+         'encode/json kind=delta vehicles=10', 'encode/binary kind=delta vehicles=10',
+         'encode/json kind=keyframe vehicles=10', 'encode/binary kind=keyframe vehicles=10'],
+        [result_key(row) for row in results])
+    ok_(all(row['metrics']['bytes'] > 0 for row in results if row['suite'] == 'encode'))
+
+
+def test_compare():
+    baseline = [result('deltas', 'diff_dicts', {'vehicles': 10}, ms=10.0),
+                result('encode', 'json', {'vehicles': 10}, ms=2.0, bytes=1000),
+                result('steps', 'simulate', {'scenario': 'a'}, stepsPerSec=100.0, steps=10)]
+    results = [result('deltas', 'diff_dicts', {'vehicles': 10}, ms=12.0),
+               result('encode', 'json', {'vehicles': 10}, ms=2.1, bytes=500),
+               result('steps', 'simulate', {'scenario': 'a'}, stepsPerSec=80.0, steps=9),
+               result('steps', 'simulate', {'scenario': 'b'}, stepsPerSec=50.0, steps=9)]
+    # Steps are only context, and scenario b has nothing to compare with.
+    eq_([('deltas/diff_dicts vehicles=10', 'ms', 'worse'),
+         ('encode/json vehicles=10', 'bytes', 'better'),
+         ('encode/json vehicles=10', 'ms', ''),
+         ('steps/simulate scenario=a', 'stepsPerSec', 'worse')],
+        [(key, metric, verdict) for key, metric, _, _, _, verdict in compare(baseline, results)])
@@ -0,0 +1,270 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Calibrate a scenario's demand and car speeds against the TomTom speeds of its roads.
+
+The scraper (Data/Scraper.py) stores the current speed at a handful of points in
+Ongar in the tomtom table, every few minutes. This maps each point to the SUMO edges
+under it with sumolib's spatial lookup: the nearest edge cars may use, plus the one
+running the other way if there is one. It then runs the scenario headless under a
+grid of candidate settings (all demand scaled with SUMO's --scale, and the cars'
+speed factor) through the sweep runner, several at a time, and compares each run's
+mean speed on those edges with the speeds observed at every hour of the day. For
+each hour it picks the setting with the smallest RMS error, which is the one to start
+a what-if study of that hour from.
+
+Export the table and calibrate with e.g.
+
+    mysql --batch -e 'SELECT * FROM tomtom' bikehood > tomtom.tsv
+    python -m sumo_web3d.server.calibration --observed tomtom.tsv \\
+        --scale 0.5 1 1.5 2 --speed-factor 0.8 0.9 1 1.1 --output calibration.csv
+
+Turning the points' coordinates into network positions needs pyproj, which comes
+with `pip install sumo-web3d[calibration]`.
+"""
+import argparse
+import collections
+import csv
+import datetime
+import json
+import math
+import tempfile
+
+from . import constants  # noqa
+from .benchmark import load_scenarios
+from .run_recorder import get_timezone
+from .server import SCENARIOS_PATH
+from .sweep import (
+    DEFAULT_END, DEFAULT_SEED, build_grid, config_paths, describe_variant, format_value,
+    run_grid, write_csv)
+import sumolib
+
+# The points Data/Scraper.py asks TomTom about: (latitude, longitude, tomtom column).
+TOMTOM_POINTS = (
+    (53.392862, -6.441783, 'Ongar_Distributor_Road'),
+    (53.394976, -6.444193, 'Littleplace_Castleheaney_Distributor_Road_South'),
+    (53.395872, -6.441064, 'Main_Street'),
+    (53.394084, -6.438794, 'The_Mall'),
+    (53.391115, -6.439771, 'Station_Road'),
+    (53.391576, -6.436851, 'Ongar_Distributor_Road_East'),
+    (53.392969, -6.445409, 'Ongar_Barnhill_Distributor_Road'),
+    (53.396809, -6.442519, 'Littleplace_Castleheaney_Distributor_Road_North'),
+    (53.395994, -6.438525, 'The_Avenue'),
+)
+DEFAULT_RADIUS = 50  # meters from a point to the edges it may map to
+DEFAULT_TIMEZONE = 'Europe/Dublin'
+CALIBRATED_CLASS = 'passenger'  # TomTom measures car speeds.
+
+OUTPUT_COLUMNS = ('hour', 'variant', 'scale', 'speedFactor', 'rmseKmh', 'roads', 'observations')
+
+parser = argparse.ArgumentParser(
+    description='Find the demand and speed settings which best reproduce observed speeds.')
+parser.add_argument(
+    '--observed', required=True,
+    help='The tomtom table as CSV or tab-separated values, with a header row.')
+parser.add_argument(
+    '--scenarios-file', dest='scenarios_file', default=SCENARIOS_PATH,
+    help='JSON list of scenarios, in the format of scenarios.json.')
+parser.add_argument(
+    '--scenario', default='ongar',
+    help='Name of the scenario to calibrate.')
+parser.add_argument(
+    '--scale', dest='scales', type=float, nargs='+', default=[1],
+    help='Candidate factors to scale the demand by.')
+parser.add_argument(
+    '--speed-factor', dest='speed_factors', type=float, nargs='+', default=[],
+    help='Candidate speed factors for cars. The default is to keep the scenario\'s.')
+parser.add_argument(
+    '--radius', type=float, default=DEFAULT_RADIUS,
+    help='How far (in meters) from a TomTom point its edges may be.')
+parser.add_argument(
+    '--edge-map', dest='edge_map', default=None,
+    help='JSON file of {tomtom column: [edge ID, ...]} overriding the edges found for ' +
+         'some points.')
+parser.add_argument(
+    '--timezone', default=DEFAULT_TIMEZONE,
+    help='Timezone for the hours of the day of the observations.')
+parser.add_argument(
+    '--end', type=int, default=DEFAULT_END,
+    help='Simulated seconds to run each candidate for.')
+parser.add_argument(
+    '--seed', type=int, default=DEFAULT_SEED,
+    help='Random seed for SUMO.')
+parser.add_argument(
+    '--warm-start', dest='warm_start', type=float, default=0,
+    help='Only compare speeds from this many simulated seconds in, starting the ' +
+         'candidates from checkpoints (see checkpoints.py) when there are some.')
+parser.add_argument(
+    '-j', '--jobs', type=int, default=None,
+    help='How many candidates to run at once. The default is one per CPU.')
+parser.add_argument(
+    '--work-dir', dest='work_dir', default=None,
+    help='Where to keep the SUMO outputs. The default is a new temporary directory.')
+parser.add_argument(
+    '--output', default=None,
+    help='Write the best candidate of every hour to this CSV file.')
+parser.add_argument(
+    '--sumo-args', dest='sumo_args', default='',
+    help='Additional arguments to pass to sumo.')
+
+
+def edges_at(net, lon, lat, radius=DEFAULT_RADIUS):
+    """IDs of the edges under a point: the nearest one cars may use and its opposite."""
+    x, y = net.convertLonLat2XY(lon, lat)
+    candidates = [(dist, edge.getID(), edge)
+                  for edge, dist in net.getNeighboringEdges(x, y, radius)
+                  if edge.allows(CALIBRATED_CLASS)]
+    if not candidates:
+        return []
+    _, _, nearest = min(candidates)
+    edges = [nearest.getID()]
+    for edge in nearest.getToNode().getOutgoing():
+        if edge.getToNode() == nearest.getFromNode() and edge.allows(CALIBRATED_CLASS):
+            edges.append(edge.getID())
+    return edges
+
+
+def map_points(net, points=TOMTOM_POINTS, radius=DEFAULT_RADIUS):
+    """{tomtom column: [edge ID, ...]} for the points with edges nearby."""
+    mapping = {}
+    for lat, lon, road in points:
+        edges = edges_at(net, lon, lat, radius)
+        if edges:
+            mapping[road] = edges
+        else:
+            print('No edges within %gm of %s; leaving it out' % (radius, road))
+    return mapping
+
+
+def free_flow_speeds(net, road_edges):
+    """{road: km/h} when nobody drives there, which is what TomTom reports then."""
+    return {road: 3.6 * max(net.getEdge(edge_id).getSpeed() for edge_id in edges)
+            for road, edges in road_edges.items()}
+
+
+def read_observed(path, timezone=DEFAULT_TIMEZONE, roads=None):
+    """{road: {hour of day: (mean km/h, count)}} from an export of the tomtom table.
+
+    Column names are matched without regard to case, as MySQL does. Empty readings
+    are left out, as are zeros, which the scraper stores when TomTom has no data.
+    """
+    tz = get_timezone(timezone)
+    sums = collections.defaultdict(lambda: collections.defaultdict(lambda: [0.0, 0]))
+    with open(path, newline='') as f:
+        header = f.readline()
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter='\t' if '\t' in header else ',')
+        columns = {name.lower(): name for name in reader.fieldnames}
+        roads = roads or [road for _, _, road in TOMTOM_POINTS]
+        present = {road: columns[road.lower()] for road in roads if road.lower() in columns}
+        for row in reader:
+            hour = datetime.datetime.fromtimestamp(int(row[columns['timestamp']]), tz).hour
+            for road, column in present.items():
+                try:
+                    speed = float(row[column])
+                except (TypeError, ValueError):  # Empty or NULL.
+                    continue
+                if speed > 0:
+                    sums[road][hour][0] += speed
+                    sums[road][hour][1] += 1
+    return {road: {hour: (total / count, count) for hour, (total, count) in hours.items()}
+            for road, hours in sums.items()}
+
+
+def simulated_speeds(edge_rows, road_edges, free_flow):
+    """{road: km/h} from a sweep run's edge rows: the mean speed on the road's edges.
+
+    Each edge counts for as long as vehicles were on it.
+    """
+    rows = {row['edge']: row for row in edge_rows}
+    speeds = {}
+    for road, edges in road_edges.items():
+        sampled = [rows[edge_id] for edge_id in edges
+                   if edge_id in rows and rows[edge_id]['speed'] is not None]
+        secs = sum(row['sampledSeconds'] for row in sampled)
+        if secs:
+            speed = sum(row['speed'] * row['sampledSeconds'] for row in sampled) / secs
+            speeds[road] = 3.6 * speed
+        else:
+            speeds[road] = free_flow[road]
+    return speeds
+
+
+def hourly_errors(simulated, observed):
+    """{hour: (RMS error in km/h, roads, observations)} of one run against every hour."""
+    by_hour = collections.defaultdict(list)
+    for road, hours in observed.items():
+        if road in simulated:
+            for hour, (speed, count) in hours.items():
+                by_hour[hour].append((simulated[road] - speed, count))
+    return {hour: (math.sqrt(sum(e * e for e, _ in errors) / len(errors)), len(errors),
+                   sum(count for _, count in errors))
+            for hour, errors in by_hour.items()}
+
+
+def best_per_hour(grid, errors):
+    """One row per hour of the day with the candidate of grid whose error was smallest.
+
+    errors holds each candidate's hourly_errors, or None if it failed.
+    """
+    rows = []
+    hours = sorted({hour for candidate in errors if candidate for hour in candidate})
+    for hour in hours:
+        rmse, i = min((candidate[hour][0], i) for i, candidate in enumerate(errors)
+                      if candidate and hour in candidate)
+        _, roads, observations = errors[i][hour]
+        rows.append({
+            'hour': hour,
+            'variant': i,
+            'scale': grid[i].get('scale'),
+            'speedFactor': grid[i].get('%s.speedFactor' % CALIBRATED_CLASS),
+            'rmseKmh': round(rmse, 2),
+            'roads': roads,
+            'observations': observations,
+        })
+    return rows
+
+
+def main(args):
+    scenarios = load_scenarios(args.scenarios_file, [args.scenario])
+    if not scenarios:
+        parser.error('No scenario named %s' % args.scenario)
+    config_file = scenarios[0].config_file
+    net = sumolib.net.readNet(config_paths(config_file, 'net-file')[0])
+    try:
+        road_edges = map_points(net, radius=args.radius)
+    except RuntimeError as e:  # No pyproj, or a network without a projection.
+        parser.error('Could not place the TomTom points on the network: %s' % e)
+    if args.edge_map:
+        with open(args.edge_map) as f:
+            road_edges.update(json.load(f))
+    for road, edges in sorted(road_edges.items()):
+        print('%-48s %s' % (road, ' '.join(edges)))
+
+    observed = read_observed(args.observed, args.timezone, list(road_edges))
+    if not observed:
+        parser.error('No observations for the mapped roads in %s' % args.observed)
+    speed_factors = {CALIBRATED_CLASS: args.speed_factors} if args.speed_factors else None
+    grid = build_grid(speed_factors=speed_factors, scales=args.scales)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='sumo-web3d-calibration-')
+    print('Running %d candidates of %s in %s' % (len(grid), args.scenario, work_dir))
+    results = run_grid(config_file, grid, work_dir, args.end, args.seed, args.sumo_args,
+                       args.jobs, args.warm_start)
+
+    free_flow = free_flow_speeds(net, road_edges)
+    errors = [hourly_errors(simulated_speeds(result[1], road_edges, free_flow), observed)
+              if result else None
+              for result in results]
+    rows = best_per_hour(grid, errors)
+    print('\n' + ' '.join('%12s' % column for column in OUTPUT_COLUMNS))
+    for row in rows:
+        print(' '.join('%12s' % format_value(row[column]) for column in OUTPUT_COLUMNS))
+    for i, variant in enumerate(grid):
+        if errors[i]:
+            mean = sum(rmse for rmse, _, _ in errors[i].values()) / len(errors[i])
+            print('Variant %d (%s): %.2f km/h RMS error over all hours' % (
+                i, describe_variant(variant), mean))
+    if args.output:
+        write_csv(args.output, OUTPUT_COLUMNS, rows)
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
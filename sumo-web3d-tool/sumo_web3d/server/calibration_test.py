@@ -0,0 +1,117 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import os
+import tempfile
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_
+
+if not os.environ.get('SUMO_HOME'):
+    # constants.py, and so the calibration, can't be imported without it.
+    raise SkipTest('SUMO_HOME is not set')
+
+from .calibration import (  # noqa: E402
+    best_per_hour, edges_at, hourly_errors, read_observed, simulated_speeds)
+
+# 00:30 and 01:30 UTC on 2018-03-25, when Dublin's clocks went from 01:00 to 02:00.
+BEFORE_DST = 1521937800
+AFTER_DST = BEFORE_DST + 3600
+
+
+class FakeNode(object):
+    def __init__(self):
+        self.outgoing = []
+
+    def getOutgoing(self):
+        return self.outgoing
+
+
+class FakeEdge(object):
+    def __init__(self, edge_id, from_node, to_node, allowed=('passenger',)):
+        self.id = edge_id
+        self.from_node = from_node
+        self.to_node = to_node
+        self.allowed = allowed
+        from_node.outgoing.append(self)
+
+    def getID(self):
+        return self.id
+
+    def getFromNode(self):
+        return self.from_node
+
+    def getToNode(self):
+        return self.to_node
+
+    def allows(self, vclass):
+        return vclass in self.allowed
+
+
+class FakeNet(object):
+    def __init__(self, neighbors):
+        self.neighbors = neighbors
+
+    def convertLonLat2XY(self, lon, lat):
+        return lon, lat
+
+    def getNeighboringEdges(self, x, y, r):
+        return [(edge, dist) for edge, dist in self.neighbors if dist < r]
+
+
+def test_edges_at():
+    a, b, c = FakeNode(), FakeNode(), FakeNode()
+    path = FakeEdge('path', a, b, allowed=('pedestrian', 'bicycle'))
+    north = FakeEdge('north', a, b)
+    south = FakeEdge('south', b, a)
+    FakeEdge('side', b, c)
+    net = FakeNet([(path, 0.5), (north, 2), (south, 5)])
+    # The nearest road cars may use, and the one the other way.
+    eq_(['north', 'south'], edges_at(net, 0, 0, radius=10))
+    eq_(['south', 'north'], edges_at(FakeNet([(south, 5)]), 0, 0, radius=10))
+    eq_([], edges_at(net, 0, 0, radius=1))
+
+
+def test_read_observed():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'tomtom.tsv')
+        with open(path, 'w') as f:
+            f.write('timestamp\tmain_street\tThe_Mall\n')
+            f.write('%d\t30\t0\n' % BEFORE_DST)
+            f.write('%d\t40\tNULL\n' % BEFORE_DST)
+            f.write('%d\t50\t20\n' % AFTER_DST)
+        eq_({
+            'Main_Street': {0: (35, 2), 2: (50, 1)},
+            'The_Mall': {2: (20, 1)},
+        }, read_observed(path, roads=['Main_Street', 'The_Mall', 'The_Avenue']))
+
+        path = os.path.join(tmp, 'tomtom.csv')
+        with open(path, 'w') as f:
+            f.write('timestamp,Main_Street\n%d,30\n' % BEFORE_DST)
+        eq_({'Main_Street': {0: (30, 1)}}, read_observed(path, timezone='UTC'))
+
+
+def test_simulated_speeds():
+    rows = [
+        {'edge': 'a', 'speed': 10, 'sampledSeconds': 300},
+        {'edge': 'b', 'speed': 5, 'sampledSeconds': 100},
+        {'edge': 'c', 'speed': None, 'sampledSeconds': 0},
+    ]
+    road_edges = {'Main_Street': ['a', 'b'], 'The_Mall': ['c'], 'The_Avenue': ['d']}
+    free_flow = {'Main_Street': 50, 'The_Mall': 30, 'The_Avenue': 60}
+    speeds = simulated_speeds(rows, road_edges, free_flow)
+    eq_(31.5, round(speeds['Main_Street'], 6))
+    eq_(30, speeds['The_Mall'])
+    eq_(60, speeds['The_Avenue'])
+
+
+def test_best_per_hour():
+    observed = {'Main_Street': {8: (20, 4), 12: (40, 2)}, 'The_Mall': {8: (30, 4)}}
+    slow = hourly_errors({'Main_Street': 23, 'The_Mall': 26}, observed)
+    eq_((3.536, 2, 8), (round(slow[8][0], 3), slow[8][1], slow[8][2]))
+    fast = hourly_errors({'Main_Street': 40, 'The_Mall': 50}, observed)
+    grid = [{'scale': 2}, {'scale': 0.5}, {'scale': 1}]
+    eq_([
+        {'hour': 8, 'variant': 0, 'scale': 2, 'speedFactor': None, 'rmseKmh': 3.54,
+         'roads': 2, 'observations': 8},
+        {'hour': 12, 'variant': 1, 'scale': 0.5, 'speedFactor': None, 'rmseKmh': 0.0,
+         'roads': 1, 'observations': 2},
+    ], best_per_hour(grid, [slow, fast, None]))
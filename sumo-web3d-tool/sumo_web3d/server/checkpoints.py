@@ -0,0 +1,129 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Warm-start checkpoints: SUMO saved states of a scenario some way into its simulation.
+
+A scenario starts with an empty network that takes a while to fill up with traffic,
+and every start (and every sweep variant) would otherwise sit through that again. A
+checkpoint is the state SUMO saves (simulation.saveState, or --save-state.* on the
+command line) after warm_secs simulated seconds. Later starts load it instead
+(simulation.loadState or --load-state) and carry on from there, exactly as if they
+had simulated the warm-up; vehicles which departed during it come from the state
+rather than the route files.
+
+Checkpoints are kept in a directory, named by a hash of everything the state depends
+on: the contents of the scenario's .sumocfg and the network, route and additional
+files it loads, the extra SUMO arguments, the warm-up time and the SUMO version.
+Changing any of them simply means a new checkpoint, made on the next start.
+"""
+import functools
+import hashlib
+import os
+import subprocess
+from xml.etree import ElementTree
+
+from .scenario_cache import file_hash, partial_path
+import sumolib
+
+CHECKPOINT_VERSION = 1
+STATE_SUFFIX = '.state.xml.gz'
+# The .sumocfg options naming files a simulation's state depends on.
+SOURCE_OPTIONS = ('net-file', 'route-files', 'additional-files')
+
+_hashes = {}  # (path, mtime, size) -> SHA-1, so that starting doesn't hash big networks.
+
+
+def checkpoint_dir(cache_dir):
+    return os.path.join(cache_dir, 'checkpoints')
+
+
+def config_sources(config_file, options=SOURCE_OPTIONS):
+    """The .sumocfg and the absolute paths of the files it names under options."""
+    config_dir = os.path.dirname(os.path.abspath(config_file))
+    root = ElementTree.parse(config_file).getroot()
+    sources = [os.path.abspath(config_file)]
+    for option in options:
+        el = root.find('.//%s' % option)
+        if el is not None and el.get('value'):
+            sources += [os.path.join(config_dir, path.strip())
+                        for path in el.get('value').split(',')]
+    return sources
+
+
+def _source_hash(path):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _hashes:
+        _hashes[key] = file_hash(path)
+    return _hashes[key]
+
+
+@functools.lru_cache()
+def sumo_version():
+    """The first line of `sumo --version`: states don't carry over between versions."""
+    result = subprocess.run([sumolib.checkBinary('sumo'), '--version'],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return result.stdout.decode('utf-8', 'replace').split('\n')[0].strip()
+
+
+def checkpoint_key(sources, warm_secs, sumo_args=()):
+    """A hash of the contents of sources, the warm-up time and the SUMO arguments."""
+    digest = hashlib.sha1()
+    parts = [str(CHECKPOINT_VERSION), sumo_version(), repr(float(warm_secs))]
+    parts += [_source_hash(path) for path in sources]
+    parts += list(sumo_args)
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class CheckpointCache(object):
+    """Finds and stores warm-start checkpoints in cache_dir (or nowhere if None).
+
+    Without a cache_dir there is nowhere to keep states, so every start warms up.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def path(self, sources, warm_secs, sumo_args=()):
+        """Where the checkpoint for these inputs is or would be, or None if uncached."""
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir,
+                            checkpoint_key(sources, warm_secs, sumo_args) + STATE_SUFFIX)
+
+    def find(self, sources, warm_secs, sumo_args=()):
+        """The path of an existing checkpoint for these inputs, else None."""
+        path = self.path(sources, warm_secs, sumo_args)
+        return path if path and os.path.exists(path) else None
+
+    def temp_path(self, path):
+        """Where to write a checkpoint before moving it to path with commit().
+
+        A new file each time: sessions are threads of one process, so warming up the same
+        scenario twice at once mustn't mean saving both states to the same place.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return partial_path(path, STATE_SUFFIX)
+
+    def commit(self, temp_path, path):
+        # Whole files only: several sessions or sweep processes may warm up at once.
+        os.replace(temp_path, path)
+
+
+def warm_start(connection, checkpoints, sources, warm_secs, sumo_args=()):
+    """Bring a freshly started simulation to warm_secs, from a checkpoint if there is one.
+
+    Otherwise simulate the warm-up and save it as the checkpoint for next time. Returns
+    True if a checkpoint was loaded.
+    """
+    path = checkpoints.path(sources, warm_secs, sumo_args)
+    if path and os.path.exists(path):
+        connection.simulation.loadState(path)
+        return True
+    connection.simulationStep(warm_secs)
+    if path:
+        temp_path = checkpoints.temp_path(path)
+        connection.simulation.saveState(temp_path)
+        checkpoints.commit(temp_path, path)
+    return False
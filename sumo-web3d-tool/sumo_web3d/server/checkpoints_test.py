@@ -0,0 +1,118 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import os
+import tempfile
+import threading
+
+from nose.plugins.skip import SkipTest
+from nose.tools import eq_, ok_
+
+if not os.environ.get('SUMO_HOME'):
+    # Checkpoint keys include the version of sumo, which needs SUMO_HOME to find.
+    raise SkipTest('SUMO_HOME is not set')
+
+from .checkpoints import (  # noqa: E402
+    CheckpointCache, checkpoint_key, config_sources, warm_start)
+
+
+def write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+class FakeSimulation(object):
+    def __init__(self, connection):
+        self.connection = connection
+
+    def saveState(self, path):
+        write(path, '<snapshot time="%g"/>' % self.connection.time)
+
+    def loadState(self, path):
+        with open(path) as f:
+            self.connection.loaded = f.read()
+
+
+class FakeConnection(object):
+    def __init__(self, simulation=FakeSimulation):
+        self.time = 0
+        self.loaded = None
+        self.simulation = simulation(self)
+
+    def simulationStep(self, time):
+        self.time = time
+
+
+def test_config_sources():
+    with tempfile.TemporaryDirectory() as tmp:
+        config = os.path.join(tmp, 'test.sumocfg')
+        write(config, '<configuration><input>'
+                      '<net-file value="net.xml"/>'
+                      '<route-files value="a.rou.xml, b.rou.xml"/>'
+                      '</input></configuration>')
+        eq_([config, os.path.join(tmp, 'net.xml'), os.path.join(tmp, 'a.rou.xml'),
+             os.path.join(tmp, 'b.rou.xml')], config_sources(config))
+        eq_([config, os.path.join(tmp, 'net.xml')], config_sources(config, ('net-file',)))
+
+
+def test_checkpoint_key():
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'net.xml')
+        write(source, '<net/>')
+        key = checkpoint_key([source], 600)
+        eq_(key, checkpoint_key([source], 600.0))
+        ok_(key != checkpoint_key([source], 300))
+        ok_(key != checkpoint_key([source], 600, ['--scale', '2']))
+        write(source, '<net version="2"/>')
+        ok_(key != checkpoint_key([source], 600))
+
+
+def test_warm_start_saves_then_loads():
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'net.xml')
+        write(source, '<net/>')
+        checkpoints = CheckpointCache(os.path.join(tmp, 'checkpoints'))
+
+        first = FakeConnection()
+        ok_(not warm_start(first, checkpoints, [source], 600))
+        eq_(600, first.time)
+        path = checkpoints.find([source], 600)
+        eq_([os.path.basename(path)], os.listdir(os.path.join(tmp, 'checkpoints')))
+
+        second = FakeConnection()
+        ok_(warm_start(second, checkpoints, [source], 600))
+        eq_(0, second.time)
+        eq_('<snapshot time="600"/>', second.loaded)
+
+        # Without a cache directory, every start warms up.
+        third = FakeConnection()
+        ok_(not warm_start(third, CheckpointCache(None), [source], 600))
+        eq_(600, third.time)
+
+
+def test_overlapping_warm_ups():
+    saved = threading.Barrier(2, timeout=5)
+
+    class SlowSimulation(FakeSimulation):
+        def saveState(self, path):
+            super(SlowSimulation, self).saveState(path)
+            saved.wait()  # Both states are saved before either is committed.
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'net.xml')
+        write(source, '<net/>')
+        checkpoints = CheckpointCache(os.path.join(tmp, 'checkpoints'))
+        errors = []
+
+        def warm_up():
+            try:
+                warm_start(FakeConnection(SlowSimulation), checkpoints, [source], 600)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=warm_up) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        eq_([], errors)
+        path = checkpoints.find([source], 600)
+        eq_([os.path.basename(path)], os.listdir(os.path.join(tmp, 'checkpoints')))
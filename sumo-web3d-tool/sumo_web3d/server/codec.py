@@ -0,0 +1,257 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Compact binary encoding of simulation snapshots.
+
+JSON snapshots repeat every key and the full vehicle ID in every update. Clients
+which open the websocket with ?format=binary get snapshots in this format instead,
+as binary websocket messages (state and error messages stay JSON):
+
+    header     u8 version, u8 flags (1 = keyframe), u16 zero, u32 meta length
+    meta       UTF-8 JSON of the snapshot without its vehicles (time, lights, ...)
+    strings    u32 count, then for each string: u16 length, UTF-8 bytes
+    creations  records, then u32[count] string indices of the new vehicles' IDs
+    updates    records
+    removals   u32 count, u32[count] handles
+
+Records are a u32 count, u32[count] handles and u16[count] field masks, followed by
+one column per entry in FIELDS. A column holds the values of the records whose mask
+has the field's bit set, in record order. Every part starts on a 4-byte boundary so
+that clients can read columns as typed arrays. Numbers are little-endian.
+
+Vehicles are referred to by integer handles, which are assigned when a vehicle is
+created (its creation carries the ID) and stay valid until its removal. Numbers are
+stored in fixed point, e.g. positions in centimeters and sizes in millimeters, with
+the lowest value of a signed column (the highest of an unsigned one) standing for
+NaN. String fields are indices into the frame's string table, 0xffffffff for None.
+"""
+import array
+import json
+import math
+import struct
+import sys
+
+VERSION = 1
+FLAG_KEYFRAME = 1
+
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+# (field, array typecode, fixed-point scale). A scale of None marks a string field.
+FIELDS = (
+    ('x', 'i', 100),
+    ('y', 'i', 100),
+    ('z', 'i', 100),
+    ('speed', 'h', 1),
+    ('angle', 'h', 1),
+    ('length', 'i', 1000),
+    ('width', 'i', 1000),
+    ('signals', 'H', 1),
+    ('type', 'I', None),
+    ('vClass', 'I', None),
+    ('person', 'I', None),
+)
+FIELD_BITS = {name: 1 << i for i, (name, _, _) in enumerate(FIELDS)}
+
+# Stands for NaN in numeric columns and None in string columns.
+MISSING = {'i': -2 ** 31, 'h': -2 ** 15, 'H': 2 ** 16 - 1, 'I': 2 ** 32 - 1}
+
+_SWAP_BYTES = sys.byteorder == 'big'
+
+
+class HandleAllocator(object):
+    """Assigns vehicles the integer handles which binary snapshots refer to them by.
+
+    update() returns the handles for one frame. That dict is never mutated afterwards,
+    so a Frame can hold on to it and encode itself, or a keyframe, later on.
+    """
+
+    def __init__(self):
+        self._handles = {}
+        self._removed = []
+        self._next = 0
+
+    def update(self, vehicles_delta):
+        creations = vehicles_delta['creations']
+        removals = vehicles_delta['removals']
+        if not (creations or removals or self._removed):
+            return self._handles
+        handles = dict(self._handles)
+        for veh_id in self._removed:
+            handles.pop(veh_id, None)
+        for veh_id in creations:
+            handles[veh_id] = self._next
+            self._next += 1
+        # Removed vehicles keep their handles for one more frame: the one removing them.
+        self._removed = list(removals)
+        self._handles = handles
+        return handles
+
+
+class _StringTable(object):
+    def __init__(self):
+        self.indices = {}
+        self.strings = []
+
+    def index(self, value):
+        if value is None:
+            return MISSING['I']
+        index = self.indices.get(value)
+        if index is None:
+            index = self.indices[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+class _Writer(object):
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+
+    def align(self):
+        padding = -self.size % 4
+        if padding:
+            self.write(b'\0' * padding)
+
+    def array(self, typecode, values):
+        values = array.array(typecode, values)
+        if _SWAP_BYTES:
+            values.byteswap()
+        self.write(values.tobytes())
+        self.align()
+
+    def getvalue(self):
+        return b''.join(self.parts)
+
+
+def _quantize(value, typecode, scale, strings):
+    if scale is None:
+        return strings.index(value)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return MISSING[typecode]
+    return int(round(value * scale))
+
+
+def _write_records(writer, records, handles, strings):
+    """Write (vehicle ID, fields) pairs. Fields which aren't in FIELDS are dropped."""
+    writer.write(struct.pack('<I', len(records)))
+    writer.array('I', [handles[veh_id] for veh_id, _ in records])
+    writer.array('H', [sum(FIELD_BITS.get(name, 0) for name in fields)
+                       for _, fields in records])
+    for name, typecode, scale in FIELDS:
+        writer.array(typecode, [_quantize(fields[name], typecode, scale, strings)
+                                for _, fields in records if name in fields])
+
+
+def encode_snapshot(snapshot, handles):
+    """Encode a snapshot message, given the handles of its vehicles (see HandleAllocator)."""
+    vehicles = snapshot['vehicles']
+    strings = _StringTable()
+    body = _Writer()
+    creations = list(vehicles['creations'].items())
+    _write_records(body, creations, handles, strings)
+    body.array('I', [strings.index(veh_id) for veh_id, _ in creations])
+    _write_records(body, list(vehicles['updates'].items()), handles, strings)
+    body.write(struct.pack('<I', len(vehicles['removals'])))
+    body.array('I', [handles[veh_id] for veh_id in vehicles['removals']])
+
+    meta = json.dumps({k: v for k, v in snapshot.items() if k != 'vehicles'}).encode('utf-8')
+    flags = FLAG_KEYFRAME if snapshot.get('keyframe') else 0
+    out = _Writer()
+    out.write(struct.pack('<BBHI', VERSION, flags, 0, len(meta)))
+    out.write(meta)
+    out.align()
+    out.write(struct.pack('<I', len(strings.strings)))
+    for string in strings.strings:
+        data = string.encode('utf-8')
+        out.write(struct.pack('<H', len(data)))
+        out.write(data)
+    out.align()
+    out.write(body.getvalue())
+    return out.getvalue()
+
+
+class _Reader(object):
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, fmt):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def bytes(self, length):
+        data = self.data[self.offset:self.offset + length].tobytes()
+        self.offset += length
+        return data
+
+    def align(self):
+        self.offset += -self.offset % 4
+
+    def array(self, typecode, count):
+        values = array.array(typecode)
+        values.frombytes(self.bytes(count * values.itemsize))
+        if _SWAP_BYTES:
+            values.byteswap()
+        self.align()
+        return values
+
+
+def _dequantize(value, typecode, scale, strings):
+    if scale is None:
+        return None if value == MISSING['I'] else strings[value]
+    if value == MISSING[typecode]:
+        return float('nan')
+    return value if scale == 1 else value / scale
+
+
+def _read_records(reader, strings):
+    count, = reader.unpack('<I')
+    handles = reader.array('I', count)
+    masks = reader.array('H', count)
+    records = [{} for _ in range(count)]
+    for name, typecode, scale in FIELDS:
+        bit = FIELD_BITS[name]
+        rows = [i for i, mask in enumerate(masks) if mask & bit]
+        for i, value in zip(rows, reader.array(typecode, len(rows))):
+            records[i][name] = _dequantize(value, typecode, scale, strings)
+    return handles, records
+
+
+def decode_snapshot(data, vehicle_ids):
+    """Decode a binary snapshot back into the JSON message's structure.
+
+    vehicle_ids maps handles to vehicle IDs and is updated with the frame's creations
+    and removals, so pass the same dict for every frame of a stream.
+    """
+    reader = _Reader(data)
+    version, flags, _, meta_length = reader.unpack('<BBHI')
+    if version != VERSION:
+        raise ValueError('Unsupported snapshot version %d' % version)
+    snapshot = json.loads(reader.bytes(meta_length).decode('utf-8'))
+    reader.align()
+    count, = reader.unpack('<I')
+    strings = []
+    for _ in range(count):
+        length, = reader.unpack('<H')
+        strings.append(reader.bytes(length).decode('utf-8'))
+    reader.align()
+
+    if flags & FLAG_KEYFRAME:
+        vehicle_ids.clear()
+    handles, records = _read_records(reader, strings)
+    creations = {}
+    for handle, index, record in zip(handles, reader.array('I', len(handles)), records):
+        vehicle_ids[handle] = strings[index]
+        creations[strings[index]] = record
+    handles, records = _read_records(reader, strings)
+    updates = {vehicle_ids[handle]: record for handle, record in zip(handles, records)}
+    count, = reader.unpack('<I')
+    removals = [vehicle_ids.pop(handle) for handle in reader.array('I', count)]
+
+    snapshot['vehicles'] = {'creations': creations, 'updates': updates, 'removals': removals}
+    return snapshot
@@ -0,0 +1,66 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import json
+import math
+
+from nose.tools import eq_, ok_
+
+from .codec import HandleAllocator, decode_snapshot, encode_snapshot
+from .deltas import diff_dicts
+
+CAR = {'x': 12.34, 'y': -5.6, 'z': 0.0, 'speed': 13, 'angle': 270, 'type': 'veh_passenger',
+       'length': 4.3, 'width': 1.8, 'signals': 8, 'vClass': 'passenger'}
+WALKER = {'x': 1.0, 'y': 2.0, 'z': 0, 'speed': 1, 'angle': 90, 'type': 'ped_pedestrian',
+          'length': 0.21, 'width': 0.48, 'person': '', 'vClass': 'pedestrian'}
+
+
+def make_snapshot(time, delta):
+    return {'type': 'snapshot', 'time': time, 'vehicles': delta,
+            'lights': {'creations': {'tl1': {'phase': 0, 'programID': '0'}},
+                       'updates': {}, 'removals': []},
+            'vehicle_counts': {'passenger': 1}}
+
+
+def test_round_trip():
+    allocator = HandleAllocator()
+    vehicle_ids = {}
+    frames = [
+        {},
+        {'car': CAR, 'walker': WALKER, 'bus ü': dict(CAR, type='bus')},
+        {'car': dict(CAR, x=12.5, speed=14), 'walker': WALKER, 'bus ü': dict(CAR, type='bus')},
+        {'car': dict(CAR, x=12.5, speed=14), 'new': dict(CAR, signals=0)},
+    ]
+    for time, (before, after) in enumerate(zip(frames, frames[1:])):
+        delta = diff_dicts(before, after)
+        snapshot = make_snapshot(time, delta)
+        data = encode_snapshot(snapshot, allocator.update(delta))
+        eq_(snapshot, decode_snapshot(data, vehicle_ids))
+    eq_({'car', 'new'}, set(vehicle_ids.values()))
+    # Handles are never reused within a simulation.
+    handles = allocator.update({'creations': {}, 'removals': []})
+    eq_({'car': 0, 'new': 3}, handles)
+
+
+def test_keyframe_and_nan():
+    allocator = HandleAllocator()
+    vehicles = {'car': dict(CAR, z=float('nan'), vClass=None)}
+    delta = diff_dicts({}, vehicles)
+    handles = allocator.update(delta)
+    snapshot = make_snapshot(1, delta)
+    snapshot['keyframe'] = True
+    decoded = decode_snapshot(encode_snapshot(snapshot, handles), {7: 'stale'})
+    car = decoded['vehicles']['creations']['car']
+    ok_(math.isnan(car['z']))
+    eq_(None, car['vClass'])
+    eq_(12.34, car['x'])
+    ok_(decoded['keyframe'])
+
+
+def test_smaller_than_json():
+    allocator = HandleAllocator()
+    before = {'veh%d' % i: dict(CAR, x=float(i)) for i in range(500)}
+    after = {'veh%d' % i: dict(CAR, x=i + 1.5, angle=90) for i in range(500)}
+    allocator.update(diff_dicts({}, before))
+    delta = diff_dicts(before, after)
+    snapshot = make_snapshot(2, delta)
+    binary = encode_snapshot(snapshot, allocator.update(delta))
+    ok_(len(binary) * 2 < len(json.dumps(snapshot)))
@@ -60,3 +60,42 @@ def diff_dicts(before, after):
             creations[k] = v
 
     return {'creations': creations, 'updates': update, 'removals': deleted_keys}
+
+
+def apply_delta(objects, delta):
+    """Apply a delta from diff_dicts to the dict it was computed against. Mutates objects."""
+    for k in delta['removals']:
+        objects.pop(k, None)
+    for k, v in delta['updates'].items():
+        objects[k] = dict(objects[k], **v)
+    objects.update(delta['creations'])
+    return objects
+
+
+def merge_deltas(first, second):
+    """Combine two consecutive deltas into one with the same effect as applying both.
+
+    Returns None if they can't be combined, which is when second re-creates a key
+    that first removed: clients apply creations before removals.
+    """
+    if any(k in second['creations'] for k in first['removals']):
+        return None
+    creations = dict(first['creations'])
+    updates = dict(first['updates'])
+    removals = list(first['removals'])
+    for k, v in second['updates'].items():
+        if k in creations:
+            creations[k] = dict(creations[k], **v)
+        elif k in updates:
+            updates[k] = dict(updates[k], **v)
+        else:
+            updates[k] = v
+    for k in second['removals']:
+        if k in creations:
+            # Created and removed in between: the client never needs to know.
+            del creations[k]
+        else:
+            updates.pop(k, None)
+            removals.append(k)
+    creations.update(second['creations'])
+    return {'creations': creations, 'updates': updates, 'removals': removals}
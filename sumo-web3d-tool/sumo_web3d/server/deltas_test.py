@@ -1,7 +1,7 @@
 # Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
 from nose.tools import eq_
 
-from .deltas import diff, round_vehicles, diff_dicts
+from .deltas import apply_delta, diff, diff_dicts, merge_deltas, round_vehicles
 
 
 def test_diff():
@@ -9,6 +9,35 @@ def test_diff():
     eq_({}, diff({'x': 'a', 'y': 1}, {'x': 'a', 'y': 1}))
 
 
+def test_apply_delta():
+    before = {'veh1': {'x': 1, 'y': 2}, 'veh2': {'x': 3, 'y': 4}}
+    after = {'veh1': {'x': 5, 'y': 2}, 'veh3': {'x': 6, 'y': 7}}
+    eq_(after, apply_delta(dict(before), diff_dicts(before, after)))
+    # The objects in before are not mutated.
+    eq_({'x': 1, 'y': 2}, before['veh1'])
+
+
+def test_merge_deltas():
+    states = [
+        {'veh1': {'x': 1, 'y': 1}, 'veh2': {'x': 2, 'y': 2}},
+        {'veh1': {'x': 3, 'y': 1}, 'veh3': {'x': 4, 'y': 4}},
+        {'veh1': {'x': 3, 'y': 5}, 'veh3': {'x': 6, 'y': 4}, 'veh4': {'x': 7, 'y': 7}},
+        {'veh1': {'x': 8, 'y': 5}, 'veh4': {'x': 7, 'y': 9}},
+    ]
+    deltas = [diff_dicts(before, after) for before, after in zip(states, states[1:])]
+    merged = deltas[0]
+    for delta in deltas[1:]:
+        merged = merge_deltas(merged, delta)
+    eq_(states[-1], apply_delta(dict(states[0]), merged))
+    # veh3 came and went in between, so the merged delta doesn't mention it.
+    eq_({'veh4': {'x': 7, 'y': 9}}, merged['creations'])
+    eq_(['veh2'], merged['removals'])
+
+    # A removal followed by a re-creation of the same key can't be merged.
+    removed = diff_dicts(states[0], {'veh1': {'x': 1, 'y': 1}})
+    eq_(None, merge_deltas(removed, diff_dicts({'veh1': {'x': 1, 'y': 1}}, states[0])))
+
+
 def test_round_vehicles():
     vehicles = {
         'veh1': {
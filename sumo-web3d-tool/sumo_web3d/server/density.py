@@ -0,0 +1,164 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Traffic density per grid cell, for clients which see too many vehicles to draw.
+
+Zoomed out over a city-scale network, a viewport holds far more vehicles than a
+browser can render, or a websocket carry, at interactive rates. Past a threshold
+(see viewport.ViewportFilter), such a client is sent a heatmap instead: for each
+cell of a square grid over the network, how many vehicles are in it, their mean
+speed and how much of its road is occupied.
+
+These come from the edge subscriptions (see server.subscribe_to_edges), not from
+the vehicles: every step, each normal edge's vehicle count, mean speed and occupancy
+arrive with the step's reply. A DensityGrid works out once per scenario how much of
+each edge's length lies in which cell, so spreading the edges over the cells takes a
+few np.bincount calls however many vehicles there are. A cell gets the vehicles of
+its edges in proportion to how much of each edge it holds; its speed is the mean over
+those vehicles and its occupancy the mean over its length of road.
+"""
+import numpy as np
+
+DEFAULT_CELL_SIZE = 200  # meters
+# Edges are cut into pieces at most this fraction of a cell long, and each piece is
+# counted in the cell its middle is in.
+PIECES_PER_CELL = 4
+
+
+def parse_shape(shape):
+    """[(x, y), ...] from a SUMO shape attribute, e.g. '0.00,1.00 5.00,1.00'."""
+    return [tuple(float(v) for v in point.split(',')[:2]) for point in shape.split()]
+
+
+def edge_shapes(network):
+    """{edge ID: [(x, y), ...]} of a parsed network's normal edges (their first lane)."""
+    shapes = {}
+    for edge in network['net'].get('edge', []):
+        if edge.get('function') == 'internal':
+            continue
+        lanes = edge['lane']
+        lane = lanes[0] if isinstance(lanes, list) else lanes
+        shapes[edge['id']] = parse_shape(lane['shape'])
+    return shapes
+
+
+class Density(object):
+    """The vehicles, mean speed (m/s) and occupancy (0-1) of the cells with traffic."""
+
+    def __init__(self, cell_size, columns, rows, vehicles, speed, occupancy):
+        self.cell_size = cell_size
+        self.columns = columns
+        self.rows = rows
+        self.vehicles = vehicles
+        self.speed = speed
+        self.occupancy = occupancy
+
+    def count(self, bounds):
+        """About how many vehicles are in bounds: those of the cells overlapping it."""
+        return float(self.vehicles[self._overlapping(bounds)].sum())
+
+    def to_dict(self, bounds=None):
+        """The cells overlapping bounds ([xmin, ymin, xmax, ymax], or all if None).
+
+        Cell (column, row) spans cellSize meters from (column * cellSize, row * cellSize).
+        """
+        keep = slice(None) if bounds is None else self._overlapping(bounds)
+        return {
+            'cellSize': self.cell_size,
+            'columns': self.columns[keep].tolist(),
+            'rows': self.rows[keep].tolist(),
+            'vehicles': np.round(self.vehicles[keep], 1).tolist(),
+            'speed': np.round(self.speed[keep], 1).tolist(),
+            'occupancy': np.round(self.occupancy[keep], 3).tolist(),
+        }
+
+    def _overlapping(self, bounds):
+        xmin, ymin, xmax, ymax = bounds
+        size = self.cell_size
+        return np.flatnonzero(
+            ((self.columns + 1) * size >= xmin) & (self.columns * size <= xmax) &
+            ((self.rows + 1) * size >= ymin) & (self.rows * size <= ymax))
+
+
+class DensityGrid(object):
+    """Spreads per-edge values over the cells of a grid.
+
+    shapes maps edge IDs to their [(x, y), ...] shapes, e.g. from edge_shapes.
+    columns and rows are the cells which any edge passes through.
+    """
+
+    def __init__(self, shapes, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._rows = {}  # edge ID -> index, as in columns passed to aggregate
+        self._edge_ids = None
+        self._edge_rows = None
+        x0, y0, x1, y1, edges = [], [], [], [], []
+        for edge_id, shape in shapes.items():
+            row = self._rows.setdefault(edge_id, len(self._rows))
+            for (ax, ay), (bx, by) in zip(shape, shape[1:]):
+                x0.append(ax)
+                y0.append(ay)
+                x1.append(bx)
+                y1.append(by)
+                edges.append(row)
+        x0, y0, x1, y1 = [np.asarray(v, dtype=float) for v in (x0, y0, x1, y1)]
+        edges = np.asarray(edges, dtype=np.int64)
+        lengths = np.hypot(x1 - x0, y1 - y0)
+
+        # Cut the segments into pieces and find the cell of each piece's middle.
+        counts = np.maximum(np.ceil(lengths * PIECES_PER_CELL / cell_size), 1).astype(np.int64)
+        segment = np.repeat(np.arange(len(lengths)), counts)
+        first = np.cumsum(counts) - counts
+        t = (np.arange(len(segment)) - first[segment] + 0.5) / counts[segment]
+        x = x0[segment] + t * (x1 - x0)[segment]
+        y = y0[segment] + t * (y1 - y0)[segment]
+        columns = np.floor(x / cell_size).astype(np.int64)
+        rows = np.floor(y / cell_size).astype(np.int64)
+
+        # One (edge, cell) pair per cell an edge passes through, with its length there.
+        cells, cell_index = np.unique(np.stack([columns, rows], axis=1), axis=0,
+                                      return_inverse=True)
+        cell_index = cell_index.reshape(-1)
+        stride = max(len(cells), 1)
+        pairs, pair_index = np.unique(edges[segment] * stride + cell_index, return_inverse=True)
+        pair_index = pair_index.reshape(-1)
+        self._lengths = np.bincount(pair_index, (lengths / counts)[segment], len(pairs))
+        self._edges = pairs // stride
+        self._cells = pairs % stride
+        edge_lengths = np.bincount(edges, lengths, len(self._rows))
+        self._weights = self._lengths / np.maximum(edge_lengths[self._edges], 1e-9)
+        self._cell_lengths = np.bincount(self._cells, self._lengths, len(cells))
+        self.columns = cells[:, 0]
+        self.rows = cells[:, 1]
+
+    @classmethod
+    def from_network(cls, network, cell_size=DEFAULT_CELL_SIZE):
+        """The grid for a parsed network, e.g. server.Scenario.network."""
+        return cls(edge_shapes(network), cell_size)
+
+    def aggregate(self, edge_ids, columns):
+        """The Density of one step's edge values.
+
+        columns maps 'vehicles', 'speed' and 'occupancy' to lists lined up with
+        edge_ids, as built by server.density_columns.
+        """
+        if edge_ids != self._edge_ids:
+            self._edge_ids = list(edge_ids)
+            # Where each of the grid's edges is in edge_ids (the last slot, zero, if absent).
+            self._edge_rows = np.full(len(self._rows), len(edge_ids), dtype=np.int64)
+            for i, edge_id in enumerate(edge_ids):
+                row = self._rows.get(edge_id)
+                if row is not None:
+                    self._edge_rows[row] = i
+        num_cells = len(self.columns)
+        picks = self._edge_rows[self._edges]
+
+        def per_pair(name):
+            return np.append(np.asarray(columns[name], dtype=float), 0)[picks]
+
+        vehicles = per_pair('vehicles') * self._weights
+        cell_vehicles = np.bincount(self._cells, vehicles, num_cells)
+        speed_sums = np.bincount(self._cells, vehicles * per_pair('speed'), num_cells)
+        occupied = np.bincount(self._cells, self._lengths * per_pair('occupancy'), num_cells)
+        busy = np.flatnonzero(cell_vehicles > 0)
+        return Density(self.cell_size, self.columns[busy], self.rows[busy], cell_vehicles[busy],
+                       speed_sums[busy] / cell_vehicles[busy],
+                       occupied[busy] / np.maximum(self._cell_lengths[busy], 1e-9))
@@ -0,0 +1,40 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+from nose.tools import eq_
+
+from .density import DensityGrid, edge_shapes
+
+
+def columns(vehicles, speed, occupancy):
+    return {'vehicles': vehicles, 'speed': speed, 'occupancy': occupancy}
+
+
+def test_edge_shapes():
+    network = {'net': {'edge': [
+        {'id': ':j0_0', 'function': 'internal', 'lane': {'shape': '0.00,0.00 1.00,0.00'}},
+        {'id': 'a', 'lane': [{'shape': '0.00,0.00 10.00,0.00,1.50'},
+                             {'shape': '0.00,3.20 10.00,3.20'}]},
+        {'id': 'b', 'lane': {'shape': '10.00,0.00 10.00,20.00'}},
+    ]}}
+    eq_({'a': [(0, 0), (10, 0)], 'b': [(10, 0), (10, 20)]}, edge_shapes(network))
+
+
+def test_edges_are_spread_over_cells():
+    # a runs along two cells; b runs up through cell (0, 0), three quarters in it.
+    grid = DensityGrid({'a': [(0, 0), (400, 0)], 'b': [(100, 50), (100, 250)]}, cell_size=200)
+    # Results may come in any order, and with edges the grid doesn't know.
+    density = grid.aggregate(['b', 'a', 'c'], columns([2, 4, 9], [10, 5, 1], [0.5, 0.1, 1]))
+    eq_({
+        'cellSize': 200,
+        'columns': [0, 0, 1],
+        'rows': [0, 1, 0],
+        'vehicles': [3.5, 0.5, 2],
+        'speed': [7.1, 10, 5],  # Over the vehicles in the cell.
+        'occupancy': [0.271, 0.5, 0.1],  # Over the length of road in the cell.
+    }, density.to_dict())
+    eq_([1], density.to_dict((250, -10, 300, 10))['columns'])
+    eq_(2, density.count((250, -10, 300, 10)))
+
+    # Cells without vehicles are left out.
+    density = grid.aggregate(['a', 'b'], columns([0, 2], [13.9, 10], [0, 0.5]))
+    eq_([0, 0], density.to_dict()['columns'])
+    eq_([1.5, 0.5], density.to_dict()['vehicles'])
@@ -0,0 +1,93 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Per-edge emissions, noise and speed, averaged over a sliding window of simulated time.
+
+The server subscribes once to the KPIs of every normal edge (see
+server.subscribe_to_edges), so each step reads all of them with a single
+getAllSubscriptionResults call rather than asking about each vehicle. An
+EdgeKpiWindow keeps every step's values from the last `window_secs` simulated seconds
+along with their running sums, so adding a step and dropping the oldest one cost a
+couple of array operations no matter how long the window is.
+
+Every `interval_secs` simulated seconds, the window's means go out with the frame as
+its 'edgeKpis': one list per KPI, lined up with a list of edge IDs, for just the edges
+which saw traffic during the window. Noise is averaged by energy, as sound level
+meters do, and speed over the vehicles on the edge, since SUMO reports an empty edge's
+speed limit as its mean speed.
+"""
+import collections
+
+import numpy as np
+
+DEFAULT_WINDOW_SECS = 60
+DEFAULT_INTERVAL_SECS = 5
+
+# The columns of a step's values, as built by server.edge_kpi_columns.
+COLUMNS = ('co2', 'pmx', 'noise', 'speed', 'vehicles')
+# What the window sums up, per edge.
+_CO2, _PMX, _NOISE_ENERGY, _VEHICLE_SPEED, _VEHICLES = range(5)
+
+
+class EdgeKpiWindow(object):
+    """Sliding-window means of the KPIs of a fixed set of edges.
+
+    co2 and pmx are in mg/s, noise in dB(A), speed in m/s, as SUMO reports them.
+    """
+
+    def __init__(self, edge_ids, window_secs=DEFAULT_WINDOW_SECS,
+                 interval_secs=DEFAULT_INTERVAL_SECS):
+        self.edge_ids = list(edge_ids)
+        self.window_secs = window_secs
+        self.interval_secs = interval_secs
+        self._rows = {edge_id: row for row, edge_id in enumerate(self.edge_ids)}
+        self._samples = collections.deque()  # (time, values), oldest first.
+        self._sums = np.zeros((len(self.edge_ids), 5))
+        self._next_report = None
+
+    def add(self, time, edge_ids, columns):
+        """Add one step's values for edge_ids, at time (in seconds).
+
+        With several steps per frame, only the last one of each frame is added.
+        """
+        rows = [self._rows[edge_id] for edge_id in edge_ids]
+        vehicles = np.asarray(columns['vehicles'], dtype=float)
+        values = np.zeros_like(self._sums)
+        values[rows, _CO2] = columns['co2']
+        values[rows, _PMX] = columns['pmx']
+        values[rows, _NOISE_ENERGY] = 10 ** (np.asarray(columns['noise'], dtype=float) / 10)
+        values[rows, _VEHICLE_SPEED] = np.asarray(columns['speed'], dtype=float) * vehicles
+        values[rows, _VEHICLES] = vehicles
+        self._samples.append((time, values))
+        self._sums += values
+        while self._samples[0][0] <= time - self.window_secs:
+            self._sums -= self._samples.popleft()[1]
+
+    def report_if_due(self, time):
+        """The report, if interval_secs have passed since the last one, else None."""
+        if self._next_report is not None and time < self._next_report:
+            return None
+        self._next_report = time + self.interval_secs
+        return self.report()
+
+    def report(self):
+        """The window's means for the edges which had any vehicles on them."""
+        samples = len(self._samples)
+        # Adding and subtracting can leave rounding errors just below zero.
+        sums = np.maximum(self._sums, 0)
+        busy = np.flatnonzero(sums[:, _VEHICLES] > 0.5)
+        sums = sums[busy]
+        vehicles = sums[:, _VEHICLES]
+
+        def column(values, decimals):
+            return np.round(values, decimals).tolist()
+
+        return {
+            'windowSecs': self.window_secs,
+            'samples': samples,
+            'ids': [self.edge_ids[row] for row in busy.tolist()],
+            'co2': column(sums[:, _CO2] / max(samples, 1), 1),
+            'pmx': column(sums[:, _PMX] / max(samples, 1), 3),
+            'noise': column(
+                10 * np.log10(np.maximum(sums[:, _NOISE_ENERGY] / max(samples, 1), 1)), 1),
+            'speed': column(sums[:, _VEHICLE_SPEED] / np.maximum(vehicles, 1), 2),
+            'vehicles': column(vehicles / max(samples, 1), 2),
+        }
@@ -0,0 +1,44 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import json
+
+from nose.tools import eq_
+
+from .edge_kpis import EdgeKpiWindow
+
+
+def step(co2, noise, speed, vehicles, pmx=0):
+    return {'co2': co2, 'pmx': [pmx] * len(co2), 'noise': noise, 'speed': speed,
+            'vehicles': vehicles}
+
+
+def test_sliding_window():
+    window = EdgeKpiWindow(['a', 'b', 'c'], window_secs=3, interval_secs=2)
+    # Edge c never has traffic, so it isn't reported.
+    window.add(1, ['a', 'b', 'c'], step([100, 0, 0], [60, 3, 3], [10, 13.9, 13.9], [2, 0, 0]))
+    window.add(2, ['a', 'b', 'c'], step([300, 50, 0], [70, 60, 3], [5, 8, 13.9], [2, 1, 0]))
+    report = json.loads(json.dumps(window.report()))
+    eq_(['a', 'b'], report['ids'])
+    eq_(2, report['samples'])
+    eq_([200, 25], report['co2'])
+    eq_([67.4, 57.0], report['noise'])  # By energy: louder steps count for more.
+    eq_([7.5, 8], report['speed'])  # b was empty in the first step, at its speed limit.
+    eq_([2, 0.5], report['vehicles'])
+
+    # The first step falls out of the window; results may come in any order.
+    window.add(3, ['c', 'b', 'a'], step([0, 50, 200], [3, 60, 3], [13.9, 8, 13.9], [0, 1, 0]))
+    window.add(4, ['c', 'b', 'a'], step([0, 50, 0], [3, 60, 3], [13.9, 8, 13.9], [0, 1, 0]))
+    report = window.report()
+    eq_(3, report['samples'])
+    eq_(['a', 'b'], report['ids'])
+    eq_([166.7, 50], report['co2'])
+    eq_([5, 8], report['speed'])
+    eq_([0.67, 1], report['vehicles'])
+
+
+def test_report_if_due():
+    window = EdgeKpiWindow(['a'], window_secs=10, interval_secs=5)
+    reports = []
+    for time in range(1, 13):
+        window.add(time, ['a'], step([1], [50], [10], [1]))
+        reports.append(window.report_if_due(time) is not None)
+    eq_([1, 6, 11], [time for time, due in zip(range(1, 13), reports) if due])
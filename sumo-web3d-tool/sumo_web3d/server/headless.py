@@ -0,0 +1,104 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Runs a scenario without a browser, as fast as SUMO allows, and records it.
+
+This is what `sumo-web3d --record FILE` does: it steps the same simulate_next_step
+that sessions use, but with no websocket and no delay between steps, and writes
+every frame to a recording (see recording.py) for playing back later.
+"""
+import itertools
+import time
+
+from .codec import HandleAllocator
+from .hub import Frame
+from .recording import RecordingWriter
+from .run_recorder import CLOSE_TIMEOUT_SECS
+from .vehicle_store import VehicleStore
+
+# The phases of a step which record() times, in order.
+PHASES = ('simulate', 'snapshot', 'encode', 'write')
+
+
+class HeadlessSession(object):
+    """Just enough of a sessions.Session to run a simulation without a worker or clients."""
+    _labels = itertools.count()
+
+    def __init__(self, scenario):
+        self.scenario = scenario
+        self.connection = None
+        self.contexts = None
+        self.vehicles = VehicleStore()
+        self.handles = HandleAllocator()
+        self.last_vehicles = {}
+        self.last_lights = {}
+        self.light_tracker = None  # lights.LightTracker, while SUMO is running.
+        self.person_sizes = {}  # vType -> (length, width), see server.person_type_sizes.
+        self.edge_kpis = None  # edge_kpis.EdgeKpiWindow, unless edge KPIs are off.
+        self.density = None  # density.DensityGrid, if clients may get densities.
+        self.run_recorder = None  # run_recorder.RunRecorder, with --record-db.
+
+    def next_label(self):
+        return 'headless-%d' % next(self._labels)
+
+
+class StepTimer(object):
+    """Adds up how long each phase of the steps took."""
+
+    def __init__(self):
+        self.steps = 0
+        self.totals = {phase: 0.0 for phase in PHASES}
+        self.start_secs = time.time()
+
+    def add(self, phase, secs):
+        self.totals[phase] += secs
+
+    def report(self):
+        elapsed = time.time() - self.start_secs
+        lines = ['%d steps in %.1fs: %.1f steps/s' % (
+            self.steps, elapsed, self.steps / elapsed if elapsed else 0)]
+        for phase in PHASES:
+            total = self.totals[phase]
+            lines.append('  %-9s %8.1fs %8.2fms/step %5.1f%%' % (
+                phase, total, 1000 * total / max(self.steps, 1),
+                100 * total / elapsed if elapsed else 0))
+        return '\n'.join(lines)
+
+
+def record(start_fn, step_fn, scenario, path, max_steps=None, keyframe_interval=None,
+           report_every=1000):
+    """Run scenario until it ends (or for max_steps) and record it to path.
+
+    start_fn and step_fn are server.start_sumo_executable and server.simulate_next_step,
+    the former with its backend and SUMO arguments bound. Returns the StepTimer.
+    """
+    session = HeadlessSession(scenario)
+    start_fn(session)
+    connection = session.connection
+    timer = StepTimer()
+    meta = {'scenario': scenario.name, 'recordedAt': time.time()}
+    kwargs = {'keyframe_interval': keyframe_interval} if keyframe_interval else {}
+    try:
+        with RecordingWriter(path, meta, **kwargs) as writer:
+            while max_steps is None or timer.steps < max_steps:
+                if connection.simulation.getMinExpectedNumber() <= 0:
+                    break
+                snapshot = step_fn(session)
+                snapshot['type'] = 'snapshot'
+                timer.add('simulate', snapshot['simulate_secs'])
+                timer.add('snapshot', snapshot['snapshot_secs'])
+
+                encode_start = time.time()
+                frame = Frame(snapshot, session.last_vehicles, session.last_lights)
+                write_start = time.time()
+                writer.write(frame)
+                timer.add('encode', write_start - encode_start)
+                timer.add('write', time.time() - write_start)
+                timer.steps += 1
+                if report_every and timer.steps % report_every == 0:
+                    print('%d steps, %d vehicles, %.1f MB recorded' % (
+                        timer.steps, len(session.vehicles), writer.size() / 1e6))
+    finally:
+        connection.close()
+        # Unlike the server's simulation thread, nothing else is waiting on this one.
+        if session.run_recorder and not session.run_recorder.close(CLOSE_TIMEOUT_SECS):
+            print('Gave up waiting for the database; the run is missing its last rows.')
+    return timer
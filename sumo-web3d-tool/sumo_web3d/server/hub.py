@@ -0,0 +1,267 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Fans one simulation out to many websocket viewers.
+
+The simulation is stepped once and each delta is encoded once, no matter how many
+browser tabs are watching. A client that joins mid-run first receives a keyframe
+(the full state as of the last broadcast delta) and then follows the deltas.
+
+Each subscriber gets either JSON text messages or the binary frames of codec.py,
+depending on what it negotiated when it connected; each frame is encoded at most
+once per format.
+
+Subscribers may also set a viewport (see viewport.py), after which they only get
+the vehicles inside it, encoded for them alone, or the traffic density there if
+there are too many of them.
+
+Frames reach each subscriber through its own streams.ClientStream, so a slow
+connection gets fewer, merged deltas instead of slowing down everybody else.
+
+One subscriber at a time is the owner, and only the owner may pause, resume,
+cancel or change the delay. Ownership passes to the longest-connected viewer when
+the owner leaves, and the simulation stops once nobody is watching.
+"""
+import asyncio
+import json
+
+from websockets.exceptions import ConnectionClosed
+
+from .codec import encode_snapshot
+from .streams import ClientStream
+from .viewport import SpatialGrid, ViewportFilter
+from .worker import STATUS_OFF
+
+ROLE_OWNER = 'owner'
+ROLE_VIEWER = 'viewer'
+
+
+class Frame(object):
+    """One simulation step: its snapshot delta plus the full state it leads to.
+
+    Frames are built on the worker thread, which also encodes the delta message.
+    vehicles, lights and handles (see codec.HandleAllocator; needed for binary
+    messages only) must not be mutated after the frame is created. density is the
+    density.Density of the step, for viewports in LOD, if anybody has a viewport.
+    """
+    __slots__ = ('snapshot', 'message', 'vehicles', 'lights', 'handles', 'density',
+                 '_binary', '_keyframe', '_binary_keyframe', '_grid')
+
+    def __init__(self, snapshot, vehicles, lights, handles=None, density=None):
+        self.snapshot = snapshot
+        self.message = json.dumps(snapshot)
+        self.vehicles = vehicles
+        self.lights = lights
+        self.handles = handles
+        self.density = density
+        self._binary = None
+        self._keyframe = None
+        self._binary_keyframe = None
+        self._grid = None
+
+    def binary(self):
+        """The delta message in the binary format of codec.py."""
+        if self._binary is None:
+            self._binary = encode_snapshot(self.snapshot, self.handles)
+        return self._binary
+
+    def keyframe(self):
+        """Encode the full state at this frame as a snapshot of creations only."""
+        if self._keyframe is None:
+            self._keyframe = json.dumps(self._keyframe_snapshot())
+        return self._keyframe
+
+    def binary_keyframe(self):
+        if self._binary_keyframe is None:
+            self._binary_keyframe = encode_snapshot(self._keyframe_snapshot(), self.handles)
+        return self._binary_keyframe
+
+    def grid(self):
+        """A viewport.SpatialGrid over the vehicles, for clients with a viewport."""
+        if self._grid is None:
+            self._grid = SpatialGrid.from_vehicles(self.vehicles)
+        return self._grid
+
+    def _keyframe_snapshot(self):
+        keyframe = dict(self.snapshot)
+        keyframe['vehicles'] = {'creations': dict(self.vehicles), 'updates': {}, 'removals': []}
+        keyframe['lights'] = {'creations': self.lights, 'updates': {}, 'removals': []}
+        keyframe['keyframe'] = True
+        return keyframe
+
+
+class SimulationHub(object):
+    """Broadcasts the frames of one SimulationWorker to its subscribers.
+
+    state_fn returns the shared part of the 'state' message, e.g. server.get_state.
+    target_fps caps how many frames per second each subscriber is sent; see streams.py.
+    Sends are timed by profiler (a profiling.StepProfiler), if given. Viewports with
+    more than lod_vehicles vehicles in view get the density instead (never if 0).
+    """
+
+    def __init__(self, worker, state_fn, target_fps=None, profiler=None, lod_vehicles=0):
+        self.worker = worker
+        self.state_fn = state_fn
+        self.target_fps = target_fps
+        self.profiler = profiler
+        self.lod_vehicles = lod_vehicles
+        self.subscribers = []  # In order of arrival, which decides the next owner.
+        self.binary = set()  # Subscribers which asked for binary frames.
+        self.viewports = {}  # websocket -> ViewportFilter, for subscribers with a viewport.
+        self.streams = {}  # websocket -> ClientStream, for every subscriber.
+        self.owner = None
+        self.last_frame = None
+        self._lock = asyncio.Lock()  # Keeps keyframes and deltas in order for joiners.
+        self._task = None
+        self._starting = None  # A future, while a start is waiting for the worker.
+
+    def role(self, websocket):
+        return ROLE_OWNER if websocket is self.owner else ROLE_VIEWER
+
+    def may_control(self, websocket):
+        return self.owner is None or websocket is self.owner
+
+    async def start(self, websocket, start_fn, binary=False):
+        """Start the simulation owned by websocket, or join the one already running.
+
+        Whoever calls while a start is still waiting for SUMO joins that start too,
+        rather than starting SUMO all over again.
+        """
+        async with self._lock:
+            starting = self._starting
+            starter = starting is None and self.worker.status == STATUS_OFF
+            if starter:
+                starting = self._starting = asyncio.get_event_loop().create_future()
+        if starter:
+            try:
+                if self._task:
+                    self._task.cancel()
+                await self.worker.start(start_fn)
+                self.last_frame = None
+                for viewport in self.viewports.values():
+                    viewport.visible = set()
+                self.owner = websocket
+                self._task = asyncio.ensure_future(self._broadcast_frames())
+                starting.set_result(None)
+            except asyncio.CancelledError:
+                starting.cancel()
+                raise
+            except Exception as e:
+                starting.set_exception(e)
+                starting.exception()  # Nobody need be waiting to hear about it.
+                raise
+            finally:
+                self._starting = None
+        elif starting is not None:
+            await asyncio.shield(starting)
+        await self.subscribe(websocket, binary)
+
+    async def subscribe(self, websocket, binary=False):
+        async with self._lock:
+            if websocket in self.subscribers:
+                return
+            if binary:
+                self.binary.add(websocket)
+            if self.last_frame and self.worker.status != STATUS_OFF:
+                viewport = self.viewports.get(websocket)
+                if viewport:
+                    await websocket.send(self._encode(
+                        viewport.keyframe(self.last_frame), self.last_frame, websocket))
+                elif binary:
+                    await websocket.send(self.last_frame.binary_keyframe())
+                else:
+                    await websocket.send(self.last_frame.keyframe())
+            self.streams[websocket] = ClientStream(
+                websocket, self._on_closed, binary, self.target_fps, self.profiler)
+            self.subscribers.append(websocket)
+            if self.owner is None:
+                self.owner = websocket
+
+    async def unsubscribe(self, websocket):
+        if websocket not in self.subscribers:
+            return
+        self.subscribers.remove(websocket)
+        self.streams.pop(websocket).close()
+        self.binary.discard(websocket)
+        self.viewports.pop(websocket, None)
+        if not self.subscribers:
+            self.owner = None
+            await self.stop()
+        elif websocket is self.owner:
+            self.owner = self.subscribers[0]
+            try:
+                await self.send_state(self.owner)
+            except ConnectionClosed:
+                pass  # The new owner's handler will unsubscribe it in turn.
+
+    async def set_viewport(self, websocket, bounds):
+        """Only send websocket the vehicles inside bounds, or everything again if None.
+
+        Subscribers get the vehicles which enter or leave their view right away (after
+        any frames still queued for them), rather than with the next frame, which may be
+        a while if the simulation is paused.
+        """
+        async with self._lock:
+            viewport = self.viewports.get(websocket)
+            subscribed = self.last_frame and websocket in self.subscribers
+            if viewport is None:
+                if bounds is None:
+                    return
+                # Until now, the client got every vehicle.
+                visible = self.last_frame.vehicles if subscribed else ()
+                viewport = self.viewports[websocket] = ViewportFilter(
+                    bounds, visible, self.lod_vehicles)
+            viewport.bounds = bounds
+            if subscribed:
+                self.streams[websocket].push(self.last_frame, viewport.refresh(self.last_frame))
+            if bounds is None:
+                del self.viewports[websocket]
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.last_frame = None
+        # Shielded so that TraCI is closed even if the caller is being cancelled.
+        await asyncio.shield(self.worker.cancel())
+
+    async def send_state(self, websocket, **extra):
+        message = self.state_message(websocket)
+        message.update(extra)
+        await websocket.send(json.dumps(message))
+
+    async def broadcast_state(self):
+        await self._send_all(lambda websocket: json.dumps(self.state_message(websocket)))
+
+    def state_message(self, websocket):
+        message = self.state_fn()
+        message['type'] = 'state'
+        message['role'] = self.role(websocket)
+        return message
+
+    async def _broadcast_frames(self):
+        while True:
+            frame = await self.worker.frames.get()
+            async with self._lock:
+                self.last_frame = frame
+                for websocket in self.subscribers:
+                    viewport = self.viewports.get(websocket)
+                    self.streams[websocket].push(frame, viewport and viewport.filter(frame))
+
+    def _encode(self, snapshot, frame, websocket):
+        """Encode a snapshot derived from frame, for websocket alone."""
+        if websocket in self.binary:
+            return encode_snapshot(snapshot, frame.handles)
+        return json.dumps(snapshot)
+
+    def _on_closed(self, websocket):
+        # Not awaited: unsubscribing cancels the websocket's stream, which may be the caller.
+        # The websocket's own handler will also notice; unsubscribe is idempotent.
+        asyncio.ensure_future(self.unsubscribe(websocket))
+
+    async def _send_all(self, message_fn):
+        subscribers = list(self.subscribers)
+        results = await asyncio.gather(
+            *[websocket.send(message_fn(websocket)) for websocket in subscribers],
+            return_exceptions=True)
+        for websocket, result in zip(subscribers, results):
+            if isinstance(result, ConnectionClosed):
+                self._on_closed(websocket)
@@ -0,0 +1,72 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import asyncio
+import json
+
+from nose.tools import eq_, ok_
+
+from .hub import Frame, SimulationHub, ROLE_OWNER, ROLE_VIEWER
+from .worker import STATUS_OFF, STATUS_RUNNING
+
+
+class FakeWorker(object):
+    def __init__(self):
+        self.status = STATUS_OFF
+        self.frames = asyncio.Queue()
+
+    async def start(self, start_fn):
+        self.status = STATUS_RUNNING
+
+    async def cancel(self):
+        self.status = STATUS_OFF
+
+
+class FakeWebsocket(object):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def make_frame(time, vehicles, delta):
+    return Frame({'type': 'snapshot', 'time': time, 'vehicles': delta, 'lights': {}},
+                 vehicles, {})
+
+
+def test_one_simulation_many_viewers():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    worker = FakeWorker()
+    hub = SimulationHub(worker, lambda: {'simulationStatus': worker.status})
+    owner, viewer = FakeWebsocket(), FakeWebsocket()
+
+    async def scenario():
+        await hub.start(owner, None)
+        await worker.frames.put(
+            make_frame(1, {'veh1': {'x': 1}}, {'creations': {'veh1': {'x': 1}}}))
+        await asyncio.sleep(0.01)  # Let the hub broadcast.
+        # A late joiner starts from a keyframe instead of restarting the simulation.
+        await hub.start(viewer, None)
+        await worker.frames.put(
+            make_frame(2, {'veh1': {'x': 2}}, {'updates': {'veh1': {'x': 2}}}))
+        await asyncio.sleep(0.01)  # Let the hub broadcast.
+
+        eq_(ROLE_OWNER, hub.role(owner))
+        eq_(ROLE_VIEWER, hub.role(viewer))
+        ok_(not hub.may_control(viewer))
+
+        # The owner leaves, so control passes to the viewer.
+        await hub.unsubscribe(owner)
+        eq_(ROLE_OWNER, hub.role(viewer))
+        await hub.unsubscribe(viewer)
+
+    loop.run_until_complete(scenario())
+    eq_([1, 2], [m['time'] for m in owner.sent])
+    keyframe, delta, state = viewer.sent
+    ok_(keyframe['keyframe'])
+    eq_({'veh1': {'x': 1}}, keyframe['vehicles']['creations'])
+    eq_({'updates': {'veh1': {'x': 2}}}, delta['vehicles'])
+    eq_(ROLE_OWNER, state['role'])
+    # Nobody is watching any more, so the simulation stopped.
+    eq_(STATUS_OFF, worker.status)
+    loop.close()
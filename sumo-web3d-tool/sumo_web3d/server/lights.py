@@ -0,0 +1,75 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Traffic light changes, looked at only when a light is due to switch.
+
+Lights keep their phase for many steps, so reading and diffing every light every
+step (as a diff_dicts of all of them would) is mostly wasted. The server subscribes
+to each light's phase, program and next switch time (see
+server.subscribe_to_lights); the results arrive with each step's reply, so they cost
+no extra round trips. A LightTracker keeps the lights in a heap by the time SUMO
+has scheduled their next switch, and each step only looks at the lights whose
+switch is due. Actuated lights reschedule their switch as traffic arrives, and are
+simply looked at again at the new time. That makes the per-step work proportional to
+the number of switches rather than to the number of lights.
+
+A program switched over TraCI or by a WAUT shows up when the light's phase next
+switches.
+"""
+import heapq
+
+import traci
+
+tc = traci.constants
+
+
+def light_to_dict(light):
+    """Extract relevant information from traci.trafficlights.getSubscriptionResults."""
+    return {
+        'phase': light[tc.TL_CURRENT_PHASE],
+        'programID': light[tc.TL_CURRENT_PROGRAM],
+    }
+
+
+class LightTracker(object):
+    """The state of every traffic light, updated from their subscription results."""
+
+    def __init__(self):
+        # id -> light_to_dict. Replaced rather than changed in place, since frames
+        # (see hub.Frame) keep the lights they were made with.
+        self.lights = {}
+        self._schedule = []  # (next switch in seconds, light ID) heap.
+
+    def update(self, time, results):
+        """The delta (as from deltas.diff_dicts) of the lights' state at time (seconds).
+
+        results maps light IDs to their subscription results, as from
+        traci.trafficlight.getAllSubscriptionResults.
+        """
+        if not self.lights:
+            return self._start(results)
+        due = []
+        while self._schedule and self._schedule[0][0] <= time:
+            due.append(heapq.heappop(self._schedule)[1])
+        updates = {}
+        for light_id in due:
+            result = results[light_id]
+            light = light_to_dict(result)
+            before = self.lights[light_id]
+            changed = {k: v for k, v in light.items() if before[k] != v}
+            if changed:
+                updates[light_id] = changed
+            # Lights which haven't switched yet (e.g. SUMO runs their switch later in
+            # the step) come up again next step.
+            heapq.heappush(self._schedule, (result[tc.TL_NEXT_SWITCH], light_id))
+        if updates:
+            lights = dict(self.lights)
+            for light_id, changed in updates.items():
+                lights[light_id] = dict(lights[light_id], **changed)
+            self.lights = lights
+        return {'creations': {}, 'updates': updates, 'removals': []}
+
+    def _start(self, results):
+        self.lights = {light_id: light_to_dict(result) for light_id, result in results.items()}
+        self._schedule = [(result[tc.TL_NEXT_SWITCH], light_id)
+                          for light_id, result in results.items()]
+        heapq.heapify(self._schedule)
+        return {'creations': self.lights, 'updates': {}, 'removals': []}
@@ -0,0 +1,45 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+from nose.tools import eq_, ok_
+
+from .lights import LightTracker, tc
+
+
+def result(phase, next_switch, program='0'):
+    return {tc.TL_CURRENT_PHASE: phase, tc.TL_CURRENT_PROGRAM: program,
+            tc.TL_NEXT_SWITCH: next_switch}
+
+
+def test_first_update_creates_every_light():
+    tracker = LightTracker()
+    delta = tracker.update(0, {'a': result(0, 30), 'b': result(2, 5)})
+    eq_({'a': {'phase': 0, 'programID': '0'}, 'b': {'phase': 2, 'programID': '0'}},
+        delta['creations'])
+    eq_(delta['creations'], tracker.lights)
+
+
+def test_only_due_lights_are_read():
+    tracker = LightTracker()
+    tracker.update(0, {'a': result(0, 30), 'b': result(2, 5)})
+    first = tracker.lights
+
+    # Nothing is due, so not even a changed result gets looked at.
+    eq_({'creations': {}, 'updates': {}, 'removals': []},
+        tracker.update(4, {'a': result(1, 30), 'b': result(2, 5)}))
+    ok_(tracker.lights is first)
+
+    eq_({'b': {'phase': 3}}, tracker.update(5, {'a': result(0, 30), 'b': result(3, 9)})['updates'])
+    # Frames keep the lights they were made with.
+    eq_({'phase': 2, 'programID': '0'}, first['b'])
+    eq_({'phase': 3, 'programID': '0'}, tracker.lights['b'])
+
+    # An actuated light which extends its phase is looked at again at the new time.
+    eq_({}, tracker.update(9, {'a': result(0, 30), 'b': result(3, 12)})['updates'])
+    eq_({'b': {'phase': 4, 'programID': '1'}},
+        tracker.update(20, {'a': result(0, 30), 'b': result(4, 40, program='1')})['updates'])
+
+
+def test_light_which_has_not_switched_yet_comes_up_again():
+    tracker = LightTracker()
+    tracker.update(0, {'a': result(0, 5)})
+    eq_({}, tracker.update(5, {'a': result(0, 5)})['updates'])
+    eq_({'a': {'phase': 1}}, tracker.update(6, {'a': result(1, 20)})['updates'])
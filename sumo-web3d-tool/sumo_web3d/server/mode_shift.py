@@ -0,0 +1,109 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Replaces a share of one vehicle type with another, e.g. cars with bikes.
+
+The vehicles to replace are picked from the last step's VehicleState, whose types
+come from the vehicle subscriptions, so choosing them costs no TraCI calls. Each
+chosen vehicle is swapped for a new one of the target type which departs from
+where it is and follows the rest of its route. Everything runs in one call on the
+worker thread, between two steps, so the whole shift shows up in a single frame.
+
+Where each chosen vehicle is on its route comes from a subscription to just that
+vehicle, which TraCI answers right away, so reading it costs one round trip (plus
+one to unsubscribe) rather than one per value.
+"""
+import itertools
+import logging
+import random
+
+import traci
+
+tc = traci.constants
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FROM_TYPE = 'veh_passenger'
+DEFAULT_TO_TYPE = 'bike_bicycle'
+
+# What replace_vehicle needs to know about a vehicle.
+TRACI_ROUTE_CONSTANTS = [tc.VAR_EDGES, tc.VAR_ROUTE_INDEX, tc.VAR_ROAD_ID, tc.VAR_LANEPOSITION]
+
+# Numbers the routes replace_vehicle adds. SUMO can't remove a route, so one left over
+# from a failed replacement would otherwise stop the vehicle from ever being replaced.
+_route_numbers = itertools.count()
+
+
+def parse_mode_shift(msg):
+    """Validate a modeShift action. Returns (from_type, to_type, count, percent, seed).
+
+    Exactly one of count and percent is set.
+    """
+    count, percent = msg.get('count'), msg.get('percent')
+    if (count is None) == (percent is None):
+        raise ValueError('modeShift needs either a count or a percent')
+    # bool is an int too, but true isn't a count.
+    if count is not None and (isinstance(count, bool) or not isinstance(count, int) or
+                              count < 0):
+        raise ValueError('count must be a non-negative integer')
+    if percent is not None and (isinstance(percent, bool) or
+                                not (isinstance(percent, (int, float)) and
+                                     0 <= percent <= 100)):
+        raise ValueError('percent must be between 0 and 100')
+    from_type = msg.get('fromType', DEFAULT_FROM_TYPE)
+    to_type = msg.get('toType', DEFAULT_TO_TYPE)
+    return from_type, to_type, count, percent, msg.get('seed')
+
+
+def choose_vehicles(candidates, count=None, percent=None, rng=random):
+    """Pick count of the candidates, or percent of them (rounded), at random."""
+    if count is None:
+        count = int(round(len(candidates) * percent / 100))
+    return rng.sample(sorted(candidates), min(count, len(candidates)))
+
+
+def replace_vehicle(connection, veh_id, to_type):
+    """Swap veh_id for a new vehicle of to_type on the rest of its route. Returns its ID."""
+    vehicle = connection.vehicle
+    vehicle.subscribe(veh_id, TRACI_ROUTE_CONSTANTS)
+    try:
+        route = vehicle.getSubscriptionResults(veh_id)
+    finally:
+        # libsumo fails the next step if a subscribed vehicle has gone.
+        vehicle.unsubscribe(veh_id)
+    edges = list(route[tc.VAR_EDGES])[max(route[tc.VAR_ROUTE_INDEX], 0):]
+    # On a junction, the vehicle isn't on the first edge of what's left of its route.
+    on_route = edges and route[tc.VAR_ROAD_ID] == edges[0]
+    depart_pos = str(route[tc.VAR_LANEPOSITION]) if on_route else 'base'
+    new_id = '%s_%s' % (to_type, veh_id)
+    route_id = '%s_route%d' % (new_id, next(_route_numbers))
+    connection.route.add(route_id, edges)
+    vehicle.add(new_id, route_id, typeID=to_type, departPos=depart_pos)
+    vehicle.remove(veh_id)
+    return new_id
+
+
+def shift_mode(connection, vehicles, from_type, to_type, count=None, percent=None, seed=None):
+    """Replace vehicles of from_type with ones of to_type. Runs on the worker thread.
+
+    vehicles is the last step's VehicleState ({} before the first step). Returns a
+    summary for the client.
+    """
+    candidates = vehicles.ids_of_type(from_type) if vehicles else []
+    chosen = choose_vehicles(candidates, count, percent, random.Random(seed))
+    added, failed = [], []
+    for veh_id in chosen:
+        try:
+            added.append(replace_vehicle(connection, veh_id, to_type))
+        except Exception as e:
+            # E.g. to_type may not use some edge on the route.
+            logger.warning('Could not replace %s with a %s: %s', veh_id, to_type, e)
+            failed.append(veh_id)
+    logger.info('Replaced %d of %d %s vehicles with %s', len(added), len(candidates),
+                from_type, to_type)
+    return {
+        'fromType': from_type,
+        'toType': to_type,
+        'candidates': len(candidates),
+        'replaced': len(added),
+        'failed': failed,
+        'added': added,
+    }
@@ -0,0 +1,112 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+from nose.tools import assert_raises, eq_, ok_
+
+from .mode_shift import parse_mode_shift, shift_mode, tc
+from .vehicle_store import VehicleStore
+
+
+class FakeVehicleDomain(object):
+    def __init__(self, routes):
+        self.routes = routes  # vehicle ID -> (route edges, route index)
+        self.added = {}
+        self.removed = []
+        self.subscribed = set()
+        self.refused_types = {'tram'}
+
+    def subscribe(self, veh_id, variables):
+        self.subscribed.add(veh_id)
+
+    def unsubscribe(self, veh_id):
+        self.subscribed.remove(veh_id)
+
+    def getSubscriptionResults(self, veh_id):
+        edges, index = self.routes[veh_id]
+        return {tc.VAR_EDGES: tuple(edges), tc.VAR_ROUTE_INDEX: index,
+                tc.VAR_ROAD_ID: edges[index], tc.VAR_LANEPOSITION: 12.5}
+
+    def add(self, veh_id, route_id, typeID, departPos):
+        if typeID in self.refused_types:
+            raise ValueError('No tracks')
+        self.added[veh_id] = (route_id, typeID, departPos)
+
+    def remove(self, veh_id):
+        self.removed.append(veh_id)
+
+
+class FakeRouteDomain(object):
+    def __init__(self):
+        self.routes = {}
+
+    def add(self, route_id, edges):
+        if route_id in self.routes:
+            raise ValueError('The route %s already exists' % route_id)
+        self.routes[route_id] = edges
+
+
+class FakeConnection(object):
+    def __init__(self, routes):
+        self.vehicle = FakeVehicleDomain(routes)
+        self.route = FakeRouteDomain()
+
+
+def make_state():
+    store = VehicleStore()
+    ids = ['car%d' % i for i in range(10)] + ['bus0', 'walker0']
+    types = ['veh_passenger'] * 10 + ['bus_bus', 'veh_passenger']
+    classes = ['passenger'] * 10 + ['bus', 'pedestrian']
+    store.update([(ids, {'type': types, 'vClass': classes})])
+    return store.state()
+
+
+def test_shift_mode():
+    routes = {'car%d' % i: (['a', 'b', 'c'], i % 3) for i in range(10)}
+    connection = FakeConnection(routes)
+    result = shift_mode(connection, make_state(), 'veh_passenger', 'bike_bicycle',
+                        percent=50, seed=1)
+    # The person of type veh_passenger isn't a candidate.
+    eq_(10, result['candidates'])
+    eq_(5, result['replaced'])
+    eq_(5, len(connection.vehicle.removed))
+    for car in connection.vehicle.removed:
+        bike = 'bike_bicycle_' + car
+        ok_(bike in result['added'])
+        route_id, vtype, depart_pos = connection.vehicle.added[bike]
+        eq_('bike_bicycle', vtype)
+        eq_('12.5', depart_pos)
+        # The bike takes over the rest of the car's route.
+        edges, index = routes[car]
+        eq_(edges[index:], connection.route.routes[route_id])
+    eq_(set(), connection.vehicle.subscribed)
+
+
+def test_failed_replacements_keep_the_vehicle():
+    connection = FakeConnection({'car%d' % i: (['a'], 0) for i in range(10)})
+    result = shift_mode(connection, make_state(), 'veh_passenger', 'tram', count=3)
+    eq_(0, result['replaced'])
+    eq_(3, len(result['failed']))
+    eq_([], connection.vehicle.removed)
+    eq_(0, shift_mode(connection, {}, 'veh_passenger', 'bike_bicycle', count=3)['candidates'])
+
+    # The routes added for the failed replacements don't get in the way of the next try.
+    connection.vehicle.refused_types = set()
+    result = shift_mode(connection, make_state(), 'veh_passenger', 'tram', count=3)
+    eq_(3, result['replaced'])
+    eq_([], result['failed'])
+
+
+def test_vehicles_that_have_gone_stay_unsubscribed():
+    connection = FakeConnection({})  # No routes: reading them fails.
+    result = shift_mode(connection, make_state(), 'veh_passenger', 'bike_bicycle', count=2)
+    eq_(2, len(result['failed']))
+    eq_(set(), connection.vehicle.subscribed)
+
+
+def test_parse_mode_shift():
+    eq_(('veh_passenger', 'bike_bicycle', None, 25, None),
+        parse_mode_shift({'action': 'modeShift', 'percent': 25}))
+    assert_raises(ValueError, lambda: parse_mode_shift({'count': 1, 'percent': 2}))
+    assert_raises(ValueError, lambda: parse_mode_shift({}))
+    assert_raises(ValueError, lambda: parse_mode_shift({'count': -1}))
+    assert_raises(ValueError, lambda: parse_mode_shift({'percent': 150}))
+    assert_raises(ValueError, lambda: parse_mode_shift({'count': True}))
+    assert_raises(ValueError, lambda: parse_mode_shift({'percent': False}))
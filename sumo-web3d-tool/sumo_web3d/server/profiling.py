@@ -0,0 +1,132 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Where the time of each simulation step goes, served on /metrics.
+
+Each step is split into the phases in PHASES, timed with a PhaseTimer on the worker
+thread; sends to clients are timed by their streams.ClientStream. A StepProfiler
+keeps the last `window` samples of every phase along with the number of vehicles at
+the time, and summarizes them on demand: percentiles, a histogram, each phase's
+share of the step, and how its time grows with the vehicle count. The phase with the
+largest share is what limits steps per second.
+"""
+import bisect
+import collections
+import threading
+import time
+
+import numpy as np
+
+# In the order they happen. 'send' is per message rather than per step.
+PHASES = (
+    'step',  # TraCI simulationStep, as many times as the frame has steps
+    'subscriptions',  # reading the vehicle and person context subscriptions
+    'person_types',  # looking up the sizes of new person types
+    'columns',  # turning subscription results into VehicleStore columns
+    'diff',  # rounding and diffing vehicles (VehicleStore.update)
+    'lights',  # reading the traffic lights due to switch (see lights.py)
+    'edges',  # reading and averaging edge KPIs (see edge_kpis.py), if enabled
+    'handles',  # allocating binary handles (codec.HandleAllocator)
+    'density',  # spreading edges over the density grid (see density.py), if needed
+    'json',  # encoding the JSON message
+    'binary',  # encoding the binary message, if anybody asked for it
+    'grid',  # building the viewport grid, if anybody set a viewport
+    'send',  # one websocket send
+)
+STEP_PHASES = PHASES[:-1]
+
+DEFAULT_WINDOW = 1000  # samples per phase
+# Upper bounds of the histogram buckets, in milliseconds. The last bucket is unbounded.
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class PhaseTimer(object):
+    """Times the consecutive phases of one step: call mark(phase) as each one ends."""
+
+    def __init__(self):
+        self.phases = {}
+        self._last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        self._last = now
+
+
+def histogram(secs):
+    """[[bucket upper bound in ms (None for the last), count], ...]."""
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for s in secs:
+        counts[bisect.bisect_left(BUCKETS_MS, 1000 * s)] += 1
+    return [[bound, count] for bound, count in zip(BUCKETS_MS + (None,), counts)]
+
+
+def summarize(samples):
+    """Statistics for a list of (seconds, vehicle count) samples."""
+    secs = np.array([s for s, _ in samples], dtype=float)
+    vehicles = np.array([v for _, v in samples], dtype=float)
+    p50, p90, p99 = np.percentile(secs, [50, 90, 99]) * 1000
+    summary = {
+        'count': len(secs),
+        'meanMs': round(1000 * secs.mean(), 3),
+        'p50Ms': round(p50, 3),
+        'p90Ms': round(p90, 3),
+        'p99Ms': round(p99, 3),
+        'maxMs': round(1000 * secs.max(), 3),
+        'histogram': histogram(secs),
+        'vehicleCorrelation': None,
+        'msPer1000Vehicles': None,
+    }
+    if len(secs) > 2 and np.ptp(vehicles) > 0 and np.ptp(secs) > 0:
+        summary['vehicleCorrelation'] = round(float(np.corrcoef(vehicles, secs)[0, 1]), 3)
+        slope = np.polyfit(vehicles, secs, 1)[0]
+        summary['msPer1000Vehicles'] = round(1e6 * float(slope), 3)
+    return summary
+
+
+class StepProfiler(object):
+    """Rolling per-phase timings of one simulation.
+
+    Samples are added on the worker thread (and by streams on the event loop) and read
+    by the /metrics route, hence the lock.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.steps = 0
+        self.samples = {phase: collections.deque(maxlen=window) for phase in PHASES}
+        self._frames = collections.deque(maxlen=window)  # (time, steps) of each frame.
+        self._lock = threading.Lock()
+
+    def add_step(self, phases, vehicles, steps=1):
+        """Add a PhaseTimer's phases for a frame which advanced the simulation by steps."""
+        with self._lock:
+            for phase, secs in phases.items():
+                self.samples[phase].append((secs, vehicles))
+            self._frames.append((time.monotonic(), steps))
+            self.steps += steps
+
+    def add(self, phase, secs, vehicles):
+        with self._lock:
+            self.samples[phase].append((secs, vehicles))
+
+    def report(self):
+        with self._lock:
+            samples = {phase: list(s) for phase, s in self.samples.items() if s}
+            frames = list(self._frames)
+            steps = self.steps
+        phases = {phase: summarize(s) for phase, s in samples.items()}
+        totals = {phase: sum(secs for secs, _ in samples[phase])
+                  for phase in STEP_PHASES if phase in samples}
+        step_total = sum(totals.values())
+        for phase, total in totals.items():
+            phases[phase]['share'] = round(total / step_total, 3) if step_total else 0
+        steps_per_sec = None
+        if len(frames) > 1 and frames[-1][0] > frames[0][0]:
+            steps_per_sec = round(sum(n for _, n in frames[1:]) /
+                                  (frames[-1][0] - frames[0][0]), 1)
+        return {
+            'steps': steps,
+            'window': self.window,
+            'stepsPerSec': steps_per_sec,
+            'bottleneck': max(totals, key=totals.get) if totals else None,
+            'phases': phases,
+        }
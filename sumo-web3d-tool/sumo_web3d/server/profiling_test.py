@@ -0,0 +1,36 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import json
+
+from nose.tools import eq_, ok_
+
+from .profiling import PhaseTimer, StepProfiler
+
+
+def test_report():
+    profiler = StepProfiler(window=100)
+    for i in range(150):
+        vehicles = 100 * (i + 1)
+        # Diffing grows with the vehicle count, stepping doesn't.
+        profiler.add_step({'step': 0.002, 'diff': vehicles * 1e-6}, vehicles)
+    profiler.add('send', 0.0005, 1000)
+
+    report = json.loads(json.dumps(profiler.report()))
+    eq_(150, report['steps'])
+    eq_('diff', report['bottleneck'])
+    diff = report['phases']['diff']
+    eq_(100, diff['count'])  # Only the last window of samples counts.
+    ok_(diff['vehicleCorrelation'] > 0.99)
+    ok_(abs(diff['msPer1000Vehicles'] - 1) < 1e-6)
+    eq_(None, report['phases']['step']['vehicleCorrelation'])
+    eq_(100, sum(count for _, count in report['phases']['step']['histogram']))
+    ok_(abs(report['phases']['step']['share'] + diff['share'] - 1) < 0.01)
+    ok_('share' not in report['phases']['send'])
+
+
+def test_phase_timer():
+    timer = PhaseTimer()
+    timer.mark('step')
+    timer.mark('diff')
+    timer.mark('step')
+    eq_(['step', 'diff'], list(timer.phases))
+    ok_(all(secs >= 0 for secs in timer.phases.values()))
@@ -0,0 +1,198 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Recordings of a simulation's snapshot stream, for playing it back without SUMO.
+
+A recording holds the same JSON snapshot messages that websocket clients receive,
+grouped into chunks. Each chunk starts with a keyframe (the full state at its first
+step, see hub.Frame.keyframe) followed by the deltas of its steps, including the
+first, one message per line, and is zlib-compressed on its own. Readers start from
+a keyframe and then follow the deltas, across chunks. An index at the end of the file holds
+each step's simulation time and each chunk's location, so a reader can jump to any
+time with two binary searches and by decompressing a single chunk:
+
+    header  8s magic, u32 version, u32 meta length, meta (UTF-8 JSON)
+    chunks  zlib-compressed, newline-separated messages
+    index   UTF-8 JSON: {"steps": n, "times": [time of each step, ...],
+                         "chunks": [[first step, time, offset, length], ...]}
+    footer  u64 index offset, u32 index length, 8s magic
+
+Numbers are little-endian. Recordings are written to a temporary file which only
+replaces the destination once it is complete, and is deleted if writing stops short
+(e.g. SUMO exits with an error).
+"""
+import bisect
+import functools
+import json
+import mmap
+import os
+import struct
+import zlib
+
+from .deltas import apply_delta
+
+MAGIC = b'SW3DREC\n'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+FOOTER = struct.Struct('<QI8s')
+
+DEFAULT_KEYFRAME_INTERVAL = 100  # steps
+CHUNK_CACHE_SIZE = 16  # decompressed chunks per Recording
+
+
+class RecordingError(Exception):
+    pass
+
+
+class RecordingWriter(object):
+    """Writes hub.Frames to a recording, one per step.
+
+    meta is stored in the header, e.g. the scenario's name.
+    """
+
+    def __init__(self, path, meta, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 compress_level=6):
+        if keyframe_interval < 1:
+            raise ValueError('keyframe_interval must be at least 1')
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.compress_level = compress_level
+        self.steps = 0
+        self.times = []
+        self.chunks = []  # [first step, time, offset, length]
+        self._messages = []
+        self._temp_path = path + '.partial'
+        self._file = open(self._temp_path, 'wb')
+        meta = json.dumps(dict(meta, keyframeInterval=keyframe_interval)).encode('utf-8')
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(meta)))
+        self._file.write(meta)
+
+    def write(self, frame):
+        if self.steps % self.keyframe_interval == 0:
+            self._flush()
+            self.chunks.append([self.steps, frame.snapshot['time'], None, None])
+            self._messages.append(frame.keyframe())
+        self._messages.append(frame.message)
+        self.times.append(frame.snapshot['time'])
+        self.steps += 1
+
+    def _flush(self):
+        if not self._messages:
+            return
+        data = zlib.compress('\n'.join(self._messages).encode('utf-8'), self.compress_level)
+        self.chunks[-1][2:] = [self._file.tell(), len(data)]
+        self._file.write(data)
+        self._messages = []
+
+    def close(self):
+        """Write the index and move the recording into place."""
+        if self._file.closed:
+            return
+        self._flush()
+        index = json.dumps({
+            'steps': self.steps, 'times': self.times, 'chunks': self.chunks}).encode('utf-8')
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        """Delete the unfinished recording, leaving the destination as it was."""
+        if self._file.closed:
+            return
+        self._file.close()
+        os.remove(self._temp_path)
+
+    def size(self):
+        """Bytes written so far."""
+        return self._file.tell()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class Recording(object):
+    """Reads a recording written by RecordingWriter.
+
+    The file is memory-mapped, so any number of readers (e.g. one per replay viewer)
+    can share one Recording, and recently used chunks are kept decompressed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file.
+                raise RecordingError('%s is not a recording' % path)
+        data = self._data
+        if len(data) < HEADER.size + FOOTER.size:
+            raise RecordingError('%s is not a recording' % path)
+        magic, version, meta_length = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise RecordingError('%s is not a recording' % path)
+        if version != VERSION:
+            raise RecordingError('Unsupported recording version %d' % version)
+        self.meta = json.loads(data[HEADER.size:HEADER.size + meta_length].decode('utf-8'))
+        index_offset, index_length, magic = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+        if magic != MAGIC:
+            raise RecordingError('%s is truncated' % path)
+        index = json.loads(data[index_offset:index_offset + index_length].decode('utf-8'))
+        self.steps = index['steps']
+        self.times = index['times']
+        self.chunks = index['chunks']
+        self._first_steps = [chunk[0] for chunk in self.chunks]
+        self.read_chunk = functools.lru_cache(maxsize=CHUNK_CACHE_SIZE)(self._read_chunk)
+
+    def __len__(self):
+        return self.steps
+
+    def close(self):
+        self._data.close()
+
+    def step_at(self, time):
+        """The last step at or before time, or the first step if time precedes it."""
+        return max(bisect.bisect_right(self.times, time) - 1, 0)
+
+    def _read_chunk(self, i):
+        """The messages of the i-th chunk: its keyframe, then a delta for each step."""
+        _, _, offset, length = self.chunks[i]
+        return zlib.decompress(self._data[offset:offset + length]).decode('utf-8').split('\n')
+
+    def messages(self, start=0):
+        """Yield (step, message) pairs, starting with a keyframe for step start."""
+        if not 0 <= start < self.steps:
+            return
+        i = bisect.bisect_right(self._first_steps, start) - 1
+        messages = self.read_chunk(i)
+        # messages[k + 1] is the delta for step first_step + k.
+        first_step = self.chunks[i][0]
+        if start == first_step:
+            yield start, messages[0]
+        else:
+            # Fold the deltas up to start into the keyframe, so that clients get one message.
+            yield start, _fold(messages[0], messages[2:start - first_step + 2])
+        for step, message in enumerate(messages[start - first_step + 2:], start + 1):
+            yield step, message
+        for i in range(i + 1, len(self.chunks)):
+            for step, message in enumerate(self.read_chunk(i)[1:], self.chunks[i][0]):
+                yield step, message
+
+
+def _fold(keyframe, deltas):
+    """Apply delta messages to the keyframe which precedes them; return the new keyframe."""
+    keyframe = json.loads(keyframe)
+    vehicles = keyframe['vehicles']['creations']
+    lights = keyframe['lights']['creations']
+    for message in deltas:
+        snapshot = json.loads(message)
+        apply_delta(vehicles, snapshot['vehicles'])
+        apply_delta(lights, snapshot['lights'])
+        keyframe.update({k: v for k, v in snapshot.items() if k not in ('vehicles', 'lights')})
+    keyframe['keyframe'] = True
+    return json.dumps(keyframe)
@@ -0,0 +1,108 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_raises, eq_, ok_
+
+from .deltas import diff_dicts
+from .hub import Frame
+from .recording import Recording, RecordingError, RecordingWriter
+
+
+def make_states(num_steps):
+    """Vehicle states where vehicles come, move along and go."""
+    states = []
+    for step in range(num_steps):
+        states.append({'veh%d' % i: {'x': float(step - i), 'y': 1.0, 'speed': i}
+                       for i in range(max(0, step - 3), step + 1)})
+    return states
+
+
+def write_recording(path, states, keyframe_interval):
+    lights = {'tl1': {'phase': 0, 'programID': '0'}}
+    with RecordingWriter(path, {'scenario': 'test'}, keyframe_interval) as writer:
+        before = {}
+        for step, vehicles in enumerate(states):
+            snapshot = {'type': 'snapshot', 'time': step * 1000,
+                        'vehicles': diff_dicts(before, vehicles),
+                        'lights': diff_dicts(lights if step else {}, lights)}
+            writer.write(Frame(snapshot, vehicles, lights))
+            before = vehicles
+
+
+def replay(messages):
+    """Apply a stream of (step, message) pairs, returning the vehicles at each step."""
+    states = {}
+    vehicles = {}
+    for step, message in messages:
+        snapshot = json.loads(message)
+        if snapshot.get('keyframe'):
+            vehicles = {}
+        delta = snapshot['vehicles']
+        for veh_id in delta['removals']:
+            del vehicles[veh_id]
+        for veh_id, update in delta['updates'].items():
+            vehicles[veh_id] = dict(vehicles[veh_id], **update)
+        vehicles.update(delta['creations'])
+        eq_(step * 1000, snapshot['time'])
+        states[step] = dict(vehicles)
+    return states
+
+
+def test_round_trip_and_seek():
+    states = make_states(25)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'test.rec')
+        write_recording(path, states, keyframe_interval=10)
+        ok_(not os.path.exists(path + '.partial'))
+
+        recording = Recording(path)
+        eq_(25, len(recording))
+        eq_('test', recording.meta['scenario'])
+        eq_([0, 10, 20], [chunk[0] for chunk in recording.chunks])
+
+        messages = list(recording.messages())
+        eq_(dict(enumerate(states)), replay(messages))
+        # Only the first message is a keyframe; playback continues across chunks with deltas.
+        eq_([0], [step for step, message in messages if json.loads(message).get('keyframe')])
+        # Seeking to the middle of a chunk starts with a keyframe for that step.
+        for start in (7, 10, 24):
+            messages = list(recording.messages(start))
+            ok_(json.loads(messages[0][1])['keyframe'])
+            eq_({step: states[step] for step in range(start, 25)}, replay(messages))
+        eq_([], list(recording.messages(25)))
+
+        eq_(0, recording.step_at(-500))
+        eq_(7, recording.step_at(7000))
+        eq_(7, recording.step_at(7999))
+        eq_(24, recording.step_at(10 ** 9))
+        recording.close()
+
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 1)
+        with assert_raises(RecordingError):
+            Recording(path)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_failed_recording_leaves_the_destination_alone():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'test.rec')
+        write_recording(path, make_states(5), keyframe_interval=10)
+        size = os.path.getsize(path)
+        with assert_raises(RuntimeError):
+            with RecordingWriter(path, {'scenario': 'test'}) as writer:
+                writer.write(Frame({'type': 'snapshot', 'time': 0, 'vehicles': {}}, {}, {}))
+                raise RuntimeError('SUMO exited')
+        eq_(size, os.path.getsize(path))
+        recording = Recording(path)
+        eq_(5, len(recording))
+        recording.close()
+        eq_(['test.rec'], os.listdir(tmpdir))
+    finally:
+        shutil.rmtree(tmpdir)
@@ -0,0 +1,144 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Plays recordings (see recording.py) back to websocket clients instead of running SUMO.
+
+Every client gets its own ReplayPlayer, so viewers can watch, pause and seek
+independently, while they all share the one memory-mapped Recording. Messages are
+sent exactly as recorded: there is no simulation to step and nothing to re-encode.
+Replays are always JSON, whichever format a client asked for.
+"""
+import asyncio
+import json
+import math
+
+from .worker import DEFAULT_DELAY_MS, STATUS_OFF, STATUS_PAUSED, STATUS_RUNNING
+
+DEFAULT_SPEED = 1.0
+MIN_SPEED = 0.1
+MAX_SPEED = 100.0
+
+
+def describe_recording(recording, speed=DEFAULT_SPEED):
+    """The 'replay' field of 'state' messages."""
+    times = recording.times
+    return {
+        'startTime': times[0] if times else 0,
+        'endTime': times[-1] if times else 0,
+        'speed': speed,
+    }
+
+
+def parse_number(msg, key):
+    """msg[key] of a client's action, if it is a finite, non-negative number.
+
+    Raises ValueError otherwise, for the client to hear about.
+    """
+    value = msg.get(key)
+    if (isinstance(value, bool) or not isinstance(value, (int, float)) or
+            not math.isfinite(value) or value < 0):
+        raise ValueError('%s must be a non-negative number' % key)
+    return value
+
+
+class ReplayPlayer(object):
+    """Plays a Recording to one websocket.
+
+    Like a live simulation, playback sends a frame every delay_ms; speed divides that
+    delay, e.g. 2 plays twice as fast. state_fn returns the fields of 'state' messages
+    which don't depend on the player, e.g. the scenario.
+    """
+
+    def __init__(self, recording, websocket, state_fn, delay_ms=DEFAULT_DELAY_MS):
+        self.recording = recording
+        self.websocket = websocket
+        self.state_fn = state_fn
+        self.delay_ms = delay_ms
+        self.speed = DEFAULT_SPEED
+        self.status = STATUS_OFF
+        self.step = 0  # The next step to send.
+        self._task = None
+        self._resumed = asyncio.Event()
+
+    def start(self):
+        if self.status == STATUS_OFF:
+            self._play(0, STATUS_RUNNING)
+
+    def pause(self):
+        if self.status == STATUS_RUNNING:
+            self.status = STATUS_PAUSED
+            self._resumed.clear()
+
+    def resume(self):
+        if self.status != STATUS_PAUSED:
+            return
+        if self.step >= len(self.recording):
+            self._play(0, STATUS_RUNNING)
+        else:
+            self.status = STATUS_RUNNING
+            self._resumed.set()
+
+    async def cancel(self):
+        await self._stop()
+        self.status = STATUS_OFF
+        self.step = 0
+
+    def seek(self, time):
+        """Continue from the step at time, with a keyframe. Paused players stay paused."""
+        if self.status == STATUS_OFF:
+            return
+        self._play(self.recording.step_at(time), self.status)
+
+    def set_delay(self, delay_ms):
+        self.delay_ms = max(0, delay_ms)
+
+    def set_speed(self, speed):
+        self.speed = min(max(float(speed), MIN_SPEED), MAX_SPEED)
+
+    def describe(self):
+        """The replay fields of 'state' messages."""
+        return {
+            'simulationStatus': self.status,
+            'delayMs': self.delay_ms,
+            'replay': describe_recording(self.recording, self.speed),
+        }
+
+    def _play(self, step, status):
+        if self._task:
+            self._task.cancel()
+        self.step = step
+        self.status = status
+        self._resumed.clear()
+        self._task = asyncio.ensure_future(self._run(step))
+
+    async def _stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, start):
+        messages = self.recording.messages(start)
+        # Even a paused player shows the frame it was seeked to.
+        for step, message in messages:
+            await self.websocket.send(message)
+            self.step = step + 1
+            break
+        for step, message in messages:
+            await asyncio.sleep(self.delay_ms / self.speed / 1000)
+            if self.status != STATUS_RUNNING:
+                await self._resumed.wait()
+            await self.websocket.send(message)
+            self.step = step + 1
+        # Stay on the last frame; resuming starts over.
+        self.status = STATUS_PAUSED
+        await self.send_state()
+
+    async def send_state(self, **extra):
+        message = dict(self.state_fn(), type='state', **extra)
+        message.update(self.describe())
+        await self.websocket.send(json.dumps(message))
+
+    async def close(self):
+        await self._stop()
@@ -0,0 +1,76 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+
+from nose.tools import assert_raises, eq_, ok_
+
+from .recording import Recording
+from .recording_test import make_states, write_recording
+from .replay import ReplayPlayer, parse_number
+from .worker import STATUS_PAUSED
+
+
+class FakeWebsocket(object):
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    def snapshots(self):
+        return [m for m in self.sent if m['type'] == 'snapshot']
+
+
+def test_players_are_independent():
+    tmpdir = tempfile.mkdtemp()
+    loop = asyncio.new_event_loop()
+    try:
+        path = os.path.join(tmpdir, 'test.rec')
+        write_recording(path, make_states(25), keyframe_interval=10)
+        recording = Recording(path)
+
+        async def scenario():
+            a, b = FakeWebsocket(), FakeWebsocket()
+            player_a = ReplayPlayer(recording, a, lambda: {'scenario': 'test'}, delay_ms=0)
+            player_b = ReplayPlayer(recording, b, lambda: {'scenario': 'test'}, delay_ms=0)
+            player_a.start()
+            player_b.start()
+            player_b.pause()
+            for _ in range(100):
+                await asyncio.sleep(0)
+            # a played to the end and stopped on the last frame; b is still on the first.
+            eq_(list(range(0, 25000, 1000)), [m['time'] for m in a.snapshots()])
+            eq_(STATUS_PAUSED, player_a.status)
+            eq_({'scenario': 'test', 'type': 'state', 'simulationStatus': STATUS_PAUSED,
+                 'delayMs': 0, 'replay': {'startTime': 0, 'endTime': 24000, 'speed': 1.0}},
+                a.sent[-1])
+            eq_([0], [m['time'] for m in b.snapshots()])
+
+            # Seeking while paused sends a keyframe and stays paused.
+            player_b.seek(17500)
+            await asyncio.sleep(0.01)
+            last = b.snapshots()[-1]
+            eq_(17000, last['time'])
+            ok_(last['keyframe'])
+            eq_(['veh14', 'veh15', 'veh16', 'veh17'], sorted(last['vehicles']['creations']))
+            eq_(STATUS_PAUSED, player_b.status)
+            await player_a.close()
+            await player_b.close()
+
+        loop.run_until_complete(scenario())
+        recording.close()
+    finally:
+        loop.close()
+        shutil.rmtree(tmpdir)
+
+
+def test_parse_number():
+    eq_(2.5, parse_number({'speed': 2.5}, 'speed'))
+    eq_(0, parse_number({'time': 0}, 'time'))
+    for msg in ({}, {'time': None}, {'time': '10'}, {'time': -1}, {'time': float('nan')},
+                {'time': float('inf')}, {'time': True}):
+        with assert_raises(ValueError):
+            parse_number(msg, 'time')
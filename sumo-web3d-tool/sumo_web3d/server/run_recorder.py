@@ -0,0 +1,253 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Writes simulated runs to the analytics database, next to the real sensor data.
+
+With `sumo-web3d --record-db`, every simulation a session starts becomes a run: a
+row of sim_runs, plus one row of sim_edge_series per edge with traffic for every
+edge KPI report (see edge_kpis.py), i.e. the edge's speed, vehicles, CO2, PMx and
+noise averaged over the KPI window, every --edge-kpi-interval simulated seconds.
+Each row is stamped with the UNIX time its simulated time stands for, so that the
+Flask app can bucket it by hour just like the TomTom readings in the tomtom table.
+The run also stores which of its edges lie under the TomTom points (sim_run_roads,
+see calibration.map_points), which is what the app compares them by.
+
+The simulation thread only hands the reports to a queue. A RunRecorder's own thread
+turns them into rows and writes them with one executemany per batch, so a slow or
+unreachable database never holds up a step: if the queue fills up, reports are
+dropped and counted instead. Nor does closing a RunRecorder wait for its thread,
+unless asked to. The tables are in Data/TableCreationSQL.txt.
+
+The database is the one Data/Scraper.py writes to, given by the same DB_HOST,
+DB_PORT, DB_USER, DB_PASSWORD and DB_NAME environment variables. Talking to it
+needs PyMySQL, which comes with `pip install sumo-web3d[database]`.
+"""
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+
+try:
+    import pymysql
+except ImportError:
+    pymysql = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DATABASE = 'bikehood'
+DEFAULT_TIMEZONE = 'Europe/Dublin'  # As calibration.DEFAULT_TIMEZONE.
+BATCH_ROWS = 5000  # Rows per executemany.
+FLUSH_SECS = 2.0  # The longest rows wait for a batch to fill up.
+MAX_PENDING_REPORTS = 1000
+CLOSE_TIMEOUT_SECS = 60.0  # How long a headless run waits for its last rows.
+
+INSERT_RUN = (
+    'INSERT INTO sim_runs (scenario, started_at, start_ts, window_secs, interval_secs, '
+    'sumo_args) VALUES (%s, %s, %s, %s, %s, %s)')
+INSERT_ROADS = 'INSERT INTO sim_run_roads (run_id, road, edge_id) VALUES (%s, %s, %s)'
+INSERT_SERIES = (
+    'INSERT INTO sim_edge_series (run_id, timestamp, sim_time, edge_id, speed, vehicles, '
+    'co2, pmx, noise) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)')
+FINISH_RUN = (
+    'UPDATE sim_runs SET ended_at = %s, sim_secs = %s, intervals = %s, dropped = %s '
+    'WHERE id = %s')
+
+_CLOSE = object()  # Queued by close() after the last report.
+
+
+def connect_from_env():
+    """A PyMySQL connection to the database Data/Scraper.py writes to."""
+    if pymysql is None:
+        raise RuntimeError('Recording runs to the database needs PyMySQL: '
+                           'pip install sumo-web3d[database]')
+    return pymysql.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=int(os.getenv('DB_PORT', '3306')),
+        user=os.getenv('DB_USER'),
+        password=os.getenv('DB_PASSWORD'),
+        database=os.getenv('DB_NAME', DEFAULT_DATABASE))
+
+
+def get_timezone(name):
+    """A tzinfo for an IANA time zone name, e.g. 'Europe/Dublin'.
+
+    zoneinfo is new in Python 3.9; before that, python-dateutil's zones are used.
+    """
+    try:
+        import zoneinfo
+    except ImportError:
+        from dateutil import tz
+        tzinfo = tz.gettz(name)
+        if tzinfo is None:
+            raise ValueError('Unknown time zone: %s' % name)
+        return tzinfo
+    return zoneinfo.ZoneInfo(name)
+
+
+def start_of_yesterday(now=None, timezone=DEFAULT_TIMEZONE):
+    """The UNIX time of last midnight but one, local time.
+
+    The default start_ts, so that a day-long scenario lines up with the last full day
+    of TomTom readings.
+    """
+    tz = get_timezone(timezone)
+    today = datetime.datetime.fromtimestamp(time.time() if now is None else now, tz).date()
+    midnight = datetime.datetime.combine(today - datetime.timedelta(days=1),
+                                         datetime.time(), tz)
+    return int(midnight.timestamp())
+
+
+def tomtom_road_edges(net_file):
+    """{tomtom column, lowercase as the app uses it: [edge ID, ...]} for a network.
+
+    Empty, with a warning, if the TomTom points can't be placed on it.
+    """
+    import sumolib
+    from .calibration import map_points  # Not at the top: calibration imports server.
+    try:
+        road_edges = map_points(sumolib.net.readNet(net_file))
+    except RuntimeError as e:  # No pyproj, or a network without a projection.
+        logger.warning('Not mapping the TomTom roads of %s: %s', net_file, e)
+        return {}
+    return {road.lower(): edges for road, edges in road_edges.items()}
+
+
+def series_rows(run_id, start_ts, sim_time, report):
+    """sim_edge_series rows for an edge_kpis.EdgeKpiWindow report made at sim_time."""
+    timestamp = int(start_ts + sim_time)
+    return [(run_id, timestamp, sim_time, edge_id, speed, vehicles, co2, pmx, noise)
+            for edge_id, speed, vehicles, co2, pmx, noise in zip(
+                report['ids'], report['speed'], report['vehicles'], report['co2'],
+                report['pmx'], report['noise'])]
+
+
+class RunRecorder(object):
+    """Writes one run's edge KPI reports to the database, on its own thread.
+
+    connect is called on that thread for a DB-API connection (e.g. connect_from_env).
+    road_edges, if given, is called there too, for the {road: [edge ID, ...]} to store
+    with the run (e.g. functools.partial(tomtom_road_edges, net_file)). Simulated time
+    0 stands for the UNIX time start_ts.
+    """
+
+    def __init__(self, connect, scenario, start_ts, window_secs, interval_secs,
+                 road_edges=None, sumo_args='', batch_rows=BATCH_ROWS, flush_secs=FLUSH_SECS,
+                 max_pending=MAX_PENDING_REPORTS):
+        self.scenario = scenario
+        self.start_ts = start_ts
+        self.window_secs = window_secs
+        self.interval_secs = interval_secs
+        self.sumo_args = sumo_args
+        self.batch_rows = batch_rows
+        self.flush_secs = flush_secs
+        self.run_id = None  # Once the run's row is written.
+        self.intervals = 0
+        self.dropped = 0  # Counted by both threads, under _dropped_lock.
+        self.last_time = 0
+        self._closed = False  # Whether the thread has taken _CLOSE off the queue.
+        self._connect = connect
+        self._road_edges = road_edges
+        self._max_pending = max_pending
+        self._dropped_lock = threading.Lock()
+        # Unbounded, so that close() can always queue _CLOSE; add() keeps reports in bounds.
+        self._reports = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='run-recorder', daemon=True)
+        self._thread.start()
+
+    def add(self, sim_time, report):
+        """Queue a report made at sim_time (simulated seconds). Never blocks."""
+        if self._reports.qsize() >= self._max_pending:
+            self._drop()
+        else:
+            self._reports.put_nowait((sim_time, report))
+
+    def close(self, timeout=0):
+        """Have the thread write what is queued and mark the run as ended.
+
+        Waits up to timeout seconds for it to finish (None for as long as it takes) and
+        returns whether it has. By default it doesn't wait: the simulation thread mustn't.
+        """
+        self._reports.put_nowait(_CLOSE)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def _drop(self):
+        with self._dropped_lock:
+            self.dropped += 1
+
+    # The methods below run on the recorder's thread.
+
+    def _run(self):
+        try:
+            connection = self._connect()
+        except Exception:
+            logger.exception('Not recording %s: cannot connect to the database', self.scenario)
+            return self._discard()
+        try:
+            self._start_run(connection)
+            self._write_reports(connection)
+            with self._dropped_lock:
+                dropped = self.dropped
+            self._execute(connection, FINISH_RUN, [(
+                int(time.time()), self.last_time, self.intervals, dropped, self.run_id)])
+        except Exception:
+            logger.exception('Stopped recording run %s of %s', self.run_id, self.scenario)
+            self._discard()
+        finally:
+            connection.close()
+
+    def _start_run(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_RUN, (self.scenario, int(time.time()), self.start_ts,
+                                        self.window_secs, self.interval_secs, self.sumo_args))
+            self.run_id = cursor.lastrowid
+        connection.commit()
+        road_edges = self._road_edges() if self._road_edges else {}
+        self._execute(connection, INSERT_ROADS, [
+            (self.run_id, road, edge_id)
+            for road, edges in sorted(road_edges.items()) for edge_id in edges])
+        logger.info('Recording %s as run %s', self.scenario, self.run_id)
+
+    def _write_reports(self, connection):
+        rows = []
+        deadline = None
+        while True:
+            try:
+                item = self._reports.get(
+                    timeout=None if deadline is None else max(deadline - time.time(), 0))
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _CLOSE:
+                time_secs, report = item
+                rows.extend(series_rows(self.run_id, self.start_ts, time_secs, report))
+                self.intervals += 1
+                self.last_time = time_secs
+                if deadline is None:
+                    deadline = time.time() + self.flush_secs
+            if item is None or item is _CLOSE or len(rows) >= self.batch_rows:
+                try:
+                    self._execute(connection, INSERT_SERIES, rows)
+                except Exception:
+                    # Losing a batch shouldn't end the run; the next one may well get through.
+                    logger.exception('Dropped %d rows of run %s', len(rows), self.run_id)
+                    connection.rollback()
+                rows = []
+                deadline = None
+            if item is _CLOSE:
+                self._closed = True
+                return
+
+    def _execute(self, connection, sql, rows):
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        connection.commit()
+
+    def _discard(self):
+        """Keep taking reports, so that close() returns, but write nothing."""
+        while not self._closed:
+            if self._reports.get() is _CLOSE:
+                self._closed = True
+            else:
+                self._drop()
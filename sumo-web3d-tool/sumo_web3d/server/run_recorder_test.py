@@ -0,0 +1,115 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import datetime
+import threading
+
+from nose.tools import eq_, ok_
+
+from .run_recorder import (
+    FINISH_RUN, INSERT_ROADS, INSERT_RUN, INSERT_SERIES, RunRecorder, get_timezone,
+    series_rows, start_of_yesterday)
+
+
+class FakeCursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.lastrowid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, row):
+        self.connection.calls.append((sql, [row]))
+        self.lastrowid = 42
+
+    def executemany(self, sql, rows):
+        self.connection.calls.append((sql, list(rows)))
+
+
+class FakeConnection(object):
+    """Just enough of a PyMySQL connection to see what a RunRecorder writes."""
+
+    def __init__(self):
+        self.calls = []
+        self.commits = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def report(ids, speed=10.0):
+    return {'ids': ids, 'speed': [speed] * len(ids), 'vehicles': [2.0] * len(ids),
+            'co2': [100.0] * len(ids), 'pmx': [1.0] * len(ids), 'noise': [60.0] * len(ids)}
+
+
+def test_series_rows():
+    eq_([(7, 1005, 5.0, 'a', 10.0, 2.0, 100.0, 1.0, 60.0)],
+        series_rows(7, 1000, 5.0, report(['a'])))
+
+
+def test_start_of_yesterday():
+    tz = get_timezone('Europe/Dublin')
+    now = datetime.datetime(2024, 7, 2, 15, 30, tzinfo=tz).timestamp()
+    eq_(datetime.datetime(2024, 7, 1, tzinfo=tz).timestamp(), start_of_yesterday(now))
+
+
+def test_records_run_in_batches():
+    connection = FakeConnection()
+    recorder = RunRecorder(lambda: connection, 'ongar', 1000, 60, 5,
+                           road_edges=lambda: {'main_street': ['a', '-a']}, batch_rows=3)
+    for i in range(1, 4):
+        recorder.add(5.0 * i, report(['a', 'b']))
+    ok_(recorder.close(timeout=5))
+
+    statements = [sql for sql, _ in connection.calls]
+    eq_([INSERT_RUN, INSERT_ROADS, INSERT_SERIES, INSERT_SERIES, FINISH_RUN], statements)
+    eq_([(42, 'main_street', 'a'), (42, 'main_street', '-a')], connection.calls[1][1])
+    # Reports are written whole, as soon as a batch has at least batch_rows rows.
+    eq_([4, 2], [len(rows) for _, rows in connection.calls[2:4]])
+    eq_((42, 1015, 15.0, 'b', 10.0, 2.0, 100.0, 1.0, 60.0), connection.calls[3][1][-1])
+    _, [(ended_at, sim_secs, intervals, dropped, run_id)] = connection.calls[-1]
+    eq_((15.0, 3, 0, 42), (sim_secs, intervals, dropped, run_id))
+    ok_(connection.closed)
+
+
+def test_unreachable_database_drops_reports():
+    def connect():
+        raise OSError('no database here')
+
+    recorder = RunRecorder(connect, 'ongar', 0, 60, 5)
+    recorder.add(5.0, report(['a']))
+    recorder.close(timeout=5)
+    eq_(None, recorder.run_id)
+    eq_(1, recorder.dropped)
+
+
+def test_close_does_not_wait_for_the_database():
+    connection = FakeConnection()
+    connected = threading.Event()
+
+    def connect():
+        connected.wait(5)
+        return connection
+
+    recorder = RunRecorder(connect, 'ongar', 0, 60, 5, max_pending=1)
+    for i in range(1, 4):
+        recorder.add(5.0 * i, report(['a']))
+    eq_(2, recorder.dropped)  # The queue only had room for one report.
+    ok_(not recorder.close())  # Nor did closing wait for the connection.
+
+    connected.set()
+    ok_(recorder.close(timeout=5))
+    _, [(ended_at, sim_secs, intervals, dropped, run_id)] = connection.calls[-1]
+    eq_((5.0, 1, 2), (sim_secs, intervals, dropped))
@@ -0,0 +1,159 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""An on-disk cache of parsed scenario files, so that startup doesn't parse any XML.
+
+Parsing a large network with xmltodict takes seconds; loading the same data back
+from JSON takes a fraction of that. Each entry is stored as two files in the cache
+directory: a small manifest listing the source files it was parsed from (with their
+mtime, size and SHA-1) and the parsed value as JSON. An entry is used as long as
+every source file is unchanged: files whose mtime and size still match are trusted,
+and the others are hashed, so touching a file doesn't force a re-parse.
+
+A handful of recently used values are also kept in memory, so that only the
+scenarios in use take up memory. So is whatever was derived from them, such as
+the compressed responses of assets.py, which goes when its value does.
+"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+DEFAULT_MAX_LOADED = 4  # values kept in memory
+
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'sumo-web3d')
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def describe_source(path):
+    """[path, mtime, size, SHA-1] for a manifest."""
+    stat = os.stat(path)
+    return [path, stat.st_mtime_ns, stat.st_size, file_hash(path)]
+
+
+class ScenarioCache(object):
+    """Loads values through parse_fns, caching them in cache_dir (or only in memory if None).
+
+    A parse_fn returns (value, source paths), where value is JSON-serializable.
+    """
+
+    def __init__(self, cache_dir, max_loaded=DEFAULT_MAX_LOADED):
+        self.cache_dir = cache_dir
+        self.max_loaded = max_loaded
+        self._loaded = collections.OrderedDict()  # key -> value, least recently used first.
+        self._derived = {}  # key -> {name: derived value}, for the keys in _loaded.
+        self.parses = 0  # How many times a parse_fn had to run, for tests and logging.
+        # Workers and the HTTP routes' executor threads load scenarios concurrently.
+        self._lock = threading.RLock()
+
+    def get(self, key, parse_fn):
+        with self._lock:
+            if key in self._loaded:
+                self._loaded.move_to_end(key)
+                return self._loaded[key]
+            value = self._read(key)
+            if value is None:
+                value, sources = parse_fn()
+                self.parses += 1
+                self._write(key, value, sources)
+            self._loaded[key] = value
+            while len(self._loaded) > self.max_loaded:
+                evicted, _ = self._loaded.popitem(last=False)
+                self._derived.pop(evicted, None)
+            return value
+
+    def get_derived(self, key, name, parse_fn, derive_fn):
+        """derive_fn(value) for key's value, kept in memory for as long as the value is."""
+        with self._lock:
+            value = self.get(key, parse_fn)
+            derived = self._derived.setdefault(key, {})
+            if name not in derived:
+                derived[name] = derive_fn(value)
+            return derived[name]
+
+    def _paths(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, name)
+        return base + '.manifest.json', base + '.json'
+
+    def _read(self, key):
+        if not self.cache_dir:
+            return None
+        manifest_path, value_path = self._paths(key)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get('version') != CACHE_VERSION or manifest.get('key') != key:
+                return None
+            sources, changed = [], False
+            for path, mtime, size, digest in manifest['sources']:
+                stat = os.stat(path)
+                if (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+                    if file_hash(path) != digest:
+                        return None
+                    mtime, size, changed = stat.st_mtime_ns, stat.st_size, True
+                sources.append([path, mtime, size, digest])
+            with open(value_path) as f:
+                value = json.load(f)
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if changed:
+            # Same contents, new mtimes: remember them so we don't hash again next time.
+            try:
+                self._write_manifest(manifest_path, key, sources)
+            except OSError:
+                pass
+        return value
+
+    def _write(self, key, value, sources):
+        if not self.cache_dir:
+            return
+        manifest_path, value_path = self._paths(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            sources = [describe_source(path) for path in sources]
+            # The manifest goes first and last, so that it never describes another value.
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
+            _write_json(value_path, value)
+            self._write_manifest(manifest_path, key, sources)
+        except OSError as e:
+            logger.warning('Could not cache %s in %s: %s', key, self.cache_dir, e)
+
+    def _write_manifest(self, path, key, sources):
+        _write_json(path, {'version': CACHE_VERSION, 'key': key, 'sources': sources})
+
+
+def partial_path(path, suffix=''):
+    """A new, empty file to write path as, before os.replace-ing it into place.
+
+    Unique to the call, so that threads or processes writing the same path at once never
+    share one. A suffix of path's (e.g. '.xml.gz') is kept, for SUMO's sake.
+    """
+    name = os.path.basename(path)
+    fd, temp_path = tempfile.mkstemp(
+        prefix=(name[:-len(suffix)] if suffix else name) + '.', suffix='.partial' + suffix,
+        dir=os.path.dirname(path))
+    os.close(fd)
+    return temp_path
+
+
+def _write_json(path, value):
+    temp_path = partial_path(path)
+    with open(temp_path, 'w') as f:
+        json.dump(value, f, separators=(',', ':'))
+    os.replace(temp_path, path)
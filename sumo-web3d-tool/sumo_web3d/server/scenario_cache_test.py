@@ -0,0 +1,86 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import json
+import os
+import tempfile
+
+from nose.tools import eq_
+
+from .scenario_cache import ScenarioCache
+
+
+def make_parse_fn(path):
+    def parse_fn():
+        with open(path) as f:
+            return {'contents': f.read()}, [path]
+    return parse_fn
+
+
+def test_cache_survives_restarts_until_sources_change():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, 'cache')
+        source = os.path.join(tmp, 'net.xml')
+        with open(source, 'w') as f:
+            f.write('<net/>')
+        parse_fn = make_parse_fn(source)
+
+        first = ScenarioCache(cache_dir)
+        eq_({'contents': '<net/>'}, first.get('net', parse_fn))
+        eq_(1, first.parses)
+
+        # A new server process loads the parsed value from disk.
+        second = ScenarioCache(cache_dir)
+        eq_({'contents': '<net/>'}, second.get('net', parse_fn))
+        eq_(0, second.parses)
+
+        # Touching the file without changing it doesn't force a parse...
+        stat = os.stat(source)
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        third = ScenarioCache(cache_dir)
+        third.get('net', parse_fn)
+        eq_(0, third.parses)
+
+        # ...but changing it does.
+        with open(source, 'w') as f:
+            f.write('<net version="2"/>')
+        fourth = ScenarioCache(cache_dir)
+        eq_({'contents': '<net version="2"/>'}, fourth.get('net', parse_fn))
+        eq_(1, fourth.parses)
+
+
+def test_memory_holds_recently_used_values_only():
+    with tempfile.TemporaryDirectory() as tmp:
+        parse_fns = {}
+        for name in 'abc':
+            path = os.path.join(tmp, name)
+            with open(path, 'w') as f:
+                json.dump(name, f)
+            parse_fns[name] = make_parse_fn(path)
+        cache = ScenarioCache(None, max_loaded=2)
+        for name in 'abca':
+            cache.get(name, parse_fns[name])
+        # Without a cache directory, 'a' had to be parsed again after being evicted.
+        eq_(4, cache.parses)
+        eq_(['c', 'a'], list(cache._loaded))
+
+
+def test_derived_values_are_evicted_with_their_value():
+    with tempfile.TemporaryDirectory() as tmp:
+        parse_fns = {}
+        for name in 'ab':
+            path = os.path.join(tmp, name)
+            with open(path, 'w') as f:
+                json.dump(name, f)
+            parse_fns[name] = make_parse_fn(path)
+        cache = ScenarioCache(None, max_loaded=1)
+        derives = []
+
+        def derive(value):
+            derives.append(value)
+            return len(derives)
+
+        eq_(1, cache.get_derived('a', 'asset', parse_fns['a'], derive))
+        eq_(1, cache.get_derived('a', 'asset', parse_fns['a'], derive))
+        cache.get('b', parse_fns['b'])
+        eq_({}, cache._derived)
+        eq_(2, cache.get_derived('a', 'asset', parse_fns['a'], derive))
+        eq_(2, len(derives))
@@ -2,26 +2,45 @@
 # Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
 import argparse
 import asyncio
-from collections import Counter
 import functools
 import json
+import math
 import os
 import re
 import shlex
-import time
 import random
+from urllib.parse import parse_qsl, urlsplit
 from logging import Logger
 from venv import logger
 
 from aiohttp import web
+import numpy as np
 import websockets
 import xmltodict
 
 from . import constants  # noqa
-from .deltas import round_vehicles, diff_dicts
+from .assets import Asset
+from .backends import BACKENDS, BACKEND_TRACI, get_backend
+from .checkpoints import CheckpointCache, checkpoint_dir, config_sources, warm_start
+from .codec import FORMAT_BINARY, FORMATS, HandleAllocator
+from .density import DEFAULT_CELL_SIZE as DEFAULT_LOD_CELL_SIZE, DensityGrid
+from .edge_kpis import DEFAULT_INTERVAL_SECS, DEFAULT_WINDOW_SECS, EdgeKpiWindow
+from .headless import record
+from .hub import Frame
+from .lights import LightTracker
+from .mode_shift import DEFAULT_FROM_TYPE, parse_mode_shift, shift_mode
+from .profiling import PhaseTimer
+from .recording import DEFAULT_KEYFRAME_INTERVAL, Recording, RecordingError
+from .replay import ReplayPlayer, describe_recording, parse_number
+from .run_recorder import RunRecorder, connect_from_env, start_of_yesterday, tomtom_road_edges
+from .scenario_cache import ScenarioCache, default_cache_dir
+from .sessions import SessionLimitError, SessionManager, DEFAULT_IDLE_SECS, DEFAULT_MAX_RUNNING
 import sumolib
 import traci
-from .xml_utils import get_only_key, parse_xml_file
+from .vehicle_store import VehicleStore
+from .viewport import parse_bounds
+from .worker import DEFAULT_DELAY_MS, DEFAULT_TARGET_FPS, STATUS_OFF, STATUS_PAUSED, STATUS_RUNNING
+from .xml_utils import get_only_key, parse_network_file, parse_xml_file
 
 tc = traci.constants
 
@@ -37,6 +56,73 @@ parser.add_argument(
 parser.add_argument(
     '--gui', action='store_true', default=False,
     help='Run sumo-gui rather than sumo. This is useful for debugging.')
+parser.add_argument(
+    '--backend', choices=BACKENDS, default=BACKEND_TRACI,
+    help='Drive SUMO over a TraCI socket (the default) or in process with libsumo, ' +
+         'which steps faster but runs only one simulation at a time.')
+parser.add_argument(
+    '--max-simulations', dest='max_simulations', type=int, default=DEFAULT_MAX_RUNNING,
+    help='How many SUMO processes may run at once, one per session. ' +
+         'The default is the number of CPUs.')
+parser.add_argument(
+    '--session-idle-secs', dest='session_idle_secs', type=int, default=DEFAULT_IDLE_SECS,
+    help='Shut down sessions which have had no clients for this many seconds.')
+parser.add_argument(
+    '--target-fps', dest='target_fps', type=float, default=DEFAULT_TARGET_FPS,
+    help='The most frames per second to send each client. Slower clients get merged ' +
+         'frames, and with no delay the simulation takes several steps per frame.')
+parser.add_argument(
+    '--cache-dir', dest='cache_dir', default=default_cache_dir(),
+    help='Where to keep parsed scenario files, which makes opening a scenario fast ' +
+         'after the first time. Pass an empty string to always parse them. ' +
+         'The default is %(default)s.')
+parser.add_argument(
+    '--warm-start', dest='warm_start', type=float, default=0,
+    help='Start simulations this many simulated seconds in, from a checkpoint saved in ' +
+         'the cache directory the first time. A scenario\'s "warm_start" in ' +
+         'scenarios.json overrides this. The default is to start at the beginning.')
+parser.add_argument(
+    '--edge-kpi-window', dest='edge_kpi_window', type=float, default=DEFAULT_WINDOW_SECS,
+    help='Average the CO2, PMx, noise and speed of every edge over this many simulated ' +
+         'seconds and send them to clients. 0 turns edge KPIs off.')
+parser.add_argument(
+    '--edge-kpi-interval', dest='edge_kpi_interval', type=float, default=DEFAULT_INTERVAL_SECS,
+    help='How many simulated seconds apart edge KPIs are sent.')
+parser.add_argument(
+    '--lod-vehicles', dest='lod_vehicles', type=int, default=0,
+    help='Send clients which can see more than this many vehicles a traffic density ' +
+         'heatmap of their view instead, e.g. for city-scale scenarios. The default, 0, ' +
+         'always sends vehicles.')
+parser.add_argument(
+    '--lod-cell-size', dest='lod_cell_size', type=float, default=DEFAULT_LOD_CELL_SIZE,
+    help='The size in meters of the cells of the density heatmap.')
+parser.add_argument(
+    '--record-db', dest='record_db', action='store_true', default=False,
+    help='Write the edge KPIs of every simulation to the analytics database given by ' +
+         'DB_HOST, DB_PORT, DB_USER, DB_PASSWORD and DB_NAME, as Data/Scraper.py does, ' +
+         'for comparing with the TomTom readings. Needs edge KPIs on.')
+parser.add_argument(
+    '--record-db-start', dest='record_db_start', type=int, default=None,
+    help='With --record-db, the UNIX time that the start of each simulation stands for. ' +
+         'The default is the start of yesterday, Irish time.')
+parser.add_argument(
+    '--record', metavar='FILE', default=None,
+    help='Instead of serving, run a scenario headless as fast as possible and record ' +
+         'its snapshots to FILE.')
+parser.add_argument(
+    '--scenario', default=None,
+    help='With --record, the scenario to run (default: the default scenario).')
+parser.add_argument(
+    '--steps', type=int, default=None,
+    help='With --record, stop after this many steps rather than when the simulation ends.')
+parser.add_argument(
+    '--keyframe-interval', dest='keyframe_interval', type=int, default=None,
+    help='With --record, how many steps apart keyframes are (default: %d).' %
+         DEFAULT_KEYFRAME_INTERVAL)
+parser.add_argument(
+    '--replay', metavar='FILE', default=None,
+    help='Serve a recording made with --record instead of running SUMO. Each viewer ' +
+         'can pause, seek and change speed independently.')
 
 # Base directory for sumo_web3d
 DIR = os.path.join(os.path.dirname(__file__), '..')
@@ -53,7 +139,12 @@ TRACI_CONSTANTS = [
     tc.VAR_WIDTH,
 ]
 
-TRACI_PERSON_CONSTANTS = TRACI_CONSTANTS + [
+# Persons' length and width come from their vType (see person_type_sizes): libsumo
+# reports those two under the vType's ID rather than the person's in context subscriptions.
+TRACI_PERSON_CONSTANTS = [
+    tc.VAR_TYPE,
+    tc.VAR_SPEED,
+    tc.VAR_ANGLE,
     tc.VAR_POSITION,
     tc.VAR_VEHICLE
 ]
@@ -64,50 +155,74 @@ TRACI_VEHICLE_CONSTANTS = TRACI_CONSTANTS + [
     tc.VAR_VEHICLECLASS,
 ]
 
+# Per traffic light; see lights.LightTracker.
+TRACI_LIGHT_CONSTANTS = [
+    tc.TL_CURRENT_PHASE,
+    tc.TL_CURRENT_PROGRAM,
+    tc.TL_NEXT_SWITCH,
+]
+
+# Per edge, in the order of edge_kpis.COLUMNS, then what density.py needs.
+TRACI_EDGE_CONSTANTS = [
+    tc.VAR_CO2EMISSION,
+    tc.VAR_PMXEMISSION,
+    tc.VAR_NOISEEMISSION,
+    tc.LAST_STEP_MEAN_SPEED,
+    tc.LAST_STEP_VEHICLE_NUMBER,
+    tc.LAST_STEP_OCCUPANCY,
+]
+
 snapshot = {}
 server = None
 
-STATUS_OFF = 'off'
-STATUS_RUNNING = 'running'
-STATUS_PAUSED = 'paused'
-simulation_status = STATUS_OFF
-delay_length_ms = 30  # in ms
-current_scenario = None
+sessions = None  # SessionManager; each session runs its own simulation.
+current_scenario = None  # The scenario last opened in a browser; see get_new_scenario.
 scenarios = {}  # map from kebab-case-name to Scenario object.
+recording = None  # The Recording being served, with --replay.
 
-last_vehicles = {}
-last_lights = {}
 
+def parse_scenario_files(sumocfg_file):
+    """Parse a scenario's network, additionals, settings and water.
 
-# meant to be used as decorator, will not work with coroutines
-def send_as_http_response(func):
-    def func_wrapper(*args, **kwargs):
-        data = func(*args, **kwargs)
-        if data and type(data) == str:
-            return web.Response(text=data)
-        elif data and type(data) != str:
-            raise Exception(
-                'fail to send as response, expecting string, recieved: {}'.format(type(data))
-            )
-        else:
-            return web.Response(status=404, text='Not found')
-
-    return func_wrapper
-
-
-# meant to be used as decorator, will not work with coroutines
-def serialize_as_json_string(func):
-    def func_wrapper(*args, **kwargs):
-        data = func(*args, **kwargs)
-        if data:
-            return json.dumps(data)
-        else:
-            return None
-
-    return func_wrapper
+    Returns them as a dict, plus the list of files they came from, for ScenarioCache.
+    """
+    config_dir = os.path.dirname(sumocfg_file)
+    config = xmltodict.parse(open(sumocfg_file).read(), attr_prefix='')['configuration']
+    net_file, additional_files, settings_file = parse_config_file(config_dir, config)
+    sources = [sumocfg_file, net_file] + (additional_files or [])
+    additionals = {} if additional_files else None
+    if additional_files:
+        for xml in [parse_xml_file(f) for f in additional_files]:
+            additional = xml.get('additional') or xml.get('add')
+            if additional:
+                additionals.update(additional)
+
+    settings = parse_xml_file(settings_file)
+    water = {'type': 'FeatureCollection', 'features': []}
+    if settings:
+        sources.append(settings_file)
+        water_tag = get_only_key(settings).get('water-geojson')
+        if water_tag:
+            water_file = os.path.join(config_dir, water_tag['value'])
+            water = json.load(open(water_file))
+            sources.append(water_file)
+
+    files = {
+        'network': parse_network_file(net_file),
+        'additional': additionals,
+        'settings': settings,
+        'water': water,
+    }
+    return files, sources
 
 
 class Scenario(object):
+    """A scenario listed in scenarios.json.
+
+    Its files are only parsed when first used, through Scenario.cache, so that
+    startup stays fast and only the scenarios people look at take up memory.
+    """
+    cache = ScenarioCache(None)  # main replaces this with one that caches on disk.
 
     @classmethod
     def from_config_json(cls, scenarios_json):
@@ -115,125 +230,227 @@ class Scenario(object):
         config_file = scenarios_json['config_file']
         sumocfg_file = os.path.join(DIR, os.path.expanduser(os.path.expandvars(config_file)))
         is_default = scenarios_json.get('is_default', False)
-        config_dir = os.path.dirname(sumocfg_file)
-        config = xmltodict.parse(open(sumocfg_file).read(), attr_prefix='')['configuration']
-        net_file, additional_files, settings_file = parse_config_file(config_dir, config)
-        additionals = {} if additional_files else None
-        if additional_files:
-            for xml in [parse_xml_file(f) for f in additional_files]:
-                additional = xml.get('additional') or xml.get('add')
-                if additional:
-                    additionals.update(additional)
-
-        settings = parse_xml_file(settings_file)
-        water = {'type': 'FeatureCollection', 'features': []}
-        if settings:
-            water_tag = get_only_key(settings).get('water-geojson')
-            if water_tag:
-                water = json.load(open(os.path.join(config_dir, water_tag['value'])))
-
-        return cls(
-            sumocfg_file,
-            name,
-            is_default,
-            parse_xml_file(net_file),
-            additionals,
-            settings,
-            water
-        )
-
-    def __init__(self, config_file, name, is_default, network, additional, settings, water):
+        return cls(sumocfg_file, name, is_default, scenarios_json.get('warm_start'))
+
+    def __init__(self, config_file, name, is_default, warm_start=None):
         self.config_file = config_file
         self.display_name = name
         self.name = to_kebab_case(name)
         self.is_default = is_default
-        self.network = network
-        self.additional = additional
-        self.settings = settings
-        self.water = water
+        self.warm_start = warm_start  # Simulated seconds, or None for the server's default.
+
+    def _files(self):
+        return self.cache.get(
+            os.path.abspath(self.config_file),
+            functools.partial(parse_scenario_files, self.config_file))
+
+    @property
+    def network(self):
+        return self._files()['network']
 
+    @property
+    def additional(self):
+        return self._files()['additional']
 
-def person_to_dict(person):
-    """Extracts relevant information from what traci.person.getSubscriptionResults."""
+    @property
+    def settings(self):
+        return self._files()['settings']
+
+    @property
+    def water(self):
+        return self._files()['water']
+
+    def asset(self, attribute, normalized_key=None):
+        """The attribute as an assets.Asset, or None if the scenario doesn't have one.
+
+        With normalized_key, the attribute's outermost tag is renamed to it. The asset
+        is kept in the cache with the scenario's files, and evicted along with them.
+        Building it can take seconds for a large network, so call it off the event loop.
+        """
+        def build(files):
+            obj = files[attribute]
+            if normalized_key and obj:
+                obj = {normalized_key: get_only_key(obj)}
+            return Asset.from_json(obj) if obj else None
+
+        return self.cache.get_derived(
+            os.path.abspath(self.config_file), 'asset:%s' % attribute,
+            functools.partial(parse_scenario_files, self.config_file), build)
+
+
+def person_columns(persons, type_sizes):
+    """VehicleStore columns for a list of traci.person.getSubscriptionResults.
+
+    type_sizes maps each person's vType to its (length, width).
+    """
+    positions = np.array([p[tc.VAR_POSITION] for p in persons], dtype=float).reshape(-1, 2)
+    sizes = np.array([type_sizes[p[tc.VAR_TYPE]] for p in persons], dtype=float).reshape(-1, 2)
+    return {
+        'x': positions[:, 0],
+        'y': positions[:, 1],
+        'z': np.zeros(len(persons)),
+        'speed': [p[tc.VAR_SPEED] for p in persons],
+        'angle': [p[tc.VAR_ANGLE] for p in persons],
+        'type': [p[tc.VAR_TYPE] for p in persons],
+        'length': sizes[:, 0],
+        'width': sizes[:, 1],
+        'person': [p.get(tc.VAR_VEHICLE) for p in persons],
+        'vClass': ['pedestrian'] * len(persons),
+    }
+
+
+def vehicle_columns(vehicles):
+    """VehicleStore columns for a list of traci.vehicle.getSubscriptionResults."""
+    positions = np.array([v[tc.VAR_POSITION3D] for v in vehicles], dtype=float).reshape(-1, 3)
     return {
-        'x': person[tc.VAR_POSITION][0],
-        'y': person[tc.VAR_POSITION][1],
-        'z': 0,
-        'speed': person[tc.VAR_SPEED],
-        'angle': person[tc.VAR_ANGLE],
-        'type': person[tc.VAR_TYPE],
-        'length': person[tc.VAR_LENGTH],
-        'width': person[tc.VAR_WIDTH],
-        'person': person.get(tc.VAR_VEHICLE),
-        'vClass': 'pedestrian',
+        'x': positions[:, 0],
+        'y': positions[:, 1],
+        'z': positions[:, 2],
+        'speed': [v[tc.VAR_SPEED] for v in vehicles],
+        'angle': [v[tc.VAR_ANGLE] for v in vehicles],
+        'type': [v[tc.VAR_TYPE] for v in vehicles],
+        'length': [v[tc.VAR_LENGTH] for v in vehicles],
+        'width': [v[tc.VAR_WIDTH] for v in vehicles],
+        'signals': [v[tc.VAR_SIGNALS] for v in vehicles],
+        'vClass': [v.get(tc.VAR_VEHICLECLASS) for v in vehicles],
     }
 
 
-def vehicle_to_dict(vehicle):
-    """Extracts relevant information from what traci.vehicle.getSubscriptionResults."""
+def edge_kpi_columns(edges):
+    """EdgeKpiWindow columns for a list of traci.edge.getSubscriptionResults."""
     return {
-        'x': vehicle[tc.VAR_POSITION3D][0],
-        'y': vehicle[tc.VAR_POSITION3D][1],
-        'z': vehicle[tc.VAR_POSITION3D][2],
-        'speed': vehicle[tc.VAR_SPEED],
-        'angle': vehicle[tc.VAR_ANGLE],
-        'type': vehicle[tc.VAR_TYPE],
-        'length': vehicle[tc.VAR_LENGTH],
-        'width': vehicle[tc.VAR_WIDTH],
-        'signals': vehicle[tc.VAR_SIGNALS],
-        'vClass': vehicle.get(tc.VAR_VEHICLECLASS),
+        'co2': [e[tc.VAR_CO2EMISSION] for e in edges],
+        'pmx': [e[tc.VAR_PMXEMISSION] for e in edges],
+        'noise': [e[tc.VAR_NOISEEMISSION] for e in edges],
+        'speed': [e[tc.LAST_STEP_MEAN_SPEED] for e in edges],
+        'vehicles': [e[tc.LAST_STEP_VEHICLE_NUMBER] for e in edges],
     }
 
 
-def light_to_dict(light):
-    """Extract relevant information from traci.trafficlights.getSubscriptionResults."""
+def density_columns(edges):
+    """DensityGrid.aggregate columns for a list of traci.edge.getSubscriptionResults."""
     return {
-        'phase': light[tc.TL_CURRENT_PHASE],
-        'programID': light[tc.TL_CURRENT_PROGRAM],
+        'vehicles': [e[tc.LAST_STEP_VEHICLE_NUMBER] for e in edges],
+        'speed': [e[tc.LAST_STEP_MEAN_SPEED] for e in edges],
+        'occupancy': [e[tc.LAST_STEP_OCCUPANCY] for e in edges],
     }
 
 
+def person_type_sizes(connection, persons, type_sizes):
+    """Add the (length, width) of any new vTypes among persons to type_sizes."""
+    for person in persons:
+        type_id = person[tc.VAR_TYPE]
+        if type_id not in type_sizes:
+            type_sizes[type_id] = (connection.vehicletype.getLength(type_id),
+                                   connection.vehicletype.getWidth(type_id))
+    return type_sizes
+
+
 def to_kebab_case(scenario_name):
     return scenario_name.lower().replace(' ', '-').replace('_', '-')
 
 
-def get_state():
+def get_state(session):
     return {
-        'delayMs': delay_length_ms,
-        'scenario': to_kebab_case(getattr(current_scenario, 'name')),
-        'simulationStatus': simulation_status
+        'delayMs': session.worker.delay_ms,
+        'scenario': to_kebab_case(session.scenario.name),
+        'session': session.id,
+        'simulationStatus': session.worker.status
     }
 
 
-async def post_state(scenarios, request):
-    global current_scenario, delay_length_ms, simulation_status
+def get_replay_state():
+    return {'scenario': recording.meta['scenario']}
+
+
+def find_session(query, create=False):
+    """Find the session a client asked for with ?scenario=...&session=...
+
+    Without a session id, everybody viewing a scenario shares the session named after
+    it. Without either, this is the session of the scenario last opened in a browser,
+    which is what clients that predate sessions (e.g. the dashboard) expect. Raises
+    ValueError for unknown scenarios. Returns None for a missing session unless create.
+    """
+    session_id = query.get('session')
+    scenario_name = query.get('scenario')
+    if scenario_name is not None and scenario_name not in scenarios:
+        raise ValueError('Unknown scenario: %s' % scenario_name)
+    if session_id and not scenario_name and sessions.get(session_id):
+        return sessions.get(session_id)
+    scenario = scenarios[scenario_name] if scenario_name else current_scenario
+    session_id = session_id or scenario.name
+    if create:
+        return sessions.get_or_create(session_id, scenario)
+    return sessions.get(session_id)
+
+
+async def post_state(request):
+    global current_scenario
     body = await request.json()
     if body['scenario'] not in scenarios.keys():
         return None
     current_scenario = scenarios[body['scenario']]
-    delay_length_ms = body['delay_length_ms']
-    simulation_status = body['simulation_status']
-    return web.Response(text=json.dumps({
-        'delayMs': delay_length_ms,
-        'scenario': to_kebab_case(getattr(current_scenario, 'name')),
-        'simulationStatus': simulation_status
-    }))
+    session = find_session(body, create=True)
+    session.worker.set_delay(body['delay_length_ms'])
+    await session.worker.set_status(body['simulation_status'])
+    await session.hub.broadcast_state()
+    return web.Response(text=json.dumps(get_state(session)))
 
 
 def state_http_response(request):
+    if recording:
+        state = dict(get_replay_state(), delayMs=DEFAULT_DELAY_MS, simulationStatus=STATUS_OFF,
+                     replay=describe_recording(recording))
+        return web.Response(text=json.dumps(state))
+    try:
+        session = find_session(request.query)
+    except ValueError as e:
+        return web.Response(status=404, text=str(e))
+    if session:
+        state = get_state(session)
+    else:
+        # Not created until a client connects to it, but that's what it will look like.
+        scenario = scenarios.get(request.query.get('scenario')) or current_scenario
+        state = {
+            'delayMs': DEFAULT_DELAY_MS,
+            'scenario': to_kebab_case(scenario.name),
+            'session': request.query.get('session') or scenario.name,
+            'simulationStatus': STATUS_OFF
+        }
+    return web.Response(
+        text=json.dumps(state)
+    )
+
+
+def sessions_http_response(request):
     return web.Response(
-        text=json.dumps(get_state())
+        text=json.dumps([session.describe() for session in sessions.sessions.values()])
     )
 
 
-def vehicle_route_http_response(request):
+def metrics_http_response(request):
+    """Per-phase step timings of each session; see profiling.py."""
+    metrics = [dict(session.profiler.report(), id=session.id, scenario=session.scenario.name)
+               for session in sessions.sessions.values()]
+    return web.Response(text=json.dumps(metrics), content_type='application/json')
+
+
+def get_route(connection, vehicle_id, vehicle):
+    if vehicle['vClass'] == 'pedestrian':
+        return connection.person.getEdges(vehicle_id)
+    return connection.vehicle.getRoute(vehicle_id)
+
+
+async def vehicle_route_http_response(request):
     vehicle_id = request.query_string
-    vehicle = last_vehicles.get(vehicle_id)
+    if 'session' in request.match_info:
+        session = sessions.get(request.match_info['session'])
+    else:
+        session = find_session({})
+    vehicle = session and session.last_vehicles.get(vehicle_id)
     if vehicle:
-        if vehicle['vClass'] == 'pedestrian':
-            edge_ids = traci.person.getEdges(vehicle_id)
-        else:
-            edge_ids = traci.vehicle.getRoute(vehicle_id)
+        edge_ids = await session.worker.call(
+            lambda: get_route(session.connection, vehicle_id, vehicle))
         if edge_ids:
             return web.Response(
                 text=json.dumps(edge_ids)
@@ -241,12 +458,6 @@ def vehicle_route_http_response(request):
     return web.Response(status=404)
 
 
-def get_state_websocket_message():
-    state = get_state()
-    state['type'] = 'state'
-    return state
-
-
 def make_xml_endpoint(path):
     text = None
     if path:
@@ -281,178 +492,397 @@ def make_additional_endpoint(paths):
     return handler
 
 
-async def run_simulation(websocket):
-    while True:
-        if simulation_status is STATUS_RUNNING:
-            snapshot = simulate_next_step()
-            snapshot['type'] = 'snapshot'
-            await websocket.send(json.dumps(snapshot))
-            await asyncio.sleep(delay_length_ms / 1000)
-        else:
-            await asyncio.sleep(0)
+def simulate_and_encode_next_step(session):
+    """Step the session's simulation and build its Frame. Runs on the worker thread."""
+    timer = PhaseTimer()
+    snapshot = simulate_next_step(session, session.worker.batch, timer)
+    snapshot['type'] = 'snapshot'
+    handles = session.handles.update(snapshot['vehicles'])
+    timer.mark('handles')
+    density = None
+    if session.density and session.hub.viewports:
+        # Only viewports switch to densities, so without any there is nothing to do.
+        edges = session.connection.edge.getAllSubscriptionResults()
+        density = session.density.aggregate(list(edges), density_columns(list(edges.values())))
+        timer.mark('density')
+    frame = Frame(snapshot, session.last_vehicles, session.last_lights, handles, density)
+    timer.mark('json')
+    if session.hub.binary:
+        # Encode here rather than on the event loop.
+        frame.binary()
+        timer.mark('binary')
+    if session.hub.viewports:
+        frame.grid()
+        timer.mark('grid')
+    session.profiler.add_step(timer.phases, len(session.last_vehicles), session.worker.batch)
+    return frame
+
+
+def close_sumo_simulation(session):
+    """Close the session's TraCI connection and forget its last frame.
+
+    Runs on the worker thread.
+    """
+    connection = session.connection
+    session.connection = None
+    session.last_vehicles = {}
+    session.last_lights = {}
+    session.light_tracker = None
+    session.density = None
+    if session.run_recorder:
+        session.run_recorder.close()  # Its own thread finishes the run; this one moves on.
+        session.run_recorder = None
+    session.person_sizes = {}
+    session.vehicles = VehicleStore()
+    session.handles = HandleAllocator()
+    connection.close()
+
+
+def add_bike(connection, vehicles):
+    """Add a bike on the test route and remove a passenger car. Runs on the worker thread.
+
+    vehicles is the last step's VehicleState, which says which vehicles are cars.
+    """
+    veh_id = "bike_" + str(random.randint(1000, 9999))
+    test_route_id = "test_bike_route"
+    edges = ["93906830#1", "-81155475"]
+    if test_route_id not in connection.route.getIDList():
+        connection.route.add(test_route_id, edges)
+        logger.info("Created test route: %s with edges: %s", test_route_id, edges)
+
+    try:
+        connection.vehicle.add(veh_id, test_route_id, typeID="bike_bicycle")
+        logger.info("Added bike vehicle: %s on route: %s", veh_id, test_route_id)
+    except Exception as e:
+        logger.exception("Error adding bike vehicle:")
+        raise
+
+    removed_vehicle = None
+    for v in (vehicles.ids_of_type(DEFAULT_FROM_TYPE) if vehicles else []):
+        removed_vehicle = v
+        try:
+            connection.vehicle.remove(v)
+            logger.info("Removed passenger vehicle: %s", v)
+        except Exception as e:
+            logger.exception("Error removing passenger vehicle %s:", v)
+        break
 
+    if removed_vehicle is None:
+        logger.info("No passenger vehicle available to remove.")
+    return veh_id, test_route_id, removed_vehicle
 
-def cleanup_sumo_simulation(simulation_task):
-    global last_lights, last_vehicles
-    if simulation_task:
-        if simulation_task.cancel():
-            simulation_task = None
-        last_vehicles = {}
-        last_lights = {}
-        traci.close()
 
+# Actions which only the hub's owner may send; see hub.py.
+OWNER_ACTIONS = {'pause', 'resume', 'cancel', 'changeDelay'}
 
-async def websocket_simulation_control(sumo_start_fn, task, websocket, path=None):
-    # We use globals to communicate with the simulation coroutine for simplicity
-    global delay_length_ms
-    global simulation_status
-    while True:
-        try:
+
+def websocket_query(websocket, path):
+    """The query parameters a websocket was opened with.
+
+    Older websockets releases pass the request path to the handler, newer ones keep
+    it on the connection.
+    """
+    if path is None:
+        request = getattr(websocket, 'request', None)
+        path = request.path if request else getattr(websocket, 'path', '/')
+    return dict(parse_qsl(urlsplit(path).query))
+
+
+async def websocket_simulation_control(sumo_start_fn, websocket, path=None):
+    # Each session's simulation runs on its own worker thread and is broadcast by the
+    # session's hub; this coroutine only handles one client's commands. Clients receive
+    # frames once they send 'start' (which joins a running simulation) or 'subscribe'.
+    # Other connections, like the dashboard's add_bike relay, only get replies.
+    # Snapshots are sent as JSON unless the client opts into codec.py's binary frames
+    # with ?format=binary. Everything else is JSON either way.
+    query = websocket_query(websocket, path)
+    try:
+        if query.get('format', FORMATS[0]) not in FORMATS:
+            raise ValueError('Unknown format: %s' % query['format'])
+        session = find_session(query, create=True)
+    except ValueError as e:
+        await websocket.send(json.dumps({'type': 'error', 'message': str(e)}))
+        return
+    binary = query.get('format') == FORMAT_BINARY
+    simulation, hub = session.worker, session.hub
+    session.connect(websocket)
+    try:
+        while True:
             raw_msg = await websocket.recv()
             msg = json.loads(raw_msg)
             if msg['type'] == 'action':
+                if msg['action'] in OWNER_ACTIONS and not hub.may_control(websocket):
+                    await websocket.send(json.dumps({
+                        'type': 'error',
+                        'message': 'Only the controlling client can %s the simulation' %
+                                   msg['action'],
+                    }))
+                    continue
                 if msg['action'] == 'start':
-                    sumo_start_fn()
-                    simulation_status = STATUS_RUNNING
-                    loop = asyncio.get_event_loop()
-                    task = loop.create_task(run_simulation(websocket))
+                    try:
+                        await sessions.start(session, websocket, lambda: sumo_start_fn(session),
+                                             binary)
+                    except SessionLimitError as e:
+                        await websocket.send(json.dumps({'type': 'error', 'message': str(e)}))
+                        continue
+                elif msg['action'] == 'subscribe':
+                    await hub.subscribe(websocket, binary)
+                elif msg['action'] == 'viewport':
+                    try:
+                        bounds = parse_bounds(msg.get('bounds'))
+                    except (TypeError, ValueError) as e:
+                        await websocket.send(json.dumps({'type': 'error', 'message': str(e)}))
+                    else:
+                        await hub.set_viewport(websocket, bounds)
+                    continue
                 elif msg['action'] == 'pause':
-                    simulation_status = STATUS_PAUSED
+                    await simulation.set_status(STATUS_PAUSED)
                 elif msg['action'] == 'resume':
-                    simulation_status = STATUS_RUNNING
+                    await simulation.set_status(STATUS_RUNNING)
                 elif msg['action'] == 'cancel':
-                    simulation_status = STATUS_OFF
-                    cleanup_sumo_simulation(task)
+                    await hub.stop()
                 elif msg['action'] == 'changeDelay':
-                    delay_length_ms = msg['delayLengthMs']
+                    simulation.set_delay(msg['delayLengthMs'])
                 elif msg['action'] == 'add_bike':
-                    veh_id = "bike_" + str(random.randint(1000, 9999))
-                    test_route_id = "test_bike_route"
-                    edges = ["93906830#1", "-81155475"]
-                    if test_route_id not in traci.route.getIDList():
-                        traci.route.add(test_route_id, edges)
-                        logger.info("Created test route: %s with edges: %s", test_route_id, edges)
-                        
+                    veh_id, test_route_id, removed_vehicle = await simulation.call(
+                        lambda: add_bike(session.connection, session.last_vehicles))
+                    await hub.send_state(
+                        websocket,
+                        removedVehicle=removed_vehicle,
+                        addedVehicle={
+                            "veh_id": veh_id,
+                            "route": test_route_id
+                        })
+                elif msg['action'] == 'modeShift':
                     try:
-                        traci.vehicle.add(veh_id, test_route_id, typeID="bike_bicycle")
-                        logger.info("Added bike vehicle: %s on route: %s", veh_id, test_route_id)    
-                    except Exception as e:
-                        logger.exception("Error adding bike vehicle:")
-                        raise
-                    
-                    current_vehicle_ids = traci.vehicle.getIDList()
-                    if veh_id in current_vehicle_ids:
-                        logger.info("Verified bike %s is present in the simulation", veh_id)
-                    else:
-                        logger.error("Bike %s not found in simulation after addition", veh_id)
-                        
-                    removed_vehicle = None
-                    for v in current_vehicle_ids:
-                        vtype = traci.vehicle.getTypeID(v)
-                        if vtype == "veh_passenger":
-                            removed_vehicle = v
-                            try:
-                                traci.vehicle.remove(v)
-                                logger.info("Removed passenger vehicle: %s", v)
-                            except Exception as e:
-                                logger.exception("Error removing passenger vehicle %s:", v)
-                            break
-
-                    if removed_vehicle is None:
-                        logger.info("No passenger vehicle available to remove.")
-                    
-                    response = get_state_websocket_message()  # returns a dict with state info
-                    response['removedVehicle'] = removed_vehicle
-                    response['addedVehicle'] = {
-                        "veh_id": veh_id,
-                        "route": test_route_id
-                    }
-                    await websocket.send(json.dumps(response))
-
+                        from_type, to_type, count, percent, seed = parse_mode_shift(msg)
+                    except ValueError as e:
+                        await websocket.send(json.dumps({'type': 'error', 'message': str(e)}))
+                        continue
+                    if not session.connection:
+                        await websocket.send(json.dumps(
+                            {'type': 'error', 'message': 'The simulation is not running'}))
+                        continue
+                    result = await simulation.call(
+                        lambda: shift_mode(session.connection, session.last_vehicles,
+                                           from_type, to_type, count, percent, seed))
+                    await hub.send_state(websocket, modeShift=result)
                 else:
                     raise Exception('unrecognized action websocket message')
-                await websocket.send(json.dumps(get_state_websocket_message()))
+                await hub.broadcast_state()
+                if websocket not in hub.subscribers:
+                    await hub.send_state(websocket)
             else:
                 raise Exception('unrecognized websocket message')
-        # we need to handle implicit cancelling, ie the client closing their browser
-        except websockets.exceptions.ConnectionClosed:
-            cleanup_sumo_simulation(task)
-            break
+    # we need to handle implicit cancelling, ie the client closing their browser
+    except websockets.exceptions.ConnectionClosed:
+        await hub.unsubscribe(websocket)
+    finally:
+        session.disconnect(websocket)
+
+
+# Replay actions which take a number: action -> (its key, what to do with it).
+REPLAY_NUMBER_ACTIONS = {
+    'changeDelay': ('delayLengthMs', ReplayPlayer.set_delay),
+    'changeSpeed': ('speed', ReplayPlayer.set_speed),
+    'seek': ('time', ReplayPlayer.seek),
+}
+
+
+async def websocket_replay_control(websocket, path=None):
+    # Replays have no shared simulation: each client controls its own ReplayPlayer.
+    player = ReplayPlayer(recording, websocket, get_replay_state)
+    try:
+        while True:
+            msg = json.loads(await websocket.recv())
+            if msg['type'] != 'action':
+                raise Exception('unrecognized websocket message')
+            action = msg['action']
+            if action in ('start', 'subscribe'):
+                player.start()
+            elif action == 'pause':
+                player.pause()
+            elif action == 'resume':
+                player.resume()
+            elif action == 'cancel':
+                await player.cancel()
+            elif action in REPLAY_NUMBER_ACTIONS:
+                key, set_value = REPLAY_NUMBER_ACTIONS[action]
+                try:
+                    value = parse_number(msg, key)
+                except ValueError as e:
+                    await websocket.send(json.dumps({'type': 'error', 'message': str(e)}))
+                    continue
+                set_value(player, value)
+            elif action == 'viewport':
+                continue  # Replays send every vehicle.
+            else:
+                await websocket.send(json.dumps({
+                    'type': 'error',
+                    'message': 'Cannot %s a recorded simulation' % action,
+                }))
+                continue
+            await player.send_state()
+    except websockets.exceptions.ConnectionClosed:
+        pass
+    finally:
+        await player.close()
 
 
 # TraCI business logic
-def start_sumo_executable(gui, sumo_args, sumocfg_file):
+def start_sumo_executable(backend, gui, sumo_args, session,
+                          edge_kpi_window=DEFAULT_WINDOW_SECS,
+                          edge_kpi_interval=DEFAULT_INTERVAL_SECS,
+                          warm_start_secs=0, checkpoints=None, lod_cell_size=0,
+                          record_db=False, record_db_start=None):
+    """Start SUMO for the session's scenario. Runs on the session's worker thread.
+
+    Edge KPIs are averaged over edge_kpi_window simulated seconds (none if 0). The
+    simulation starts warm_start_secs in (or the scenario's warm_start), loading the
+    state from checkpoints (a checkpoints.CheckpointCache) if it has one. Densities
+    (see density.py) are spread over cells of lod_cell_size meters (none if 0). With
+    record_db, the edge KPIs are written to the database as a run starting at the
+    UNIX time record_db_start (see run_recorder.py).
+    """
     sumoBinary = sumolib.checkBinary('sumo' if not gui else 'sumo-gui')
     additional_args = shlex.split(sumo_args) if sumo_args else []
-    args = [sumoBinary, '-c', sumocfg_file] + additional_args
+    args = [sumoBinary, '-c', session.scenario.config_file] + additional_args
     print('Executing %s' % ' '.join(args))
-    traci.start(args)
-    traci.simulation.subscribe()
-
-    # Subscribe to all traffic lights. This set of IDs should never change.
-    for light_id in traci.trafficlight.getIDList():
-        traci.trafficlight.subscribe(light_id, [
-            tc.TL_CURRENT_PHASE,
-            tc.TL_CURRENT_PROGRAM
-        ])
-
-
-def simulate_next_step():
-    global last_lights, last_vehicles
-    start_secs = time.time()
-    traci.simulationStep()
-    end_sim_secs = time.time()
-    # Update Vehicles
-    for veh_id in traci.simulation.getDepartedIDList():
-        # SUMO will not resubscribe to vehicles that are already subscribed, so this is safe.
-        traci.vehicle.subscribe(veh_id, TRACI_VEHICLE_CONSTANTS)
-
-    # acquire the relevant vehicle information
-    ids = tuple(set(traci.vehicle.getIDList() +
-                    traci.simulation.getSubscriptionResults()
-                    [tc.VAR_DEPARTED_VEHICLES_IDS]))
-    vehicles = {veh_id: vehicle_to_dict(traci.vehicle.getSubscriptionResults(veh_id))
-                for veh_id in ids}
-    # Vehicles are automatically unsubscribed upon arrival
-    # and deleted from vehicle list on next
-    # timestep. Persons are also automatically unsubscribed.
-    # See: http://sumo.dlr.de/wiki/TraCI/Object_Variable_Subscription).
-
-    # Update persons
-    # Workaround for people: traci does not return person objects in the getDepartedIDList() call
-    # See: http://sumo.dlr.de/trac.wsgi/ticket/3477
-    for ped_id in traci.person.getIDList():
-        traci.person.subscribe(ped_id, TRACI_PERSON_CONSTANTS)
-    person_ids = traci.person.getIDList()
-
-    persons = {p_id: person_to_dict(traci.person.getSubscriptionResults(p_id))
-               for p_id in person_ids}
+    connection = backend.start(args, session.next_label())
+    session.connection = connection
+
+    if session.scenario.warm_start is not None:
+        warm_start_secs = session.scenario.warm_start
+    if warm_start_secs:
+        # Before subscribing, so that the warm-up doesn't compute subscription results.
+        loaded = warm_start(connection, checkpoints or CheckpointCache(None),
+                            config_sources(session.scenario.config_file), warm_start_secs,
+                            additional_args)
+        print('%s %s to %gs' % ('Loaded' if loaded else 'Warmed up',
+                                session.scenario.name, warm_start_secs))
+    session.contexts = subscribe_to_all_vehicles(connection)
+    # The time comes with each step's results too, rather than costing a round trip.
+    connection.simulation.subscribe([tc.VAR_TIME])
+    subscribe_to_lights(connection)
+    session.light_tracker = LightTracker()
+
+    edge_ids = subscribe_to_edges(connection) if edge_kpi_window or lod_cell_size else None
+    session.edge_kpis = None
+    if edge_kpi_window:
+        session.edge_kpis = EdgeKpiWindow(edge_ids, edge_kpi_window, edge_kpi_interval)
+    session.density = None
+    if lod_cell_size:
+        session.density = DensityGrid.from_network(session.scenario.network, lod_cell_size)
+    session.run_recorder = None
+    if record_db and session.edge_kpis:
+        net_file = config_sources(session.scenario.config_file, ('net-file',))[1]
+        session.run_recorder = RunRecorder(
+            connect_from_env, session.scenario.name,
+            start_of_yesterday() if record_db_start is None else record_db_start,
+            edge_kpi_window, edge_kpi_interval,
+            road_edges=functools.partial(tomtom_road_edges, net_file),
+            sumo_args=sumo_args or '')
+
+
+def subscribe_to_all_vehicles(connection):
+    """Subscribe to the variables of every vehicle and person, wherever they are.
+
+    This uses context subscriptions whose radius covers the whole network: vehicles
+    around a junction and persons around an edge (separate domains, so that their
+    results don't mix). Each step then fetches all of them in one call, instead of
+    subscribing to and fetching each vehicle separately. Returns the junction and
+    edge IDs to fetch the results with.
+    """
+    (xmin, ymin), (xmax, ymax) = connection.simulation.getNetBoundary()
+    radius = 2 * math.hypot(xmax - xmin, ymax - ymin) + 1
+    junction_id = connection.junction.getIDList()[0]
+    edge_id = connection.edge.getIDList()[0]
+    connection.junction.subscribeContext(
+        junction_id, tc.CMD_GET_VEHICLE_VARIABLE, radius, TRACI_VEHICLE_CONSTANTS)
+    connection.edge.subscribeContext(
+        edge_id, tc.CMD_GET_PERSON_VARIABLE, radius, TRACI_PERSON_CONSTANTS)
+    return junction_id, edge_id
 
-    # Note: we might have to separate vehicles and people if their data models or usage deviate
-    # but for now we'll combine them into a single object
-    vehicles.update(persons)
-    vehicle_counts = Counter(v['vClass'] for veh_id, v in vehicles.items())
-    round_vehicles(vehicles)
-    vehicles_update = diff_dicts(last_vehicles, vehicles)
 
-    # Update lights
-    light_ids = traci.trafficlight.getIDList()
-    lights = {l_id: light_to_dict(traci.trafficlight.getSubscriptionResults(l_id))
-              for l_id in light_ids}
-    lights_update = diff_dicts(last_lights, lights)
+def subscribe_to_lights(connection):
+    """Subscribe to every traffic light. This set of IDs should never change."""
+    for light_id in connection.trafficlight.getIDList():
+        connection.trafficlight.subscribe(light_id, TRACI_LIGHT_CONSTANTS)
 
-    end_update_secs = time.time()
 
+def subscribe_to_edges(connection):
+    """Subscribe to the KPIs of every normal edge, i.e. not those inside junctions.
+
+    Returns their IDs. Each step then fetches all of them in one call. This is a
+    subscription per edge rather than a context subscription, which would also
+    return the (many more) internal edges.
+    """
+    edge_ids = [edge_id for edge_id in connection.edge.getIDList()
+                if not edge_id.startswith(':')]
+    for edge_id in edge_ids:
+        connection.edge.subscribe(edge_id, TRACI_EDGE_CONSTANTS)
+    return edge_ids
+
+
+def simulate_next_step(session, steps=1, timer=None):
+    """Advance the simulation by steps and return the snapshot of what changed.
+
+    The phases of the step are timed with timer (a profiling.PhaseTimer), if given.
+    """
+    connection = session.connection
+    timer = timer or PhaseTimer()
+    for _ in range(steps):
+        connection.simulationStep()
+    timer.mark('step')
+
+    # Vehicles and persons on the network; see subscribe_to_all_vehicles.
+    junction_id, edge_id = session.contexts
+    vehicles = connection.junction.getContextSubscriptionResults(junction_id) or {}
+    persons = connection.edge.getContextSubscriptionResults(edge_id) or {}
+    timer.mark('subscriptions')
+    person_sizes = person_type_sizes(connection, persons.values(), session.person_sizes)
+    timer.mark('person_types')
+
+    # Note: we might have to separate vehicles and people if their data models or usage deviate
+    # but for now we'll combine them into a single object
+    groups = [
+        (list(vehicles), vehicle_columns(list(vehicles.values()))),
+        (list(persons), person_columns(list(persons.values()), person_sizes)),
+    ]
+    timer.mark('columns')
+    vehicles_update = session.vehicles.update(groups)
+    state = session.vehicles.state()
+    vehicle_counts = state.vehicle_counts()
+    timer.mark('diff')
+
+    # Only the lights due to switch; see lights.py.
+    time_ms = int(round(1000 * connection.simulation.getSubscriptionResults()[tc.VAR_TIME]))
+    lights_update = session.light_tracker.update(
+        time_ms / 1000, connection.trafficlight.getAllSubscriptionResults() or {})
+    timer.mark('lights')
+
+    edge_kpis = None
+    if session.edge_kpis:
+        edges = connection.edge.getAllSubscriptionResults()
+        session.edge_kpis.add(time_ms / 1000, list(edges), edge_kpi_columns(list(edges.values())))
+        edge_kpis = session.edge_kpis.report_if_due(time_ms / 1000)
+        if edge_kpis and session.run_recorder:
+            session.run_recorder.add(time_ms / 1000, edge_kpis)
+        timer.mark('edges')
+
+    simulate_secs = timer.phases['step']
     snapshot = {
-        'time': traci.simulation.getCurrentTime(),
+        'time': time_ms,
         'vehicles': vehicles_update,
         'lights': lights_update,
         'vehicle_counts': vehicle_counts,
-        'simulate_secs': end_sim_secs - start_secs,
-        'snapshot_secs': end_update_secs - end_sim_secs
+        'simulate_secs': simulate_secs,
+        'snapshot_secs': sum(timer.phases.values()) - simulate_secs
     }
-    last_vehicles = vehicles
-    last_lights = lights
+    if edge_kpis:
+        snapshot['edgeKpis'] = edge_kpis
+    session.last_vehicles = state
+    session.last_lights = session.light_tracker.lights
     return snapshot
 
 
@@ -494,19 +924,19 @@ def get_scenarios_route(scenarios_file, scenarios):
     scenarios = load_scenarios_file(scenarios, scenarios_file)
 
 
-@send_as_http_response
-@serialize_as_json_string
-def scenario_attribute_route(scenarios_file, scenarios, attribute, normalized_key, request):
+async def scenario_attribute_route(scenarios_file, scenarios, attribute, normalized_key,
+                                   request):
     requested_scenario = request.match_info['scenario']
     if requested_scenario not in scenarios:
         scenarios = load_scenarios_file(scenarios, scenarios_file)
+    asset = None
     if requested_scenario in scenarios:
-        obj = getattr(scenarios[requested_scenario], attribute)
-        if normalized_key and obj:
-            obj = {normalized_key: get_only_key(obj)}
-        return obj
-    else:
-        return None
+        # Parsing and compressing a large network would stall every websocket.
+        asset = await asyncio.get_event_loop().run_in_executor(
+            None, scenarios[requested_scenario].asset, attribute, normalized_key)
+    if asset is None:
+        return web.Response(status=404, text='Not found')
+    return asset.response(request)
 
 
 def load_scenarios_file(prev_scenarios, scenarios_file):
@@ -588,7 +1018,10 @@ def setup_http_server(task, scenario_file, scenarios):
         make_xml_endpoint(os.path.join(constants.SUMO_HOME, 'data/typemap/osmPolyconvert.typ.xml'))
     )
     app.router.add_get('/state', state_http_response)
-    app.router.add_post('/state', functools.partial(post_state, scenarios))
+    app.router.add_post('/state', post_state)
+    app.router.add_get('/sessions', sessions_http_response)
+    app.router.add_get('/metrics', metrics_http_response)
+    app.router.add_get('/sessions/{session}/vehicle_route', vehicle_route_http_response)
     app.router.add_get('/vehicle_route', vehicle_route_http_response)
     app.router.add_get('/', lambda req: web.HTTPFound(
         '/scenarios/%s/' % default_scenario_name, headers=NO_CACHE_HEADER))
@@ -598,9 +1031,27 @@ def setup_http_server(task, scenario_file, scenarios):
 
 
 def main(args):
-    global current_scenario, scenarios, SCENARIOS_PATH
+    global current_scenario, recording, scenarios, sessions, SCENARIOS_PATH
     task = None
-    sumo_start_fn = functools.partial(start_sumo_executable, args.gui, args.sumo_args)
+    try:
+        backend = get_backend(args.backend)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.gui and not backend.supports_gui:
+        parser.error('--gui needs the traci backend')
+    max_simulations = args.max_simulations
+    if backend.max_simulations:
+        max_simulations = min(max_simulations, backend.max_simulations)
+    if args.record_db and not args.edge_kpi_window:
+        parser.error('--record-db needs edge KPIs; drop --edge-kpi-window 0')
+    sumo_start_fn = functools.partial(
+        start_sumo_executable, backend, args.gui, args.sumo_args,
+        edge_kpi_window=args.edge_kpi_window, edge_kpi_interval=args.edge_kpi_interval,
+        warm_start_secs=args.warm_start,
+        lod_cell_size=args.lod_cell_size if args.lod_vehicles else 0,
+        record_db=args.record_db, record_db_start=args.record_db_start,
+        checkpoints=CheckpointCache(checkpoint_dir(args.cache_dir) if args.cache_dir else None))
+    Scenario.cache = ScenarioCache(args.cache_dir or None)
 
     if args.configuration_file:
         # Replace the built-in scenarios with a single, user-specified one.
@@ -617,16 +1068,43 @@ def main(args):
     else:
         scenarios = load_scenarios_file({}, SCENARIOS_PATH)
 
+    # Until a browser opens a scenario, clients without one get the default.
+    current_scenario = scenarios[get_default_scenario_name(scenarios)]
+
+    if args.record:
+        scenario = current_scenario
+        if args.scenario:
+            if to_kebab_case(args.scenario) not in scenarios:
+                parser.error('Unknown scenario: %s' % args.scenario)
+            scenario = scenarios[to_kebab_case(args.scenario)]
+        timer = record(sumo_start_fn, simulate_next_step, scenario,
+                       args.record, max_steps=args.steps,
+                       keyframe_interval=args.keyframe_interval)
+        print('Recorded %s to %s\n%s' % (scenario.name, args.record, timer.report()))
+        return
+
+    if args.replay:
+        try:
+            recording = Recording(args.replay)
+        except (OSError, RecordingError) as e:
+            parser.error(str(e))
+        if recording.meta['scenario'] not in scenarios:
+            parser.error('%s is a recording of %s, which is not a known scenario' %
+                         (args.replay, recording.meta['scenario']))
+        current_scenario = scenarios[recording.meta['scenario']]
+
     def setup_websockets_server():
-        return functools.partial(
-            websocket_simulation_control,
-            lambda: sumo_start_fn(getattr(current_scenario, 'config_file')),
-            task
-        )
+        if recording:
+            return websocket_replay_control
+        return functools.partial(websocket_simulation_control, sumo_start_fn)
 
     # Create a new event loop and set it as current
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
+    sessions = SessionManager(loop, simulate_and_encode_next_step, close_sumo_simulation,
+                              get_state, max_running=max_simulations,
+                              idle_secs=args.session_idle_secs,
+                              target_fps=args.target_fps, lod_vehicles=args.lod_vehicles)
 
     ws_handler = setup_websockets_server()
     app = setup_http_server(task, SCENARIOS_PATH, scenarios)
@@ -637,6 +1115,7 @@ def main(args):
         return ws_server, http_server
 
     ws_server, http_server = loop.run_until_complete(init_servers())
+    loop.create_task(sessions.reap_forever())
 
     print("""Listening on:
     0.0.0.0:5000 (HTTP)
@@ -0,0 +1,184 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Runs several isolated simulations side by side.
+
+Each Session is one simulation: its own SUMO process behind its own labelled
+TraCI connection, its own SimulationWorker thread and its own SimulationHub of
+viewers. SUMO does the heavy lifting in its own process, so sessions step in
+parallel across cores.
+
+Clients pick a session by id (see server.find_session). Sessions are
+cheap until started; the SessionManager caps how many SUMO processes run at once
+and reaps sessions that nobody has been connected to for a while.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import re
+import time
+
+from .codec import HandleAllocator
+from .hub import SimulationHub
+from .profiling import StepProfiler
+from .vehicle_store import VehicleStore
+from .worker import DEFAULT_TARGET_FPS, SimulationWorker, STATUS_OFF
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_RUNNING = os.cpu_count() or 1
+DEFAULT_IDLE_SECS = 300
+REAP_INTERVAL_SECS = 30
+
+SESSION_ID_RE = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+class Session(object):
+    """One simulation and everything that belongs to it.
+
+    step_fn, close_fn and state_fn are called with the session as their only
+    argument, e.g. server.simulate_and_encode_next_step. They keep the TraCI
+    connection and the last frame on the session rather than in globals.
+    target_fps is the frame rate the worker and hub aim for; see worker.py and streams.py.
+    lod_vehicles is where the hub's viewports switch to density; see viewport.py.
+    """
+    _starts = itertools.count()
+
+    def __init__(self, session_id, scenario, loop, step_fn, close_fn, state_fn,
+                 target_fps=DEFAULT_TARGET_FPS, lod_vehicles=0):
+        self.id = session_id
+        self.scenario = scenario
+        self.connection = None  # traci.connection.Connection (or libsumo) while running.
+        self.contexts = None  # What to fetch all vehicles with; see subscribe_to_all_vehicles.
+        self.vehicles = VehicleStore()
+        self.last_vehicles = {}  # The VehicleState of the last step.
+        self.last_lights = {}
+        self.light_tracker = None  # lights.LightTracker, while SUMO is running.
+        self.person_sizes = {}  # vType -> (length, width), see server.person_type_sizes.
+        self.edge_kpis = None  # edge_kpis.EdgeKpiWindow, unless edge KPIs are off.
+        self.density = None  # density.DensityGrid, if clients may get densities.
+        self.run_recorder = None  # run_recorder.RunRecorder, with --record-db.
+        self.handles = HandleAllocator()  # Vehicle handles for binary frames; see codec.py.
+        self.clients = set()  # Every websocket routed here, subscribed or not.
+        self.idle_since = time.monotonic()
+        self.profiler = StepProfiler()  # Served on /metrics.
+        self.worker = SimulationWorker(loop,
+                                       lambda: step_fn(self),
+                                       lambda: close_fn(self),
+                                       name='sumo-worker-%s' % session_id,
+                                       target_fps=target_fps)
+        self.hub = SimulationHub(self.worker, lambda: state_fn(self), target_fps, self.profiler,
+                                 lod_vehicles)
+
+    @property
+    def is_running(self):
+        return self.worker.status != STATUS_OFF
+
+    def next_label(self):
+        """A fresh TraCI label, so a connection that failed to close can't block a restart."""
+        return '%s-%d' % (self.id, next(self._starts))
+
+    def connect(self, websocket):
+        self.clients.add(websocket)
+
+    def disconnect(self, websocket):
+        self.clients.discard(websocket)
+        if not self.clients:
+            self.idle_since = time.monotonic()
+
+    def idle_secs(self):
+        return 0 if self.clients else time.monotonic() - self.idle_since
+
+    def describe(self):
+        return {
+            'id': self.id,
+            'scenario': self.scenario.name,
+            'simulationStatus': self.worker.status,
+            'clients': len(self.clients),
+            'viewers': len(self.hub.subscribers),
+            'stepsPerFrame': self.worker.batch,
+            'streams': [stream.describe() for stream in self.hub.streams.values()],
+        }
+
+
+class SessionManager(object):
+    """Creates sessions on demand, limits running SUMO processes and reaps idle sessions."""
+
+    def __init__(self, loop, step_fn, close_fn, state_fn,
+                 max_running=DEFAULT_MAX_RUNNING, idle_secs=DEFAULT_IDLE_SECS,
+                 target_fps=DEFAULT_TARGET_FPS, lod_vehicles=0):
+        self.loop = loop
+        self.step_fn = step_fn
+        self.close_fn = close_fn
+        self.state_fn = state_fn
+        self.max_running = max_running
+        self.idle_secs = idle_secs
+        self.target_fps = target_fps
+        self.lod_vehicles = lod_vehicles
+        self.sessions = {}
+        self._starting = set()
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def get_or_create(self, session_id, scenario):
+        """Return session_id's session, creating it for scenario if it doesn't exist.
+
+        A session that isn't running switches to scenario; a running one keeps its own,
+        so that everybody who joins it sees the same simulation.
+        """
+        if not SESSION_ID_RE.match(session_id):
+            raise ValueError('Invalid session id: %r' % session_id)
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = Session(session_id, scenario, self.loop, self.step_fn, self.close_fn,
+                              self.state_fn, self.target_fps, self.lod_vehicles)
+            self.sessions[session_id] = session
+            logger.info('Created session %s for %s', session_id, scenario.name)
+        elif not session.is_running:
+            session.scenario = scenario
+        return session
+
+    def running_count(self):
+        running = [s for s in self.sessions.values() if s.is_running or s in self._starting]
+        return len(running)
+
+    async def start(self, session, websocket, start_fn, binary=False):
+        """Start session's simulation for websocket, or join it if it is already running.
+
+        Raises SessionLimitError if that would take more than max_running SUMO processes.
+        """
+        if session.is_running or session in self._starting:
+            await session.hub.start(websocket, start_fn, binary)
+            return
+        if self.running_count() >= self.max_running:
+            raise SessionLimitError(
+                'All %d simulation slots are busy; try again later' % self.max_running)
+        # Starting SUMO takes a while; hold the slot so concurrent starts can't overbook.
+        self._starting.add(session)
+        try:
+            await session.hub.start(websocket, start_fn, binary)
+        finally:
+            self._starting.discard(session)
+
+    async def reap_idle(self):
+        """Shut down sessions that have had no clients for idle_secs. Returns their ids."""
+        idle = [session for session in self.sessions.values()
+                if not session.clients and session.idle_secs() >= self.idle_secs]
+        for session in idle:
+            del self.sessions[session.id]
+            await session.hub.stop()
+            await session.worker.shutdown()
+            logger.info('Reaped idle session %s', session.id)
+        return [session.id for session in idle]
+
+    async def reap_forever(self, interval=REAP_INTERVAL_SECS):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap_idle()
+            except Exception:
+                logger.exception('Error while reaping idle sessions')
@@ -0,0 +1,113 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import asyncio
+import json
+import time
+
+from nose.tools import assert_raises, eq_, ok_
+
+from .hub import Frame
+from .sessions import SessionLimitError, SessionManager
+from .worker import STATUS_OFF, STATUS_RUNNING
+
+
+class FakeScenario(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeWebsocket(object):
+    async def send(self, message):
+        json.loads(message)
+
+
+def make_manager(loop, max_running, idle_secs=60):
+    def step(session):
+        return Frame({'type': 'snapshot', 'session': session.id}, {}, {})
+
+    def close(session):
+        session.connection = None
+
+    def state(session):
+        return {'session': session.id}
+
+    return SessionManager(loop, step, close, state, max_running=max_running,
+                          idle_secs=idle_secs)
+
+
+def test_sessions_are_isolated_and_limited():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    manager = make_manager(loop, max_running=1)
+    ongar, basic = FakeScenario('ongar'), FakeScenario('ongarbasic')
+
+    async def scenario():
+        a = manager.get_or_create('ongar', ongar)
+        b = manager.get_or_create('ongarbasic', basic)
+        ok_(a is manager.get_or_create('ongar', ongar))
+        ok_(a.worker is not b.worker)
+
+        await manager.start(a, FakeWebsocket(), lambda: setattr(a, 'connection', 'sumo-a'))
+        eq_(STATUS_RUNNING, a.worker.status)
+        # Only one SUMO process may run, so the other session has to wait.
+        with assert_raises(SessionLimitError):
+            await manager.start(b, FakeWebsocket(), lambda: None)
+        eq_(STATUS_OFF, b.worker.status)
+        # Joining a running session doesn't take another slot.
+        await manager.start(a, FakeWebsocket(), lambda: None)
+        eq_(2, len(a.hub.subscribers))
+
+        await a.hub.stop()
+        eq_(None, a.connection)
+        await manager.start(b, FakeWebsocket(), lambda: None)
+        eq_(STATUS_RUNNING, b.worker.status)
+        await b.hub.stop()
+
+    loop.run_until_complete(scenario())
+    with assert_raises(ValueError):
+        manager.get_or_create('../etc', ongar)
+    loop.close()
+
+
+def test_concurrent_starts_start_once():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    manager = make_manager(loop, max_running=1)
+    first, second = FakeWebsocket(), FakeWebsocket()
+    starts = []
+
+    def start_fn():
+        starts.append(1)
+        time.sleep(0.1)  # SUMO takes a while to start, on the worker thread.
+
+    async def scenario():
+        session = manager.get_or_create('ongar', FakeScenario('ongar'))
+        await asyncio.gather(manager.start(session, first, start_fn),
+                             manager.start(session, second, start_fn))
+        eq_(1, len(starts))
+        ok_(session.hub.owner is first)
+        eq_([first, second], session.hub.subscribers)
+        await session.hub.stop()
+
+    loop.run_until_complete(scenario())
+    loop.close()
+
+
+def test_idle_sessions_are_reaped():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    manager = make_manager(loop, max_running=2, idle_secs=0)
+    websocket = FakeWebsocket()
+
+    async def scenario():
+        busy = manager.get_or_create('busy', FakeScenario('ongar'))
+        idle = manager.get_or_create('idle', FakeScenario('ongar'))
+        busy.connect(websocket)
+        await manager.start(idle, websocket, lambda: None)
+        await idle.hub.unsubscribe(websocket)
+        eq_(['idle'], await manager.reap_idle())
+        idle.worker._thread.join(1)
+        ok_(not idle.worker._thread.is_alive())
+
+    loop.run_until_complete(scenario())
+    eq_(['busy'], list(manager.sessions))
+    loop.close()
@@ -0,0 +1,141 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Sends each subscriber its frames at the rate it can take them.
+
+The hub hands every frame to each subscriber's ClientStream without waiting for
+the websocket, so one slow browser no longer holds the simulation (and every other
+viewer) back. A stream sends its frames one at a time; when frames pile up
+behind a slow send, it merges all the pending deltas into a single delta (see
+deltas.merge_deltas) and sends that instead. Streams can also be capped at a
+target frame rate, in which case frames that arrive faster are merged too.
+
+Streams measure how long their sends take and how many frames they had to
+merge, which the /sessions route reports.
+"""
+import asyncio
+import collections
+import json
+
+from websockets.exceptions import ConnectionClosed
+
+from .codec import encode_snapshot
+from .deltas import merge_deltas
+
+DEFAULT_TARGET_FPS = 30
+# Past this many pending frames, merge them right away rather than holding them all.
+MAX_PENDING_FRAMES = 64
+# Weight of the latest send in the moving average of send times.
+DRAIN_SMOOTHING = 0.2
+
+
+def merge_snapshots(first, second):
+    """One snapshot with the effect of first followed by second, or None if impossible.
+
+    Everything but the vehicle and light deltas is taken from second, or from first
+    if only first has it, like the edge KPIs which come with some frames only.
+    """
+    vehicles = merge_deltas(first['vehicles'], second['vehicles'])
+    lights = merge_deltas(first['lights'], second['lights'])
+    if vehicles is None or lights is None:
+        return None
+    return dict(first, **dict(second, vehicles=vehicles, lights=lights))
+
+
+class ClientStream(object):
+    """The queue of frames waiting to be sent to one websocket.
+
+    push() never blocks. Frames go out in order, each with a snapshot: frame's snapshot
+    filtered for this client (see viewport.py), or None to send the frame's shared
+    encoding. Pending frames are kept as ([frame, ...], snapshot) pairs, since merging
+    puts several frames behind one snapshot. on_closed(websocket) is called if the
+    connection turns out to be closed. Sends are added to profiler's 'send' phase.
+    """
+
+    def __init__(self, websocket, on_closed, binary=False, target_fps=None, profiler=None):
+        self.websocket = websocket
+        self.profiler = profiler
+        self.on_closed = on_closed
+        self.binary = binary
+        self.min_interval = 1 / target_fps if target_fps else 0
+        self.pending = collections.deque()
+        self.sent_messages = 0
+        self.merged_frames = 0  # Frames which were folded into a later message.
+        self.drain_secs = 0.0  # Moving average of how long a send takes.
+        self.max_pending = 0
+        self._ready = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    def push(self, frame, snapshot=None):
+        self.pending.append(([frame], snapshot))
+        self.max_pending = max(self.max_pending, len(self.pending))
+        if len(self.pending) > MAX_PENDING_FRAMES:
+            self.pending = collections.deque(self._coalesce(list(self.pending)))
+        self._ready.set()
+
+    def close(self):
+        self._task.cancel()
+        self.pending.clear()
+
+    def describe(self):
+        return {
+            'pendingFrames': len(self.pending),
+            'maxPendingFrames': self.max_pending,
+            'sentMessages': self.sent_messages,
+            'mergedFrames': self.merged_frames,
+            'drainMs': round(1000 * self.drain_secs, 2),
+        }
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self.pending:
+                    items = self._coalesce(list(self.pending))
+                    self.pending.clear()
+                    for item in items:
+                        start = loop.time()
+                        await self.websocket.send(self._encode(item))
+                        elapsed = loop.time() - start
+                        self.drain_secs += DRAIN_SMOOTHING * (elapsed - self.drain_secs)
+                        self.sent_messages += 1
+                        self.merged_frames += len(item[0]) - 1
+                        if self.profiler:
+                            self.profiler.add('send', elapsed, len(item[0][-1].vehicles))
+                        if self.min_interval > elapsed:
+                            # Frames which arrive meanwhile get merged into the next send.
+                            await asyncio.sleep(self.min_interval - elapsed)
+        except ConnectionClosed:
+            self.pending.clear()
+            self.on_closed(self.websocket)
+
+    @staticmethod
+    def _coalesce(items):
+        """Merge consecutive (frames, snapshot) pairs as far as possible."""
+        merged = []
+        for frames, snapshot in items:
+            if merged:
+                last_frames, last_snapshot = merged[-1]
+                combined = merge_snapshots(_snapshot(last_frames, last_snapshot),
+                                           _snapshot(frames, snapshot))
+                if combined is not None:
+                    merged[-1] = (last_frames + frames, combined)
+                    continue
+            merged.append((frames, snapshot))
+        return merged
+
+    def _encode(self, item):
+        frames, snapshot = item
+        if snapshot is None and len(frames) == 1:
+            frame = frames[0]
+            return frame.binary() if self.binary else frame.message
+        snapshot = _snapshot(frames, snapshot)
+        if self.binary:
+            handles = collections.ChainMap(*[frame.handles for frame in reversed(frames)])
+            return encode_snapshot(snapshot, handles)
+        return json.dumps(snapshot)
+
+
+def _snapshot(frames, snapshot):
+    """The snapshot to send for frames: the filtered or merged one if any."""
+    return frames[-1].snapshot if snapshot is None else snapshot
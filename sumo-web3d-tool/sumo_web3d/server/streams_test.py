@@ -0,0 +1,99 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import asyncio
+import json
+
+from nose.tools import eq_, ok_
+
+from .deltas import apply_delta, diff_dicts
+from .hub import Frame
+from .streams import ClientStream, merge_snapshots
+
+
+class SlowWebsocket(object):
+    def __init__(self, send_secs):
+        self.send_secs = send_secs
+        self.sent = []
+
+    async def send(self, message):
+        await asyncio.sleep(self.send_secs)
+        self.sent.append(json.loads(message))
+
+
+def make_frames(states):
+    frames = []
+    for time, (before, after) in enumerate(zip([{}] + states, states)):
+        snapshot = {'type': 'snapshot', 'time': time, 'vehicles': diff_dicts(before, after),
+                    'lights': diff_dicts({}, {})}
+        frames.append(Frame(snapshot, after, {}))
+    return frames
+
+
+def replay(messages):
+    vehicles = {}
+    for message in messages:
+        apply_delta(vehicles, message['vehicles'])
+    return vehicles
+
+
+def run_stream(frames, send_secs, target_fps=None):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    websocket = SlowWebsocket(send_secs)
+
+    async def scenario():
+        stream = ClientStream(websocket, lambda ws: None, target_fps=target_fps)
+        for frame in frames:
+            stream.push(frame)
+            await asyncio.sleep(0.001)
+        # Every frame has been sent once it's been sent on its own or merged into another.
+        while stream.sent_messages + stream.merged_frames < len(frames):
+            await asyncio.sleep(0.01)
+        stream.close()
+        return stream
+
+    stream = loop.run_until_complete(scenario())
+    loop.close()
+    return stream, websocket.sent
+
+
+def test_slow_client_gets_merged_deltas():
+    states = [{'veh%d' % j: {'x': i + j, 'y': j} for j in range(i % 7, i % 7 + 5)}
+              for i in range(40)]
+    stream, sent = run_stream(make_frames(states), send_secs=0.02)
+    ok_(stream.merged_frames > 0)
+    eq_(len(sent), stream.sent_messages)
+    # The client still ends up with exactly the simulation's state, and the latest time.
+    eq_(states[-1], replay(sent))
+    eq_(len(states) - 1, sent[-1]['time'])
+
+
+def test_fast_client_gets_every_frame():
+    states = [{'veh1': {'x': i}} for i in range(5)]
+    _, sent = run_stream(make_frames(states), send_secs=0)
+    eq_(list(range(5)), [message['time'] for message in sent])
+
+
+def test_target_fps_caps_sends():
+    states = [{'veh1': {'x': i}} for i in range(20)]
+    _, sent = run_stream(make_frames(states), send_secs=0, target_fps=20)
+    ok_(len(sent) < 10)
+    eq_(states[-1], replay(sent))
+
+
+def test_recreated_vehicles_are_not_merged():
+    # veh1 leaves and comes back, which a single delta can't express.
+    states = [{'veh1': {'x': 0}}, {}, {'veh1': {'x': 2}}, {'veh1': {'x': 3}}]
+    _, sent = run_stream(make_frames(states), send_secs=0.02)
+    eq_(states[-1], replay(sent))
+
+
+def test_merge_snapshots_keeps_edge_kpis():
+    frames = make_frames([{'veh1': {'x': 0}}, {'veh1': {'x': 1}}, {'veh1': {'x': 2}}])
+    frames[0].snapshot['edgeKpis'] = {'ids': ['a']}
+    frames[1].snapshot['edgeKpis'] = {'ids': ['b']}
+    merged = merge_snapshots(frames[0].snapshot, frames[1].snapshot)
+    eq_({'ids': ['b']}, merged['edgeKpis'])
+    merged = merge_snapshots(merged, frames[2].snapshot)
+    eq_({'ids': ['b']}, merged['edgeKpis'])
+    eq_(2, merged['time'])
+    eq_({'veh1': {'x': 2}}, merged['vehicles']['creations'])
@@ -0,0 +1,488 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Run a scenario under a grid of what-if parameters and tabulate the outcomes.
+
+Each variant changes the scenario's demand before SUMO loads it: a share of the car
+trips become bike trips, a vehicle class sends `quantity` vehicles, one every
+`period` seconds (the parameters of VEHICLE_PARAMS in constants.py, which also
+provide whichever of the two isn't swept), or its vehicles get a different speed
+factor, and all of it can be scaled with SUMO's --scale. Every combination runs as
+its own headless SUMO process, several at a time, with SUMO writing per-edge
+traffic, emission and noise outputs, which are then reduced to one row of KPIs per
+variant plus the throughput of every edge:
+
+    python -m sumo_web3d.server.sweep --scenario ongar --bike-share 0 25 50 \\
+        --quantity passenger=900 passenger=1800 --output sweep.csv
+
+The variants share a seed, so the only differences between them are the swept ones.
+With --warm-start, each variant is measured from that many seconds in, starting from
+a checkpoint (see checkpoints.py) saved the first time, so a sweep repeated with other
+parameters only pays for the warm-up of variants it hasn't seen before.
+"""
+import argparse
+import concurrent.futures
+import copy
+import csv
+import itertools
+import math
+import os
+import random
+import shlex
+import subprocess
+import tempfile
+from xml.etree import ElementTree
+
+from . import constants  # noqa
+from .benchmark import load_scenarios
+from .checkpoints import CheckpointCache, checkpoint_dir, config_sources
+from .constants import VEHICLE_PARAMS
+from .mode_shift import DEFAULT_FROM_TYPE, DEFAULT_TO_TYPE, choose_vehicles
+from .scenario_cache import default_cache_dir
+from .server import SCENARIOS_PATH
+import sumolib
+
+# The vehicle classes whose demand can be swept. Pedestrians are persons, not trips.
+SWEPT_CLASSES = ('passenger', 'bicycle')
+VEHICLE_TAGS = ('trip', 'vehicle')
+DEFAULT_END = 3600
+DEFAULT_SEED = 42
+
+# Outputs over the whole run, written next to this file. Internal edges count towards
+# the emissions but aren't reported.
+EDGE_DATA_ADDITIONAL = '''<additional>
+    <edgeData id="sweep_traffic" file="traffic.xml"/>
+    <edgeData id="sweep_emissions" type="emissions" file="emissions.xml" withInternal="true"/>
+    <edgeData id="sweep_noise" type="harmonoise" file="noise.xml"/>
+</additional>
+'''
+
+SUMMARY_COLUMNS = (
+    'variant', 'trips', 'bikeTrips', 'unfinished', 'teleports', 'meanTravelTime',
+    'meanTimeLoss', 'co2Kg', 'meanNoiseDb', 'throughput')
+EDGE_COLUMNS = ('variant', 'edge', 'entered', 'speed', 'co2Kg', 'noiseDb')
+
+parser = argparse.ArgumentParser(
+    description='Run a scenario under a grid of demand parameters and compare the KPIs.')
+parser.add_argument(
+    '--scenarios-file', dest='scenarios_file', default=SCENARIOS_PATH,
+    help='JSON list of scenarios, in the format of scenarios.json.')
+parser.add_argument(
+    '--scenario', default='ongar',
+    help='Name of the scenario to sweep.')
+parser.add_argument(
+    '--bike-share', dest='bike_shares', type=float, nargs='+', default=[],
+    help='Percentages of car trips to turn into bike trips.')
+parser.add_argument(
+    '--quantity', dest='quantities', nargs='+', default=[], metavar='CLASS=N',
+    help='Numbers of vehicles of a class (%s), e.g. passenger=900.' % ', '.join(SWEPT_CLASSES))
+parser.add_argument(
+    '--period', dest='periods', nargs='+', default=[], metavar='CLASS=SECONDS',
+    help='Seconds between departures of a class, e.g. bicycle=4.')
+parser.add_argument(
+    '--speed-factor', dest='speed_factors', nargs='+', default=[], metavar='CLASS=FACTOR',
+    help='Speed factors of a class: numbers or distributions such as ' +
+         '"bicycle=normc(1.2,0.1,0.2,2)".')
+parser.add_argument(
+    '--scale', dest='scales', type=float, nargs='+', default=[],
+    help='Factors to scale all of the demand by, with SUMO\'s --scale.')
+parser.add_argument(
+    '--end', type=int, default=DEFAULT_END,
+    help='Simulated seconds to run each variant for.')
+parser.add_argument(
+    '--seed', type=int, default=DEFAULT_SEED,
+    help='Random seed for SUMO and for picking the trips to turn into bike trips.')
+parser.add_argument(
+    '--warm-start', dest='warm_start', type=float, default=0,
+    help='Only measure from this many simulated seconds in (until --end), loading the ' +
+         'state at that time from a checkpoint if an earlier sweep saved one.')
+parser.add_argument(
+    '-j', '--jobs', type=int, default=os.cpu_count(),
+    help='How many variants to run at once. The default is one per CPU.')
+parser.add_argument(
+    '--work-dir', dest='work_dir', default=None,
+    help='Where to keep each variant\'s route files and SUMO outputs. ' +
+         'The default is a new temporary directory.')
+parser.add_argument(
+    '--output', default=None,
+    help='Write the KPIs of every variant to this CSV file.')
+parser.add_argument(
+    '--edges-output', dest='edges_output', default=None,
+    help='Write the throughput, CO2 and noise of every edge in every variant to this CSV file.')
+parser.add_argument(
+    '--sumo-args', dest='sumo_args', default='',
+    help='Additional arguments to pass to sumo.')
+
+
+def type_id(vclass):
+    """The vType of a class's trips, as generated by randomTrips, e.g. veh_passenger."""
+    return '%s_%s' % (VEHICLE_PARAMS[vclass]['prefix'], vclass)
+
+
+def parse_class_values(values, convert=str):
+    """{class: [value, ...]} from ['passenger=900', ...]. Raises ValueError."""
+    by_class = {}
+    for value in values:
+        vclass, sep, value = value.partition('=')
+        if not sep or vclass not in SWEPT_CLASSES:
+            raise ValueError('Expected CLASS=VALUE with a CLASS in %s, got %s' % (
+                ', '.join(SWEPT_CLASSES), value))
+        by_class.setdefault(vclass, []).append(convert(value))
+    return by_class
+
+
+def build_grid(bike_shares=(), quantities=None, periods=None, speed_factors=None, scales=()):
+    """Every combination of the parameters, as a list of variant dicts.
+
+    Variants have keys such as 'bikeShare' and 'passenger.quantity', but only for the
+    parameters being swept. With nothing to sweep, the grid is just the scenario as is.
+    """
+    axes = []
+    if scales:
+        axes.append(('scale', list(scales)))
+    if bike_shares:
+        axes.append(('bikeShare', list(bike_shares)))
+    for param, by_class in (('quantity', quantities), ('period', periods),
+                            ('speedFactor', speed_factors)):
+        for vclass, values in sorted((by_class or {}).items()):
+            axes.append(('%s.%s' % (vclass, param), values))
+    keys = [key for key, _ in axes]
+    return [dict(zip(keys, values)) for values in itertools.product(*[v for _, v in axes])]
+
+
+def describe_variant(variant):
+    return ' '.join('%s=%s' % item for item in sorted(variant.items())) or 'baseline'
+
+
+def class_demand(variant, vclass):
+    """(quantity, period) for the class, or None if the variant keeps its trips as they are."""
+    quantity = variant.get('%s.quantity' % vclass)
+    period = variant.get('%s.period' % vclass)
+    if quantity is None and period is None:
+        return None
+    params = VEHICLE_PARAMS[vclass]
+    return (params['quantity'] if quantity is None else quantity,
+            params['period'] if period is None else period)
+
+
+def depart_time(element):
+    try:
+        return float(element.get('depart', 0))
+    except ValueError:  # e.g. depart="triggered"
+        return 0
+
+
+def retime(root, vtype, quantity, period):
+    """Replace the trips of vtype with quantity of them, departing every period seconds.
+
+    The existing trips are reused in order of departure, repeatedly (with new IDs) if
+    there are fewer than quantity. Returns whether there were any trips of vtype.
+    """
+    trips = [el for el in root if el.tag in VEHICLE_TAGS and el.get('type') == vtype]
+    if not trips:
+        return False
+    for trip in trips:
+        root.remove(trip)
+    trips.sort(key=depart_time)
+    for i in range(quantity):
+        template = trips[i % len(trips)]
+        trip = copy.deepcopy(template)
+        if i >= len(trips):
+            trip.set('id', '%s_%d' % (template.get('id'), i // len(trips)))
+        trip.set('depart', '%.2f' % (i * period))
+        root.append(trip)
+    sort_departures(root)
+    return True
+
+
+def sort_departures(root):
+    """Put the vehicles and persons in order of departure, after everything else."""
+    departing = [el for el in root if el.tag in VEHICLE_TAGS + ('person',)]
+    for el in departing:
+        root.remove(el)
+    root.extend(sorted(departing, key=depart_time))  # A stable sort keeps ties in order.
+
+
+def shift_to_bikes(root, percent, rng):
+    """Turn percent of the car trips into bike trips. Returns how many changed."""
+    trips = {el.get('id'): el for el in root
+             if el.tag in VEHICLE_TAGS and el.get('type') == DEFAULT_FROM_TYPE}
+    chosen = choose_vehicles(list(trips), percent=percent, rng=rng)
+    for trip_id in chosen:
+        trips[trip_id].set('type', DEFAULT_TO_TYPE)
+    return len(chosen)
+
+
+def set_speed_factor(root, vtype, speed_factor):
+    """Set the speedFactor of vtype, if it's defined here. Returns whether it was."""
+    found = False
+    for el in root.iter('vType'):
+        if el.get('id') == vtype:
+            el.set('speedFactor', str(speed_factor))
+            found = True
+    return found
+
+
+def config_paths(config_file, option):
+    """The absolute paths of a .sumocfg option such as 'net-file'."""
+    config_dir = os.path.dirname(os.path.abspath(config_file))
+    el = ElementTree.parse(config_file).getroot().find('.//%s' % option)
+    if el is None or not el.get('value'):
+        return []
+    return [os.path.join(config_dir, path.strip()) for path in el.get('value').split(',')]
+
+
+def read_config(config_file):
+    """The absolute paths of a .sumocfg's route files and additional files."""
+    return config_paths(config_file, 'route-files'), config_paths(config_file, 'additional-files')
+
+
+def write_variant(route_files, variant, variant_dir, seed):
+    """Write the route files that the variant changes to variant_dir.
+
+    Returns the route files to run the variant with, changed or not.
+    """
+    if not variant:
+        return route_files
+    rng = random.Random(seed)
+    paths = []
+    for path in route_files:
+        tree = ElementTree.parse(path)
+        root = tree.getroot()
+        changed = False
+        for vclass in SWEPT_CLASSES:
+            demand = class_demand(variant, vclass)
+            if demand:
+                changed |= retime(root, type_id(vclass), *demand)
+            speed_factor = variant.get('%s.speedFactor' % vclass)
+            if speed_factor is not None:
+                changed |= set_speed_factor(root, type_id(vclass), speed_factor)
+        if variant.get('bikeShare'):
+            changed |= shift_to_bikes(root, variant['bikeShare'], rng) > 0
+        if changed:
+            path = os.path.join(variant_dir, os.path.basename(path))
+            tree.write(path, encoding='UTF-8', xml_declaration=True)
+        paths.append(path)
+    return paths
+
+
+def energy_mean_db(levels):
+    """The mean of sound levels in dB, averaging their energy rather than the decibels."""
+    if not levels:
+        return None
+    return 10 * math.log10(sum(10 ** (level / 10) for level in levels) / len(levels))
+
+
+def read_statistics(path):
+    """The KPIs from SUMO's --statistic-output.
+
+    SUMO reports bike trips apart from the other vehicles' trips; trips and the means
+    cover both.
+    """
+    root = ElementTree.parse(path).getroot()
+
+    def trip_statistics(tag):
+        el = root.find(tag)
+        if el is None or not int(el.get('count', 0)):
+            return 0, 0, 0
+        return int(el.get('count')), float(el.get('duration')), float(el.get('timeLoss'))
+
+    vehicles = trip_statistics('vehicleTripStatistics')
+    bikes = trip_statistics('bikeTripStatistics')
+    trips = vehicles[0] + bikes[0]
+
+    def mean(index):
+        if not trips:
+            return None
+        return round((vehicles[0] * vehicles[index] + bikes[0] * bikes[index]) / trips, 2)
+
+    inserted = root.find('vehicles')
+    teleports = root.find('teleports')
+    return {
+        'trips': trips,
+        'bikeTrips': bikes[0],
+        'unfinished': int(inserted.get('running')) + int(inserted.get('waiting')),
+        'teleports': int(teleports.get('total')) if teleports is not None else 0,
+        'meanTravelTime': mean(1),
+        'meanTimeLoss': mean(2),
+    }
+
+
+def read_edge_values(path, attribute):
+    """{edge ID: attribute} from an edgeData output over a single interval."""
+    return {edge.get('id'): float(edge.get(attribute))
+            for edge in ElementTree.parse(path).getroot().iter('edge')
+            if edge.get(attribute) is not None}
+
+
+def read_edges(variant_dir):
+    """Per-edge rows (without the variant) and the totals for the summary."""
+    entered = read_edge_values(os.path.join(variant_dir, 'traffic.xml'), 'entered')
+    speed = read_edge_values(os.path.join(variant_dir, 'traffic.xml'), 'speed')
+    traffic_secs = read_edge_values(os.path.join(variant_dir, 'traffic.xml'), 'sampledSeconds')
+    co2 = read_edge_values(os.path.join(variant_dir, 'emissions.xml'), 'CO2_abs')
+    sampled = read_edge_values(os.path.join(variant_dir, 'noise.xml'), 'sampledSeconds')
+    noise = read_edge_values(os.path.join(variant_dir, 'noise.xml'), 'noise')
+    rows = []
+    for edge_id in sorted(entered):
+        rows.append({
+            'edge': edge_id,
+            'entered': int(entered[edge_id]),
+            'speed': speed.get(edge_id),  # m/s, None if nobody drove on it.
+            'sampledSeconds': traffic_secs.get(edge_id, 0),
+            'co2Kg': round(co2.get(edge_id, 0) / 1e6, 3),  # SUMO reports mg.
+            'noiseDb': noise.get(edge_id) if sampled.get(edge_id) else None,
+        })
+    mean_noise = energy_mean_db([row['noiseDb'] for row in rows if row['noiseDb']])
+    totals = {
+        'co2Kg': round(sum(co2.values()) / 1e6, 1),
+        'meanNoiseDb': round(mean_noise, 2) if mean_noise is not None else None,
+        'throughput': sum(row['entered'] for row in rows),
+    }
+    return rows, totals
+
+
+def run_sumo(args):
+    result = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode:
+        raise RuntimeError('sumo exited with %d: %s' % (
+            result.returncode, result.stderr.decode('utf-8', 'replace').strip()[-1000:]))
+
+
+def warm_up(base_args, sources, state_args, warm_start):
+    """The path of a variant's checkpoint at warm_start, simulating it first if it's new.
+
+    base_args run the variant without any outputs, sources are its input files and
+    state_args the arguments other than file paths which affect the simulation.
+    """
+    checkpoints = CheckpointCache(checkpoint_dir(default_cache_dir()))
+    path = checkpoints.path(sources, warm_start, state_args)
+    if not os.path.exists(path):
+        temp_path = checkpoints.temp_path(path)
+        run_sumo(base_args + [
+            # SUMO only saves states at times before the end.
+            '--end', str(warm_start + 1),
+            '--save-state.times', str(warm_start),
+            '--save-state.files', temp_path,
+        ])
+        checkpoints.commit(temp_path, path)
+    return path
+
+
+def run_variant(config_file, variant, variant_dir, end, seed, sumo_args='', warm_start=0):
+    """Run one variant in a SUMO process. Returns (summary row, edge rows).
+
+    With warm_start, the outputs only cover the time from warm_start to end. This
+    runs in a worker process of the pool.
+    """
+    os.makedirs(variant_dir, exist_ok=True)
+    route_files, additional_files = read_config(config_file)
+    route_files = write_variant(route_files, variant, variant_dir, seed)
+    edge_data_file = os.path.join(variant_dir, 'edge_data.add.xml')
+    with open(edge_data_file, 'w') as f:
+        f.write(EDGE_DATA_ADDITIONAL)
+    statistics_file = os.path.join(variant_dir, 'statistics.xml')
+    state_args = ['--seed', str(seed)]
+    if variant.get('scale') is not None:
+        state_args += ['--scale', str(variant['scale'])]
+    state_args += shlex.split(sumo_args) if sumo_args else []
+    base_args = [
+        sumolib.checkBinary('sumo'), '-c', config_file,
+        '--route-files', ','.join(route_files),
+        '--verbose', 'false',
+        '--duration-log.statistics', 'false',
+        '--no-warnings', 'true',
+    ] + state_args
+    args = base_args + [
+        '--additional-files', ','.join(additional_files + [edge_data_file]),
+        '--tripinfo-output', os.path.join(variant_dir, 'tripinfo.xml'),
+        '--statistic-output', statistics_file,
+        '--end', str(end),
+    ]
+    if warm_start:
+        sources = config_sources(config_file, ('net-file',)) + route_files + additional_files
+        warm_args = base_args + ['--additional-files', ','.join(additional_files)]
+        args += ['--load-state', warm_up(warm_args, sources, state_args, warm_start)]
+    run_sumo(args)
+    summary = read_statistics(statistics_file)
+    edge_rows, totals = read_edges(variant_dir)
+    summary.update(totals)
+    return summary, edge_rows
+
+
+def run_grid(config_file, grid, work_dir, end, seed, sumo_args='', jobs=None, warm_start=0):
+    """Run every variant of grid, jobs at a time. Returns their results in order.
+
+    A variant which fails gets None rather than a result.
+    """
+    results = [None] * len(grid)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(run_variant, config_file, variant,
+                            os.path.join(work_dir, 'variant-%03d' % i),
+                            end, seed, sumo_args, warm_start): i
+            for i, variant in enumerate(grid)
+        }
+        for future in concurrent.futures.as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                print('Variant %d (%s) failed: %s' % (i, describe_variant(grid[i]), e))
+                continue
+            print('Finished variant %d: %s' % (i, describe_variant(grid[i])))
+    return results
+
+
+def format_value(value):
+    if value is None:
+        return '-'
+    return '%.1f' % value if isinstance(value, float) else str(value)
+
+
+def write_csv(path, columns, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main(args):
+    try:
+        grid = build_grid(
+            args.bike_shares,
+            parse_class_values(args.quantities, int),
+            parse_class_values(args.periods, float),
+            parse_class_values(args.speed_factors),
+            args.scales)
+    except ValueError as e:
+        parser.error(str(e))
+    scenarios = load_scenarios(args.scenarios_file, [args.scenario])
+    if not scenarios:
+        parser.error('No scenario named %s' % args.scenario)
+    config_file = scenarios[0].config_file
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='sumo-web3d-sweep-')
+    print('Running %d variants of %s in %s' % (len(grid), args.scenario, work_dir))
+
+    results = run_grid(config_file, grid, work_dir, args.end, args.seed, args.sumo_args,
+                       args.jobs, args.warm_start)
+
+    summary_rows, edge_rows = [], []
+    for i, (variant, result) in enumerate(zip(grid, results)):
+        if result is None:
+            continue
+        summary, edges = result
+        summary_rows.append(dict(variant, variant=i, **summary))
+        edge_rows.extend(dict(edge, variant=i) for edge in edges)
+
+    params = sorted(grid[0]) if grid else []
+    columns = ['variant'] + params + list(SUMMARY_COLUMNS[1:])
+    print('\n' + ' '.join('%12s' % column[:12] for column in columns))
+    for row in summary_rows:
+        print(' '.join('%12s' % format_value(row.get(column))[:12] for column in columns))
+    if args.output:
+        write_csv(args.output, columns, summary_rows)
+    if args.edges_output:
+        write_csv(args.edges_output, EDGE_COLUMNS, edge_rows)
+
+
+if __name__ == '__main__':
+    main(parser.parse_args())
@@ -0,0 +1,127 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import os
+import random
+import tempfile
+from xml.etree import ElementTree
+
+from nose.plugins.skip import SkipTest
+from nose.tools import assert_raises, eq_, ok_
+
+if not os.environ.get('SUMO_HOME'):
+    # constants.py, and so the sweep, can't be imported without it.
+    raise SkipTest('SUMO_HOME is not set')
+
+from .constants import VEHICLE_PARAMS  # noqa: E402
+from .sweep import (  # noqa: E402
+    build_grid, class_demand, config_paths, energy_mean_db, parse_class_values, read_config,
+    retime, set_speed_factor, shift_to_bikes, write_variant)
+
+ROUTES = '''<routes>
+    <vType id="veh_passenger" vClass="passenger"/>
+    <vType id="bike_bicycle" vClass="bicycle"/>
+    <trip id="veh1" type="veh_passenger" depart="1.00" from="a" to="b"/>
+    <trip id="bike1" type="bike_bicycle" depart="2.00" from="a" to="c"/>
+    <trip id="veh2" type="veh_passenger" depart="3.00" from="b" to="c"/>
+    <trip id="veh3" type="veh_passenger" depart="5.00" from="c" to="a"/>
+</routes>'''
+
+
+def trips(root):
+    return [(el.get('id'), el.get('type'), el.get('depart')) for el in root.iter('trip')]
+
+
+def test_parse_class_values():
+    eq_({'passenger': [900, 1800], 'bicycle': [10]},
+        parse_class_values(['passenger=900', 'bicycle=10', 'passenger=1800'], int))
+    eq_({'bicycle': ['normc(1,0.1,0.2,2)']}, parse_class_values(['bicycle=normc(1,0.1,0.2,2)']))
+    assert_raises(ValueError, parse_class_values, ['pedestrian=10'])
+    assert_raises(ValueError, parse_class_values, ['900'])
+
+
+def test_build_grid():
+    eq_([{}], build_grid())
+    grid = build_grid([0, 50], {'passenger': [900, 1800]}, None, {'bicycle': [1.2]})
+    eq_(4, len(grid))
+    eq_({'bikeShare': 50, 'passenger.quantity': 900, 'bicycle.speedFactor': 1.2}, grid[2])
+    eq_(4, len({tuple(sorted(variant.items())) for variant in grid}))
+    eq_([{'scale': 0.5, 'bikeShare': 0}, {'scale': 2, 'bikeShare': 0}],
+        build_grid([0], scales=[0.5, 2]))
+
+
+def test_class_demand():
+    eq_(None, class_demand({'bikeShare': 10}, 'passenger'))
+    eq_((900, VEHICLE_PARAMS['passenger']['period']),
+        class_demand({'passenger.quantity': 900}, 'passenger'))
+    eq_((VEHICLE_PARAMS['bicycle']['quantity'], 4), class_demand({'bicycle.period': 4}, 'bicycle'))
+
+
+def test_retime():
+    root = ElementTree.fromstring(ROUTES)
+    ok_(retime(root, 'veh_passenger', 5, 2))
+    eq_([
+        ('veh1', 'veh_passenger', '0.00'),
+        ('bike1', 'bike_bicycle', '2.00'),
+        ('veh2', 'veh_passenger', '2.00'),
+        ('veh3', 'veh_passenger', '4.00'),
+        ('veh1_1', 'veh_passenger', '6.00'),
+        ('veh2_1', 'veh_passenger', '8.00'),
+    ], trips(root))
+    # vTypes stay ahead of the trips which use them.
+    eq_(['vType', 'vType'], [el.tag for el in root][:2])
+
+    root = ElementTree.fromstring(ROUTES)
+    ok_(retime(root, 'veh_passenger', 1, 2))
+    eq_(['bike1', 'veh1'], sorted(trip_id for trip_id, _, _ in trips(root)))
+    ok_(not retime(root, 'truck_truck', 1, 2))
+
+
+def test_shift_to_bikes():
+    root = ElementTree.fromstring(ROUTES)
+    eq_(2, shift_to_bikes(root, 50, random.Random(1)))
+    types = [vtype for _, vtype, _ in trips(root)]
+    eq_(3, types.count('bike_bicycle'))
+    eq_(1, types.count('veh_passenger'))
+
+    # The same seed picks the same trips.
+    other = ElementTree.fromstring(ROUTES)
+    shift_to_bikes(other, 50, random.Random(1))
+    eq_(trips(root), trips(other))
+
+
+def test_set_speed_factor():
+    root = ElementTree.fromstring(ROUTES)
+    ok_(set_speed_factor(root, 'bike_bicycle', 'normc(1.2,0.1,0.2,2)'))
+    eq_('normc(1.2,0.1,0.2,2)', root.find('vType[@id="bike_bicycle"]').get('speedFactor'))
+    ok_(not set_speed_factor(root, 'truck_truck', 1.1))
+
+
+def test_write_variant():
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, content in (('demand.rou.xml', ROUTES), ('pt.rou.xml', '<routes/>')):
+            with open(os.path.join(tmp, name), 'w') as f:
+                f.write(content)
+        config = os.path.join(tmp, 'test.sumocfg')
+        with open(config, 'w') as f:
+            f.write('<configuration><input>'
+                    '<route-files value="pt.rou.xml,demand.rou.xml"/>'
+                    '</input></configuration>')
+        route_files, additional_files = read_config(config)
+        eq_([os.path.join(tmp, 'pt.rou.xml'), os.path.join(tmp, 'demand.rou.xml')], route_files)
+        eq_([], additional_files)
+        eq_([], config_paths(config, 'net-file'))
+
+        eq_(route_files, write_variant(route_files, {}, tmp, 1))
+        variant_dir = os.path.join(tmp, 'variant')
+        os.mkdir(variant_dir)
+        paths = write_variant(route_files, {'bikeShare': 100}, variant_dir, 1)
+        # Only the file with car trips changes.
+        eq_([route_files[0], os.path.join(variant_dir, 'demand.rou.xml')], paths)
+        types = {el.get('type') for el in ElementTree.parse(paths[1]).getroot().iter('trip')}
+        eq_({'bike_bicycle'}, types)
+
+
+def test_energy_mean_db():
+    eq_(None, energy_mean_db([]))
+    eq_(60, round(energy_mean_db([60, 60]), 6))
+    # Ten times the energy is 10dB louder; the mean of 1 and 10 times is 5.5 times.
+    eq_(round(60 + 10 * 0.7403627, 4), round(energy_mean_db([60, 70]), 4))
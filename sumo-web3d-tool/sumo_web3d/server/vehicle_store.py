@@ -0,0 +1,200 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Vehicle state kept as NumPy columns rather than one dict per vehicle.
+
+Each vehicle (or person) occupies a slot for as long as it is in the simulation,
+and each field is a column indexed by slot. Rounding and change detection run on
+whole columns, so a step only costs Python time for the vehicles that changed,
+when their creations and updates are built.
+
+VehicleStore.update produces the same creations/updates/removals delta that
+deltas.round_vehicles followed by deltas.diff_dicts would for the equivalent
+dicts: x and y rounded to centimeters, speed and angle to integers, and NaN values
+never reported as updates.
+"""
+from collections import Counter
+from collections.abc import Mapping
+
+import numpy as np
+
+# In the order of the keys of the dicts the server used to build for each vehicle.
+FIELDS = ('x', 'y', 'z', 'speed', 'angle', 'type', 'length', 'width', 'signals', 'person',
+          'vClass')
+STRING_FIELDS = frozenset(['type', 'person', 'vClass'])
+INT_FIELDS = frozenset(['speed', 'angle', 'signals'])
+DECIMALS = {'x': 2, 'y': 2, 'speed': 0, 'angle': 0}
+
+INITIAL_CAPACITY = 256
+
+
+def _new_column(field, capacity):
+    if field in STRING_FIELDS:
+        return np.full(capacity, None, dtype=object)
+    return np.full(capacity, np.nan)
+
+
+def _to_python(field, values):
+    """Turn a column slice into Python values, ints for integer fields unless NaN."""
+    values = values.tolist()
+    if field in INT_FIELDS:
+        return [v if v != v else int(v) for v in values]
+    return values
+
+
+def _build_dicts(columns, present, slots, fields):
+    """Build one dict per slot, holding its fields that are set in present.
+
+    present maps each field to a bool array which lines up with slots.
+    """
+    records = [{} for _ in range(len(slots))]
+    for field in fields:
+        rows = np.flatnonzero(present[field])
+        if not len(rows):
+            continue
+        for row, value in zip(rows.tolist(), _to_python(field, columns[field][slots[rows]])):
+            records[row][field] = value
+    return records
+
+
+class VehicleState(Mapping):
+    """An immutable copy of all vehicles at one step, e.g. for a Frame's keyframe.
+
+    It behaves like the {vehicle ID: fields} dict the server used to keep, but that
+    dict is only built once something looks a vehicle up.
+    """
+
+    def __init__(self, ids, columns, has):
+        self._ids = ids
+        self._columns = columns
+        self._has = has
+        self._dict = None
+
+    def to_dict(self):
+        if self._dict is None:
+            present = {field: self._has[field] for field in FIELDS}
+            records = _build_dicts(self._columns, present, np.arange(len(self._ids)), FIELDS)
+            self._dict = dict(zip(self._ids, records))
+        return self._dict
+
+    def __getitem__(self, veh_id):
+        return self.to_dict()[veh_id]
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def positions(self):
+        """The vehicles' IDs with their x and y columns."""
+        return self._ids, self._columns['x'], self._columns['y']
+
+    def ids_of_type(self, vtype):
+        """The IDs of the vehicles (not persons) whose vType is vtype."""
+        mask = (self._columns['type'] == vtype) & (self._columns['vClass'] != 'pedestrian')
+        return [self._ids[i] for i in np.flatnonzero(mask).tolist()]
+
+    def vehicle_counts(self):
+        """Number of vehicles of each vClass."""
+        return Counter(self._columns['vClass'].tolist())
+
+
+class VehicleStore(object):
+    """Tracks the vehicles of one simulation in slot-indexed NumPy columns."""
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.slots = {}  # vehicle ID -> slot
+        self.ids = np.full(capacity, None, dtype=object)
+        self.columns = {field: _new_column(field, capacity) for field in FIELDS}
+        self.has = {field: np.zeros(capacity, dtype=bool) for field in FIELDS}
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        capacity = len(self.ids)
+        extra = capacity
+        self.ids = np.concatenate([self.ids, np.full(extra, None, dtype=object)])
+        for field in FIELDS:
+            self.columns[field] = np.concatenate(
+                [self.columns[field], _new_column(field, extra)])
+            self.has[field] = np.concatenate([self.has[field], np.zeros(extra, dtype=bool)])
+        self._free = list(range(capacity + extra - 1, capacity - 1, -1)) + self._free
+
+    def _allocate(self, veh_id):
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.slots[veh_id] = slot
+        self.ids[slot] = veh_id
+        return slot
+
+    def _release(self, veh_id):
+        slot = self.slots.pop(veh_id)
+        self.ids[slot] = None
+        for field in FIELDS:
+            self.has[field][slot] = False
+            self.columns[field][slot] = None if field in STRING_FIELDS else np.nan
+        self._free.append(slot)
+
+    def update(self, groups):
+        """Replace the state with this step's vehicles and return the delta.
+
+        groups is a list of (IDs, {field: values}) pairs, where each group's vehicles
+        share the same fields (e.g. vehicles and persons) and values line up with IDs.
+        Vehicles missing from every group are removed.
+        """
+        step_ids = [veh_id for ids, _ in groups for veh_id in ids]
+        removals = list(self.slots.keys() - set(step_ids))
+        for veh_id in removals:
+            self._release(veh_id)
+        created = [self._allocate(veh_id) for veh_id in step_ids if veh_id not in self.slots]
+        created_mask = np.zeros(len(self.ids), dtype=bool)
+        created_mask[created] = True
+        changed = {}  # field -> bool column of the slots where it changed.
+
+        for ids, values_by_field in groups:
+            if not len(ids):
+                continue
+            slots = np.fromiter((self.slots[veh_id] for veh_id in ids), dtype=np.intp,
+                                count=len(ids))
+            for field, values in values_by_field.items():
+                column = self.columns[field]
+                if field in STRING_FIELDS:
+                    new = np.empty(len(ids), dtype=object)
+                    new[:] = values
+                    is_change = (column[slots] != new) | ~self.has[field][slots]
+                else:
+                    new = np.asarray(values, dtype=float)
+                    if field in DECIMALS:
+                        new = np.round(new, DECIMALS[field])
+                    # NaN never counts as an update, like deltas.diff.
+                    old = column[slots]
+                    is_change = ((old != new) | ~self.has[field][slots]) & ~np.isnan(new)
+                column[slots] = new
+                self.has[field][slots] = True
+                if field not in changed:
+                    changed[field] = np.zeros(len(self.ids), dtype=bool)
+                changed[field][slots] = is_change
+
+        creations = dict(zip(self.ids[created].tolist(),
+                             _build_dicts(self.columns, {f: self.has[f][created] for f in FIELDS},
+                                          np.asarray(created, dtype=np.intp), FIELDS)))
+        for field in changed:
+            changed[field] &= ~created_mask
+        any_change = np.zeros(len(self.ids), dtype=bool)
+        for column in changed.values():
+            any_change |= column
+        updated = np.flatnonzero(any_change)
+        updates = dict(zip(self.ids[updated].tolist(),
+                           _build_dicts(self.columns,
+                                        {f: c[updated] for f, c in changed.items()},
+                                        updated, changed.keys())))
+        return {'creations': creations, 'updates': updates, 'removals': removals}
+
+    def state(self):
+        """Copy the current vehicles into a VehicleState."""
+        slots = np.fromiter(self.slots.values(), dtype=np.intp, count=len(self.slots))
+        return VehicleState(list(self.slots.keys()),
+                            {field: self.columns[field][slots] for field in FIELDS},
+                            {field: self.has[field][slots] for field in FIELDS})
+
+    def __len__(self):
+        return len(self.slots)
@@ -0,0 +1,74 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import json
+import math
+import random
+
+from nose.tools import eq_, ok_
+
+from .deltas import diff_dicts, round_vehicles
+from .vehicle_store import VehicleStore
+
+VEHICLE_FIELDS = ('x', 'y', 'z', 'speed', 'angle', 'type', 'length', 'width', 'signals',
+                  'vClass')
+PERSON_FIELDS = ('x', 'y', 'z', 'speed', 'angle', 'type', 'length', 'width', 'person',
+                 'vClass')
+
+
+def random_vehicle(rng, vehicle):
+    return {
+        'x': rng.uniform(0, 1000),
+        'y': rng.uniform(0, 1000),
+        'z': 0.0,
+        'speed': rng.choice([vehicle.get('speed', 0), rng.uniform(0, 30)]),
+        'angle': rng.choice([vehicle.get('angle', 0), rng.uniform(0, 360)]),
+        'type': vehicle.get('type') or rng.choice(['veh_passenger', 'bus_bus']),
+        'length': 4.5,
+        'width': 1.8,
+        'signals': rng.choice([0, 8]),
+        'vClass': vehicle.get('vClass') or rng.choice(['passenger', 'bus', None]),
+    }
+
+
+def as_groups(vehicles, fields):
+    ids = list(vehicles)
+    return (ids, {field: [vehicles[veh_id][field] for veh_id in ids] for field in fields})
+
+
+def test_matches_dict_deltas():
+    rng = random.Random(4)
+    store = VehicleStore(capacity=4)  # Small, so that it has to grow.
+    before = {}
+    vehicles = {}
+    person = {'x': 1.0, 'y': 2.0, 'z': 0, 'speed': 1, 'angle': 90, 'type': 'ped', 'length': 0.2,
+              'width': 0.5, 'person': '', 'vClass': 'pedestrian'}
+    for step in range(30):
+        for veh_id in rng.sample(sorted(vehicles), len(vehicles) // 4):
+            del vehicles[veh_id]
+        for veh_id in list(vehicles):
+            vehicles[veh_id] = random_vehicle(rng, vehicles[veh_id])
+        for i in range(rng.randint(0, 8)):
+            vehicles['veh%d.%d' % (step, i)] = random_vehicle(rng, {})
+        persons = {'ped0': dict(person, x=step)} if step % 10 < 5 else {}
+
+        delta = store.update([as_groups(vehicles, VEHICLE_FIELDS),
+                              as_groups(persons, PERSON_FIELDS)])
+        after = json.loads(json.dumps(dict(vehicles, **persons)))
+        round_vehicles(after)
+        expected = diff_dicts(before, after)
+        eq_(expected['creations'], delta['creations'])
+        eq_(expected['updates'], delta['updates'])
+        eq_(sorted(expected['removals']), sorted(delta['removals']))
+        eq_(after, store.state().to_dict())
+        before = after
+    eq_(len(vehicles) + len(persons), len(store))
+
+
+def test_nan_is_not_an_update():
+    store = VehicleStore()
+    car = {'x': 1.0, 'y': 2.0, 'speed': 3}
+    store.update([(['car'], {k: [v] for k, v in car.items()})])
+    delta = store.update([(['car'], {'x': [float('nan')], 'y': [2.0], 'speed': [4]})])
+    eq_({'car': {'speed': 4}}, delta['updates'])
+    state = store.state()
+    ok_(math.isnan(state['car']['x']))
+    eq_({None: 1}, state.vehicle_counts())
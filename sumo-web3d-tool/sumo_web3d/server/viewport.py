@@ -0,0 +1,172 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Culls snapshots down to the vehicles inside each client's viewport.
+
+Clients which send their camera's bounding box (in SUMO coordinates) only receive
+the vehicles inside it. A SpatialGrid is built once per frame over all vehicle
+positions, and each client's ViewportFilter turns the frame's delta into one for
+the vehicles it can see: vehicles which come into view are sent as creations (with
+all their fields), vehicles which leave it as removals, and updates are only sent
+for vehicles the client already has.
+
+A client which would see more than lod_vehicles vehicles (when the server runs with
+--lod-vehicles) gets a density heatmap of its view instead (see density.py): all of
+its vehicles are removed, and each snapshot carries the density of the cells in view.
+It gets vehicles again once the number in view drops below LOD_EXIT_FRACTION of the
+threshold; the gap keeps a client near the threshold from flipping back and forth.
+Clients without bounds always get every vehicle.
+"""
+import math
+
+import numpy as np
+
+DEFAULT_CELL_SIZE = 100  # meters
+LOD_EXIT_FRACTION = 0.75
+
+
+class SpatialGrid(object):
+    """A uniform grid over vehicle positions, for finding the vehicles in a box."""
+
+    def __init__(self, ids, x, y, cell_size=DEFAULT_CELL_SIZE):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+        self.cell_size = cell_size
+        self.ids = np.asarray(ids, dtype=object)[valid]
+        self.x = x[valid]
+        self.y = y[valid]
+        self.cells = {}  # (column, row) -> indices into ids
+        columns = np.floor(self.x / cell_size).astype(np.int64)
+        rows = np.floor(self.y / cell_size).astype(np.int64)
+        order = np.lexsort((rows, columns))
+        if len(order):
+            columns, rows = columns[order], rows[order]
+            starts = np.flatnonzero(np.diff(columns) | np.diff(rows)) + 1
+            bounds = zip(np.concatenate([[0], starts]).tolist(),
+                         np.concatenate([starts, [len(order)]]).tolist())
+            for start, end in bounds:
+                self.cells[(int(columns[start]), int(rows[start]))] = order[start:end]
+
+    @classmethod
+    def from_vehicles(cls, vehicles, cell_size=DEFAULT_CELL_SIZE):
+        """Build a grid over a vehicle_store.VehicleState or a {vehicle ID: fields} dict."""
+        if hasattr(vehicles, 'positions'):
+            return cls(*vehicles.positions(), cell_size=cell_size)
+        ids = list(vehicles)
+        return cls(ids, [vehicles[i]['x'] for i in ids], [vehicles[i]['y'] for i in ids],
+                   cell_size=cell_size)
+
+    def query(self, xmin, ymin, xmax, ymax):
+        """The set of IDs of the vehicles inside the box."""
+        first_column, last_column = self._cell(xmin), self._cell(xmax)
+        first_row, last_row = self._cell(ymin), self._cell(ymax)
+        num_cells = (last_column - first_column + 1) * (last_row - first_row + 1)
+        if num_cells > len(self.cells):
+            # A large box: checking the occupied cells is cheaper than visiting every cell.
+            keys = [(c, r) for c, r in self.cells
+                    if first_column <= c <= last_column and first_row <= r <= last_row]
+        else:
+            keys = [(c, r) for c in range(first_column, last_column + 1)
+                    for r in range(first_row, last_row + 1) if (c, r) in self.cells]
+        if not keys:
+            return set()
+        candidates = np.concatenate([self.cells[key] for key in keys])
+        x, y = self.x[candidates], self.y[candidates]
+        inside = candidates[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]
+        return set(self.ids[inside].tolist())
+
+    def _cell(self, value):
+        return int(math.floor(value / self.cell_size))
+
+
+def parse_bounds(bounds):
+    """Validate a client's [xmin, ymin, xmax, ymax], or None for no culling."""
+    if bounds is None:
+        return None
+    if len(bounds) != 4:
+        raise ValueError('Viewport bounds must be [xmin, ymin, xmax, ymax]')
+    xmin, ymin, xmax, ymax = [float(v) for v in bounds]
+    if not all(math.isfinite(v) for v in (xmin, ymin, xmax, ymax)):
+        raise ValueError('Viewport bounds must be finite')
+    if xmin > xmax or ymin > ymax:
+        raise ValueError('Viewport bounds must be [xmin, ymin, xmax, ymax]')
+    return xmin, ymin, xmax, ymax
+
+
+class ViewportFilter(object):
+    """Tracks which vehicles one client has and filters frames down to its viewport.
+
+    visible holds the IDs of the vehicles the client currently has. Setting bounds to
+    None lets everything back in. Past lod_vehicles vehicles in view (never if 0), the
+    client gets its frames' density rather than their vehicles; lod says whether it does.
+    """
+
+    def __init__(self, bounds, visible, lod_vehicles=0):
+        self.bounds = bounds
+        self.visible = set(visible)
+        self.lod_vehicles = lod_vehicles
+        self.lod = False
+
+    def _in_view(self, frame):
+        """The IDs of the vehicles the client should have, switching LOD if it has to.
+
+        Frames without a density (see hub.Frame) leave the LOD as it is.
+        """
+        if self.bounds is None:
+            self.lod = False
+            return set(frame.vehicles)
+        has_density = self.lod_vehicles and frame.density is not None
+        if self.lod and has_density:
+            # Counting from the density spares querying every vehicle in a large view.
+            count = frame.density.count(self.bounds)
+            self.lod = count >= LOD_EXIT_FRACTION * self.lod_vehicles
+        if self.lod:
+            return set()
+        in_view = frame.grid().query(*self.bounds)
+        if has_density and len(in_view) > self.lod_vehicles:
+            self.lod = True
+            return set()
+        return in_view
+
+    def filter(self, frame):
+        """The frame's snapshot with only the vehicle changes inside the viewport."""
+        vehicles = frame.snapshot['vehicles']
+        in_view = self._in_view(frame)
+        updates = {veh_id: update for veh_id, update in vehicles['updates'].items()
+                   if veh_id in in_view and veh_id in self.visible}
+        snapshot = dict(frame.snapshot, vehicles=self._transition(frame, in_view, updates))
+        return self._add_density(snapshot, frame)
+
+    def refresh(self, frame):
+        """Only the enter/leave transitions since the last frame, e.g. after moving the camera.
+
+        The snapshot keeps the frame's time but has no vehicle updates or light changes.
+        """
+        in_view = self._in_view(frame)
+        snapshot = dict(frame.snapshot, vehicles=self._transition(frame, in_view, {}))
+        snapshot['lights'] = {'creations': {}, 'updates': {}, 'removals': []}
+        return self._add_density(snapshot, frame)
+
+    def keyframe(self, frame):
+        """The full state inside the viewport, for a client which has nothing yet."""
+        self.visible = set()
+        snapshot = self.refresh(frame)
+        snapshot['lights'] = {'creations': frame.lights, 'updates': {}, 'removals': []}
+        snapshot['keyframe'] = True
+        return snapshot
+
+    def _add_density(self, snapshot, frame):
+        if self.lod_vehicles:
+            snapshot['lod'] = self.lod
+            if self.lod and frame.density is not None:
+                snapshot['density'] = frame.density.to_dict(self.bounds)
+        return snapshot
+
+    def _transition(self, frame, in_view, updates):
+        entered = in_view - self.visible
+        left = self.visible - in_view
+        self.visible = in_view
+        return {
+            'creations': {veh_id: frame.vehicles[veh_id] for veh_id in entered},
+            'updates': updates,
+            'removals': list(left),
+        }
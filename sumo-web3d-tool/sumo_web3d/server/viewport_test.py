@@ -0,0 +1,68 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import random
+
+from nose.tools import eq_, ok_
+
+from .deltas import apply_delta, diff_dicts
+from .density import DensityGrid
+from .hub import Frame
+from .viewport import SpatialGrid, ViewportFilter
+
+
+def test_grid_query():
+    rng = random.Random(0)
+    ids = ['veh%d' % i for i in range(500)]
+    x = [rng.uniform(-1000, 1000) for _ in ids]
+    y = [rng.uniform(-1000, 1000) for _ in ids]
+    x[0] = float('nan')  # Vehicles without a position are never in view.
+    grid = SpatialGrid(ids, x, y, cell_size=50)
+    for box in [(-100, -100, 100, 100), (-10 ** 6, -10 ** 6, 10 ** 6, 10 ** 6),
+                (0, 0, 0.5, 0.5), (-1000, 250, -600, 999)]:
+        xmin, ymin, xmax, ymax = box
+        expected = {veh_id for veh_id, vx, vy in zip(ids, x, y)
+                    if xmin <= vx <= xmax and ymin <= vy <= ymax}
+        eq_(expected, grid.query(*box))
+    ok_('veh0' not in grid.query(-10 ** 6, -10 ** 6, 10 ** 6, 10 ** 6))
+
+
+def test_filter_tracks_enter_and_leave():
+    # One vehicle drives along the x axis through the viewport; another stays put inside it.
+    states = [{'mover': {'x': float(x), 'y': 0.0, 'speed': 10}, 'parked': {'x': 50.0, 'y': 5.0}}
+              for x in range(-30, 140, 10)]
+    viewport = ViewportFilter((0, -10, 100, 10), ())
+    client = {}
+    before = {}
+    for vehicles in states:
+        snapshot = {'time': 0, 'vehicles': diff_dicts(before, vehicles), 'lights': {}}
+        filtered = viewport.filter(Frame(snapshot, vehicles, {}))
+        apply_delta(client, filtered['vehicles'])
+        eq_({veh_id: v for veh_id, v in vehicles.items() if 0 <= v['x'] <= 100}, client)
+        before = vehicles
+
+    # Clearing the bounds sends everything which was culled.
+    viewport.bounds = None
+    apply_delta(client, viewport.refresh(Frame(snapshot, before, {}))['vehicles'])
+    eq_(before, client)
+
+
+def test_crowded_viewport_switches_to_density():
+    grid = DensityGrid({'road': [(0, 0), (1000, 0)]})
+    viewport = ViewportFilter((0, -10, 1000, 10), (), lod_vehicles=4)
+    client = {}
+    before = {}
+    # Past 4 vehicles in view the client gets densities, until there are fewer than 3.
+    for count, lod in [(3, False), (5, True), (3, True), (2, False)]:
+        vehicles = {'veh%d' % i: {'x': 100.0 * i, 'y': 0.0} for i in range(count)}
+        density = grid.aggregate(['road'], {'vehicles': [count], 'speed': [5],
+                                            'occupancy': [0.1]})
+        snapshot = {'time': 0, 'vehicles': diff_dicts(before, vehicles), 'lights': {}}
+        filtered = viewport.filter(Frame(snapshot, vehicles, {}, density=density))
+        apply_delta(client, filtered['vehicles'])
+        eq_(lod, filtered['lod'])
+        eq_({} if lod else vehicles, client)
+        eq_(lod, 'density' in filtered)
+        before = vehicles
+
+    # Without bounds, everything comes back.
+    viewport.bounds = None
+    ok_(not viewport.filter(Frame(snapshot, before, {}, density=density))['lod'])
@@ -0,0 +1,191 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+"""Runs the SUMO simulation on a dedicated thread.
+
+A TraCI step, plus the subscription reads that follow it, blocks for as long as
+SUMO takes. Doing that on the asyncio event loop stalls websocket control
+messages and HTTP routes, so all TraCI access goes through a SimulationWorker:
+the event loop submits calls to its thread and awaits frames from a bounded
+queue. When the queue is full the worker stops stepping, so a slow consumer
+paces the simulation rather than piling up frames.
+
+With no delay, the simulation runs as fast as it can and a frame per step would
+be far more than anybody can watch. Instead, the worker advances several steps per
+frame (step_fn reads SimulationWorker.batch), tuned so that frames come out at
+about target_fps and the per-frame costs are paid only once per batch.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STATUS_OFF = 'off'
+STATUS_RUNNING = 'running'
+STATUS_PAUSED = 'paused'
+
+DEFAULT_DELAY_MS = 30
+FRAME_QUEUE_SIZE = 4
+DEFAULT_TARGET_FPS = 30
+MAX_BATCH = 100  # steps per frame
+
+# How often a worker blocked on a full frame queue checks for new commands.
+PUBLISH_POLL_SECS = 0.05
+
+
+class SimulationWorker(object):
+    """Owns the TraCI connection and steps it on its own thread.
+
+    step_fn is called on the worker thread once per frame, should advance the
+    simulation by batch steps and returns the frame to publish. close_fn is called
+    on the worker thread to tear the simulation down. Everything else that touches
+    TraCI must go through call().
+    """
+
+    def __init__(self, loop, step_fn, close_fn, max_frames=FRAME_QUEUE_SIZE,
+                 name='sumo-worker', target_fps=DEFAULT_TARGET_FPS):
+        self.loop = loop
+        self.step_fn = step_fn
+        self.close_fn = close_fn
+        self.frames = asyncio.Queue(maxsize=max_frames)
+        self.status = STATUS_OFF
+        self.delay_ms = DEFAULT_DELAY_MS
+        self.target_fps = target_fps
+        self.batch = 1  # Steps per frame; only ever more than one with no delay.
+        self._commands = queue.Queue()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def call(self, fn, *args):
+        """Run fn(*args) on the worker thread. Returns an awaitable for its result."""
+        future = concurrent.futures.Future()
+        self._commands.put((future, fn, args))
+        return asyncio.wrap_future(future, loop=self.loop)
+
+    async def start(self, start_fn):
+        """(Re)start the simulation using start_fn, e.g. start_sumo_executable."""
+        self.drain_frames()
+        await self.call(self._start, start_fn)
+
+    async def cancel(self):
+        await self.call(self._close)
+        self.drain_frames()
+
+    async def shutdown(self):
+        """Close the simulation and end the worker thread. The worker can't be reused."""
+        await self.call(self._stop_thread)
+        self.drain_frames()
+
+    async def set_status(self, status):
+        """Pause or resume a started simulation."""
+        await self.call(self._set_status, status)
+
+    def set_delay(self, delay_ms):
+        self.delay_ms = delay_ms
+        if delay_ms:
+            self.batch = 1
+
+    def drain_frames(self):
+        """Drop frames that have been produced but not consumed yet."""
+        while not self.frames.empty():
+            self.frames.get_nowait()
+
+    # The methods below run on the worker thread.
+
+    def _start(self, start_fn):
+        if self.status != STATUS_OFF:
+            self._close()
+        start_fn()
+        self.batch = 1
+        self.status = STATUS_RUNNING
+
+    def _close(self):
+        if self.status != STATUS_OFF:
+            self.status = STATUS_OFF
+            try:
+                self.close_fn()
+            except Exception:
+                logger.exception('Error while closing the simulation')
+
+    def _stop_thread(self):
+        self._close()
+        self._stopped = True
+
+    def _set_status(self, status):
+        if self.status != STATUS_OFF:
+            self.status = status
+
+    def _run_command(self, command):
+        future, fn, args = command
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _run_pending_commands(self, timeout=0):
+        """Run queued commands until none arrive within timeout seconds.
+
+        With timeout=None, block until at least one command has been run.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                if remaining == 0:
+                    command = self._commands.get_nowait()
+                else:
+                    command = self._commands.get(timeout=remaining)
+            except queue.Empty:
+                return
+            self._run_command(command)
+            if deadline is None:
+                return
+
+    def _publish(self, frame):
+        """Hand frame to the event loop, waiting while the frame queue is full."""
+        future = asyncio.run_coroutine_threadsafe(self.frames.put(frame), self.loop)
+        while True:
+            try:
+                future.result(timeout=PUBLISH_POLL_SECS)
+                return
+            except concurrent.futures.TimeoutError:
+                # Stay responsive to pause/cancel while the consumer catches up.
+                self._run_pending_commands()
+                if self.status == STATUS_OFF:
+                    future.cancel()
+                    return
+
+    def _run(self):
+        while not self._stopped:
+            if self.status == STATUS_RUNNING:
+                self._run_pending_commands(self.delay_ms / 1000)
+            else:
+                self._run_pending_commands(None)
+            if self.status != STATUS_RUNNING or self._stopped:
+                continue
+            start = time.monotonic()
+            try:
+                frame = self.step_fn()
+            except Exception:
+                # Typically SUMO exiting at the end of the scenario.
+                logger.exception('Simulation step failed; stopping the simulation')
+                self._close()
+                continue
+            if self.delay_ms == 0 and self.target_fps:
+                self.batch = tune_batch(self.batch, time.monotonic() - start, self.target_fps)
+            self._publish(frame)
+
+
+def tune_batch(batch, frame_secs, target_fps):
+    """The steps per frame to use next, given that batch steps took frame_secs.
+
+    Moves halfway towards the batch which would take 1 / target_fps seconds, so that
+    one slow step doesn't throw it off.
+    """
+    ideal = batch / (frame_secs * target_fps) if frame_secs > 0 else MAX_BATCH
+    return int(min(max(round((batch + ideal) / 2), 1), MAX_BATCH))
@@ -0,0 +1,69 @@
+# Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
+import asyncio
+import itertools
+import threading
+
+from nose.tools import eq_, ok_
+
+from .worker import (
+    MAX_BATCH, SimulationWorker, STATUS_OFF, STATUS_PAUSED, STATUS_RUNNING, tune_batch)
+
+
+def make_worker(loop, max_frames=4):
+    counter = itertools.count()
+    closed = []
+    worker = SimulationWorker(loop, lambda: next(counter), lambda: closed.append(True),
+                              max_frames=max_frames)
+    worker.set_delay(0)
+    return worker, closed
+
+
+def test_frames_and_commands_run_on_worker_thread():
+    loop = asyncio.new_event_loop()
+    worker, closed = make_worker(loop)
+
+    async def scenario():
+        await worker.start(lambda: None)
+        eq_(STATUS_RUNNING, worker.status)
+        frames = [await worker.frames.get() for _ in range(3)]
+        thread_name = await worker.call(lambda: threading.current_thread().name)
+        await worker.set_status(STATUS_PAUSED)
+        eq_(STATUS_PAUSED, worker.status)
+        await worker.cancel()
+        return frames, thread_name
+
+    frames, thread_name = loop.run_until_complete(scenario())
+    eq_([0, 1, 2], frames)
+    eq_('sumo-worker', thread_name)
+    eq_(STATUS_OFF, worker.status)
+    eq_([True], closed)
+    loop.close()
+
+
+def test_full_queue_blocks_stepping_but_not_commands():
+    loop = asyncio.new_event_loop()
+    worker, _ = make_worker(loop, max_frames=2)
+
+    async def scenario():
+        await worker.start(lambda: None)
+        await asyncio.sleep(0.2)
+        # Nobody consumed, so the worker is waiting with a full queue...
+        eq_(2, worker.frames.qsize())
+        # ...yet still answers calls.
+        eq_(42, await worker.call(lambda: 42))
+        await worker.cancel()
+        ok_(worker.frames.empty())
+
+    loop.run_until_complete(scenario())
+    loop.close()
+
+
+def test_tune_batch():
+    # One step per frame takes 1ms, so at 50 frames per second there's time for 20.
+    batch = 1
+    for _ in range(20):
+        batch = tune_batch(batch, batch * 0.001, 50)
+    eq_(20, batch)
+    # Steps that are slower than a frame never go below one per frame.
+    eq_(1, tune_batch(1, 1.0, 50))
+    eq_(MAX_BATCH, tune_batch(MAX_BATCH, 0, 50))
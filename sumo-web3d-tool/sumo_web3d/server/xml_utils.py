@@ -1,8 +1,22 @@
 # Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
 """Utility code for working with XML files."""
+import xml.etree.ElementTree as ElementTree
 
 import xmltodict
 
+# The children of <net> which the frontend uses (see Net in api.ts), and whether each
+# is a list of elements rather than a single one.
+NETWORK_TAGS = {
+    'location': False,
+    'type': True,
+    'edge': True,
+    'junction': True,
+    'connection': True,
+    'tlLogic': True,
+}
+# Elements the frontend never looks at, which can be a large part of a network.
+SKIPPED_TAGS = frozenset(['request', 'param'])
+
 
 def parse_xml_file(filepath):
     if filepath:
@@ -20,3 +34,54 @@ def get_only_key(d):
     assert d, 'Expected dict but got %s' % d
     assert len(d.keys()) == 1, 'Expected one key but got multiple %s' % d.keys()
     return d[list(d.keys())[0]]
+
+
+def element_to_dict(element):
+    """Convert an ElementTree element like xmltodict.parse(attr_prefix='') would.
+
+    Children in SKIPPED_TAGS and namespaced attributes are left out.
+    """
+    d = {k: v for k, v in element.attrib.items() if not k.startswith('{')}
+    for child in element:
+        if child.tag in SKIPPED_TAGS:
+            continue
+        value = element_to_dict(child)
+        if child.tag not in d:
+            d[child.tag] = value
+        elif isinstance(d[child.tag], list):
+            d[child.tag].append(value)
+        else:
+            d[child.tag] = [d[child.tag], value]
+    text = element.text.strip() if element.text else ''
+    if text:
+        d['#text'] = text
+    return d or None
+
+
+def parse_network_file(filepath):
+    """Parse the parts of a .net.xml file which the frontend needs (see NETWORK_TAGS).
+
+    This streams through the file, holding only one top-level element at a time, so it
+    takes a fraction of the time and memory of parse_xml_file on large networks. The
+    result is shaped like parse_xml_file's, except that the lists in NETWORK_TAGS are
+    always lists, even with a single element.
+    """
+    root = None
+    net = {}
+    depth = 0
+    for event, element in ElementTree.iterparse(filepath, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+                net.update((k, v) for k, v in element.attrib.items() if not k.startswith('{'))
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1:  # A child of the root, which is now complete.
+            is_list = NETWORK_TAGS.get(element.tag)
+            if is_list:
+                net.setdefault(element.tag, []).append(element_to_dict(element))
+            elif is_list is not None:
+                net[element.tag] = element_to_dict(element)
+            root.clear()
+    return {root.tag: net}
@@ -1,7 +1,57 @@
 # Copyright 2018 Sidewalk Labs | http://www.eclipse.org/legal/epl-v20.html
-from nose.tools import assert_raises, eq_
+import os
+import tempfile
 
-from .xml_utils import get_only_key
+from nose.tools import assert_raises, eq_, ok_
+
+from .xml_utils import get_only_key, parse_network_file, parse_xml_file
+
+NET_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<net version="0.27" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+     xsi:noNamespaceSchemaLocation="http://sumo.dlr.de/xsd/net_file.xsd">
+    <location netOffset="0.00,0.00" convBoundary="0.00,0.00,100.00,0.00"
+              origBoundary="0.00,0.00,100.00,0.00" projParameter="!"/>
+    <edge id="e1" from="j1" to="j2" priority="1">
+        <lane id="e1_0" index="0" speed="13.89" length="100.00" shape="0.00,-1.60 100.00,-1.60"/>
+        <lane id="e1_1" index="1" speed="13.89" length="100.00" shape="0.00,1.60 100.00,1.60">
+            <param key="origId" value="123"/>
+        </lane>
+    </edge>
+    <tlLogic id="j2" type="static" programID="0" offset="0">
+        <phase duration="31" state="GG"/>
+    </tlLogic>
+    <junction id="j1" type="dead_end" x="0.00" y="0.00" incLanes="" intLanes="" shape=""/>
+    <junction id="j2" type="traffic_light" x="100.00" y="0.00" incLanes="e1_0 e1_1"
+              intLanes="" shape="">
+        <request index="0" response="00" foes="00" cont="0"/>
+    </junction>
+    <connection from="e1" to="e2" fromLane="0" toLane="0" tl="j2" linkIndex="0" dir="s"
+                state="O"/>
+    <roundabout nodes="j1 j2" edges="e1"/>
+</net>
+"""
+
+
+def test_parse_network_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'test.net.xml')
+        with open(path, 'w') as f:
+            f.write(NET_XML)
+        net = parse_network_file(path)['net']
+        expected = parse_xml_file(path)['net']
+
+    eq_('0.27', net['version'])
+    eq_(expected['location'], net['location'])
+    eq_(expected['edge']['lane'][0], net['edge'][0]['lane'][0])
+    # Parts the frontend doesn't use are left out...
+    eq_({k: v for k, v in expected['edge']['lane'][1].items() if k != 'param'},
+        net['edge'][0]['lane'][1])
+    ok_('request' not in net['junction'][1])
+    ok_('roundabout' not in net)
+    # ...and top-level elements always come as lists.
+    eq_(1, len(net['edge']))
+    eq_([expected['connection']], net['connection'])
+    eq_([expected['tlLogic']], net['tlLogic'])
 
 
 def test_get_only_key():